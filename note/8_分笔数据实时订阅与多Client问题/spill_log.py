@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+磁盘溢写日志 - Mac端
+
+ClickHouse变慢或不可用时，写不进去的批次追加到本地的内存映射日志文件，
+ClickHouse恢复后按大批次重放，消费线程不阻塞、不丢数据。
+v1.0和增强版v2.0的Mac端消费器共用本模块。
+
+文件布局:
+    spill-00000001.log ...   按顺序编号的段文件（预分配固定大小，mmap追加写入）
+    cursor.json              已重放到的位置（段编号 + 偏移），重放成功后更新
+
+记录格式: [长度 uint32][CRC32 uint32][JSON数组]，长度为0表示段内数据结束。
+进程重启后从cursor.json继续重放；段尾不完整的记录（CRC不符）被忽略。
+
+每次追加后把写入的页同步到磁盘（msync），进程或机器崩溃时已追加的批次不丢失。
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import logging
+import zlib
+
+
+class SpillLog:
+    """只追加的内存映射溢写日志"""
+
+    HEADER = struct.Struct('<II')
+    SEGMENT_PREFIX = 'spill-'
+    SEGMENT_SUFFIX = '.log'
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024):
+        """
+        初始化溢写日志
+
+        Args:
+            directory (str): 日志目录
+            segment_size (int): 单个段文件大小（字节）
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._cursor_path = os.path.join(directory, 'cursor.json')
+
+        # 段编号 -> (文件对象, mmap)
+        self._segments = {}
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX):
+                seq = int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)])
+                self._segments[seq] = self._open_segment(seq)
+
+        # 已写满的段编号 -> 段内有效数据末尾（只在启动时扫描一次，切换段时记录）
+        self._segment_ends = {}
+
+        # 读位置（已重放到的位置）
+        self._read_seq, self._read_offset = self._load_cursor()
+
+        # 写位置：最后一个段中有效数据的末尾
+        if self._segments:
+            self._write_seq = max(self._segments)
+            self._write_offset = self._scan_end(self._write_seq)
+            for seq in self._segments:
+                if seq != self._write_seq:
+                    self._segment_ends[seq] = self._scan_end(seq)
+        else:
+            self._write_seq = self._read_seq
+            self._write_offset = 0
+            self._segments[self._write_seq] = self._open_segment(self._write_seq)
+
+        self.stats = {
+            'spilled_records': 0,
+            'spilled_rows': 0,
+            'replayed_rows': 0,
+            'replay_failures': 0
+        }
+
+        if self.has_pending():
+            self.logger.info(f"发现未重放的溢写数据: {self.pending_bytes()} 字节")
+
+    def append(self, rows):
+        """
+        追加一批数据（rows为可JSON序列化的列表）
+
+        Args:
+            rows (list): 数据列表
+        """
+        if not rows:
+            return
+
+        payload = json.dumps(rows, ensure_ascii=False, default=str).encode('utf-8')
+        record_size = self.HEADER.size + len(payload)
+
+        with self._lock:
+            buffer = self._segments[self._write_seq][1]
+            # 段尾保留一个空头部作为结束标记
+            if self._write_offset + record_size + self.HEADER.size > len(buffer):
+                self._roll_segment(record_size + self.HEADER.size)
+                buffer = self._segments[self._write_seq][1]
+
+            offset = self._write_offset
+            buffer[offset:offset + self.HEADER.size] = self.HEADER.pack(len(payload), zlib.crc32(payload))
+            buffer[offset + self.HEADER.size:offset + record_size] = payload
+            self._write_offset += record_size
+
+            # 同步本条记录所在的页（起点需按页对齐）
+            start = offset - offset % mmap.PAGESIZE
+            buffer.flush(start, self._write_offset - start)
+
+            self.stats['spilled_records'] += 1
+            self.stats['spilled_rows'] += len(rows)
+
+    def has_pending(self):
+        """是否有未重放的数据"""
+        with self._lock:
+            return (self._read_seq, self._read_offset) != (self._write_seq, self._write_offset)
+
+    def pending_bytes(self):
+        """未重放的数据量（字节，近似值）"""
+        with self._lock:
+            if self._read_seq == self._write_seq:
+                return self._write_offset - self._read_offset
+            total = sum(end for seq, end in self._segment_ends.items() if seq >= self._read_seq)
+            if self._read_seq in self._segment_ends:
+                total -= self._read_offset
+            return total + self._write_offset
+
+    def replay(self, insert_func, max_rows=50000):
+        """
+        按大批次重放溢写数据
+
+        每次读取若干条记录合并成一批（不超过max_rows行，单条记录不拆分）交给insert_func，
+        成功后才推进读位置；insert_func抛出异常时停止重放，数据保留在日志中。
+
+        Args:
+            insert_func (callable): 写入函数，参数为数据列表，失败时抛出异常
+            max_rows (int): 每批最多行数
+
+        Returns:
+            int: 本次重放的行数
+        """
+        replayed = 0
+        while True:
+            with self._lock:
+                rows, position = self._read_batch(max_rows)
+                if not rows:
+                    # 只跨过了已读完的段，也要推进读位置以删除这些段
+                    if position != (self._read_seq, self._read_offset):
+                        self._commit(position)
+                    return replayed
+
+            try:
+                insert_func(rows)
+            except Exception:
+                self.stats['replay_failures'] += 1
+                raise
+
+            with self._lock:
+                self._commit(position)
+                self.stats['replayed_rows'] += len(rows)
+            replayed += len(rows)
+
+    def get_stats(self):
+        """溢写统计"""
+        stats = dict(self.stats)
+        stats['pending_bytes'] = self.pending_bytes()
+        stats['segments'] = len(self._segments)
+        return stats
+
+    def close(self):
+        """写回并关闭全部段文件"""
+        with self._lock:
+            for handle, buffer in self._segments.values():
+                buffer.flush()
+                buffer.close()
+                handle.close()
+            self._segments = {}
+            self._segment_ends = {}
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{seq:08d}{self.SEGMENT_SUFFIX}")
+
+    def _open_segment(self, seq, size=None):
+        """打开（不存在时创建并预分配）段文件并映射到内存"""
+        path = self._segment_path(seq)
+        if not os.path.exists(path):
+            with open(path, 'wb') as handle:
+                handle.truncate(max(size or 0, self.segment_size))
+        handle = open(path, 'r+b')
+        return handle, mmap.mmap(handle.fileno(), 0)
+
+    def _roll_segment(self, min_size):
+        """当前段已满，切换到新段（调用方需持有锁）"""
+        self._segments[self._write_seq][1].flush()
+        self._segment_ends[self._write_seq] = self._write_offset
+        self._write_seq += 1
+        self._write_offset = 0
+        self._segments[self._write_seq] = self._open_segment(self._write_seq, min_size)
+
+    def _scan_end(self, seq):
+        """扫描段内有效记录的末尾位置（仅在初始化中调用）"""
+        buffer = self._segments[seq][1]
+        offset = 0
+        while offset + self.HEADER.size <= len(buffer):
+            length, checksum = self.HEADER.unpack_from(buffer, offset)
+            end = offset + self.HEADER.size + length
+            if length == 0 or end > len(buffer) or zlib.crc32(buffer[offset + self.HEADER.size:end]) != checksum:
+                break
+            offset = end
+        return offset
+
+    def _read_batch(self, max_rows):
+        """从读位置起读取一批记录，返回 (数据, 读完后的位置)（调用方需持有锁）"""
+        rows = []
+        seq, offset = self._read_seq, self._read_offset
+
+        while len(rows) < max_rows:
+            if seq == self._write_seq:
+                limit = self._write_offset
+            elif seq in self._segments:
+                limit = self._segment_ends[seq]
+            else:
+                break
+
+            buffer = self._segments[seq][1]
+            record = None
+            if offset + self.HEADER.size <= limit:
+                length, checksum = self.HEADER.unpack_from(buffer, offset)
+                end = offset + self.HEADER.size + length
+                if length and end <= limit:
+                    payload = buffer[offset + self.HEADER.size:end]
+                    if zlib.crc32(payload) == checksum:
+                        record = (json.loads(payload.decode('utf-8')), end)
+                    else:
+                        self.logger.warning(f"溢写日志段 {seq} 偏移 {offset} 校验失败，跳过该段剩余数据")
+
+            if record is None:
+                # 当前段已读完：活动段则停止，否则进入下一段
+                if seq == self._write_seq:
+                    break
+                seq, offset = self._next_segment(seq), 0
+                continue
+
+            if rows and len(rows) + len(record[0]) > max_rows:
+                break
+            rows.extend(record[0])
+            offset = record[1]
+
+        return rows, (seq, offset)
+
+    def _next_segment(self, seq):
+        """下一个段编号（调用方需持有锁）"""
+        later = [candidate for candidate in self._segments if candidate > seq]
+        return min(later) if later else self._write_seq
+
+    def _commit(self, position):
+        """推进读位置并删除已重放完的段（调用方需持有锁）"""
+        self._read_seq, self._read_offset = position
+        self._save_cursor()
+
+        for seq in [seq for seq in self._segments if seq < self._read_seq]:
+            handle, buffer = self._segments.pop(seq)
+            self._segment_ends.pop(seq, None)
+            buffer.close()
+            handle.close()
+            os.remove(self._segment_path(seq))
+
+    def _load_cursor(self):
+        """读取重放位置，不存在或已失效时从最早的段开始"""
+        first_seq = min(self._segments) if self._segments else 1
+        try:
+            with open(self._cursor_path, 'r', encoding='utf-8') as f:
+                cursor = json.load(f)
+            if cursor['segment'] in self._segments:
+                return cursor['segment'], cursor['offset']
+        except (OSError, ValueError, KeyError):
+            pass
+        return first_seq, 0
+
+    def _save_cursor(self):
+        """原子写入重放位置"""
+        temp_path = self._cursor_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'segment': self._read_seq, 'offset': self._read_offset}, f)
+        os.replace(temp_path, self._cursor_path)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+溢写日志测试脚本
+测试追加、重放、段切换和进程重启后继续重放（不需要Redis/ClickHouse服务）
+"""
+import shutil
+import tempfile
+
+from spill_log import SpillLog
+
+
+# 小段文件，几十条记录即触发段切换
+SEGMENT_SIZE = 4096
+
+
+def make_rows(start, count):
+    return [{'symbol': '000001.SZ', 'seq': i, 'pad': 'x' * 100} for i in range(start, start + count)]
+
+
+def test_append_and_replay():
+    """测试追加后按批次重放，重放完成后没有待重放数据"""
+    print("测试追加和重放...")
+    directory = tempfile.mkdtemp()
+    try:
+        log = SpillLog(directory, segment_size=SEGMENT_SIZE)
+        log.append(make_rows(0, 3))
+        log.append(make_rows(3, 2))
+        log.append([])
+        pending = log.has_pending()
+
+        batches = []
+        replayed = log.replay(batches.append, max_rows=3)
+        log.close()
+
+        # 单条记录不拆分：3行一批，剩余2行一批
+        if (pending and replayed == 5 and [len(batch) for batch in batches] == [3, 2]
+                and [row['seq'] for batch in batches for row in batch] == list(range(5))
+                and not log.has_pending()):
+            print("✓ 追加和重放测试成功")
+            return True
+        else:
+            print(f"✗ 追加和重放测试失败: {[len(batch) for batch in batches]}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 追加和重放测试失败: {e}")
+        return False
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_segment_roll():
+    """测试段写满后切换新段，待重放字节数与写入量一致，重放完的段被删除"""
+    print("测试段切换...")
+    directory = tempfile.mkdtemp()
+    try:
+        log = SpillLog(directory, segment_size=SEGMENT_SIZE)
+        record_bytes = []
+        for i in range(60):
+            before = log.pending_bytes()
+            log.append(make_rows(i, 1))
+            record_bytes.append(log.pending_bytes() - before)
+        segments = log.get_stats()['segments']
+
+        rows = []
+        log.replay(rows.extend, max_rows=1000)
+        stats = log.get_stats()
+        log.close()
+
+        if (segments > 1 and all(size > 0 for size in record_bytes)
+                and [row['seq'] for row in rows] == list(range(60))
+                and stats['pending_bytes'] == 0 and stats['segments'] == 1):
+            print("✓ 段切换测试成功")
+            return True
+        else:
+            print(f"✗ 段切换测试失败: 段数={segments}, 统计={stats}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 段切换测试失败: {e}")
+        return False
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_replay_failure_and_restart():
+    """测试重放失败时读位置不前进，重启后从上次提交的位置继续重放"""
+    print("测试重放失败和重启...")
+    directory = tempfile.mkdtemp()
+    try:
+        log = SpillLog(directory, segment_size=SEGMENT_SIZE)
+        for i in range(0, 60, 2):
+            log.append(make_rows(i, 2))
+
+        inserted = []
+
+        def failing_insert(rows):
+            if len(inserted) >= 20:
+                raise RuntimeError("ClickHouse不可用")
+            inserted.extend(rows)
+
+        try:
+            log.replay(failing_insert, max_rows=10)
+            failed = False
+        except RuntimeError:
+            failed = True
+        pending_before = log.pending_bytes()
+        log.close()
+
+        # 重启后待重放字节数不变，剩余数据按顺序重放
+        log = SpillLog(directory, segment_size=SEGMENT_SIZE)
+        pending_after = log.pending_bytes()
+        rest = []
+        log.replay(rest.extend, max_rows=10)
+        log.close()
+
+        if (failed and pending_before == pending_after > 0
+                and [row['seq'] for row in inserted + rest] == list(range(60))):
+            print("✓ 重放失败和重启测试成功")
+            return True
+        else:
+            print(f"✗ 重放失败和重启测试失败: 重启前{pending_before}字节, 重启后{pending_after}字节")
+            return False
+
+    except Exception as e:
+        print(f"✗ 重放失败和重启测试失败: {e}")
+        return False
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("=" * 50)
+    print("开始溢写日志测试")
+    print("=" * 50)
+
+    tests = [
+        ("追加和重放", test_append_and_replay),
+        ("段切换", test_segment_roll),
+        ("重放失败和重启", test_replay_failure_and_restart),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        print(f"\n{test_name}测试:")
+        results.append((test_name, test_func()))
+
+    print("\n" + "=" * 50)
+    passed = sum(1 for _, result in results if result)
+    for test_name, result in results:
+        print(f"{test_name}: {'✓ 通过' if result else '✗ 失败'}")
+    print(f"\n总计: {passed}/{len(tests)} 个测试通过")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -7,7 +7,10 @@ Mac端数据消费器
 """
 
 import json
+import os
+import sys
 import time
+import threading
 import redis
 from clickhouse_driver import Client
 from concurrent.futures import ThreadPoolExecutor
@@ -15,6 +18,10 @@ from datetime import datetime
 import logging
 import traceback
 
+# 溢写日志模块与增强版v2.0共用，位于上两级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from spill_log import SpillLog
+
 
 class MacDataConsumer:
     """Mac端数据消费器"""
@@ -50,9 +57,16 @@ class MacDataConsumer:
         )
         
         self.batch_size = config.get('system', {}).get('batch_size', 1000)
-        self.max_retry_times = config.get('system', {}).get('max_retry_times', 3)
         self.logger = logging.getLogger(__name__)
         self.is_running = False
+        self._stop_event = threading.Event()
+
+        # 磁盘溢写：写入失败的批次落盘，ClickHouse恢复后批量重放
+        self.spill_config = config.get('spill', {})
+        self.spill_log = SpillLog(
+            self.spill_config.get('directory', 'spill'),
+            segment_size=int(self.spill_config.get('segment_size_mb', 64)) * 1024 * 1024
+        )
         
         # 统计信息
         self.stats = {
@@ -86,6 +100,7 @@ class MacDataConsumer:
             num_workers (int): 工作线程数量
         """
         self.is_running = True
+        self._stop_event.clear()
         self.logger.info("启动Mac端数据消费服务...")
         
         # 测试连接
@@ -96,16 +111,29 @@ class MacDataConsumer:
         # 启动统计信息打印线程
         stats_thread = threading.Thread(target=self.print_stats, daemon=True)
         stats_thread.start()
+
+        # 启动溢写重放线程
+        replay_thread = threading.Thread(target=self.replay_spill_worker, daemon=True)
+        replay_thread.start()
         
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = []
-            for i in range(num_workers):
-                future = executor.submit(self.consume_worker, f"worker-{i}")
-                futures.append(future)
-                
+        executor = ThreadPoolExecutor(max_workers=num_workers)
+        futures = []
+        for i in range(num_workers):
+            future = executor.submit(self.consume_worker, f"worker-{i}")
+            futures.append(future)
+
+        try:
             # 等待所有工作线程完成
             for future in futures:
                 future.result()
+        finally:
+            # 主线程被中断时也先让消费线程写完剩余批次、重放线程退出，再关闭溢写日志
+            self.stop_consuming()
+            executor.shutdown(wait=True)
+            replay_thread.join()
+
+            # 未重放的溢写数据保留在磁盘上，下次启动后重放
+            self.spill_log.close()
                 
     def consume_worker(self, worker_name):
         """
@@ -154,76 +182,108 @@ class MacDataConsumer:
             
     def batch_insert_clickhouse(self, batch_data):
         """
-        批量插入ClickHouse
+        批量插入ClickHouse，失败时写入溢写日志
         
         Args:
             batch_data (list): 批量数据列表
         """
         if not batch_data:
             return
+
+        # 溢写日志中还有未重放的数据，说明ClickHouse尚未恢复，直接落盘
+        if self.spill_log.has_pending():
+            self.spill_log.append(batch_data)
+            return
+
+        try:
+            self.insert_minute_bars(batch_data)
+            self.logger.info(f"成功插入{len(batch_data)}条分钟线数据")
+
+        except Exception as e:
+            self.stats['insert_errors'] += 1
+            self.spill_log.append(batch_data)
+            self.logger.error(f"批量插入ClickHouse失败，{len(batch_data)}条数据写入溢写日志: {e}")
+
+    def insert_minute_bars(self, batch_data):
+        """
+        插入一批分钟线，失败时抛出异常
+        
+        Args:
+            batch_data (list): 批量数据列表
+        """
+        query = """
+        INSERT INTO minute_bars 
+        (symbol, frame, open, high, low, close, vol, amount, created_at)
+        VALUES
+        """
+        
+        values = []
+        for bar in batch_data:
+            # 处理时间字段
+            frame_time = bar['frame']
+            if isinstance(frame_time, str):
+                try:
+                    frame_time = datetime.fromisoformat(frame_time.replace('Z', '+00:00'))
+                except:
+                    frame_time = datetime.now()
             
-        retry_count = 0
+            values.append((
+                bar['symbol'],
+                frame_time,
+                float(bar['open']),
+                float(bar['high']),
+                float(bar['low']),
+                float(bar['close']),
+                float(bar['vol']),
+                float(bar['amount']),
+                datetime.now()
+            ))
+        
+        self.clickhouse_client.execute(query, values)
+
+        # 股票代码注册表：已入库的股票集合（尽力而为，Redis失败不能让已写入的批次被溢写后重复插入）
+        try:
+            self.redis_client.sadd("symbols:all", *{bar['symbol'] for bar in batch_data})
+        except Exception as e:
+            self.logger.warning(f"更新股票代码注册表失败: {e}")
         
-        while retry_count < self.max_retry_times:
+        # 更新统计信息
+        self.stats['total_inserted'] += len(batch_data)
+        self.stats['last_insert_time'] = datetime.now()
+
+    def replay_spill_worker(self):
+        """溢写重放线程：ClickHouse恢复后按大批次写回溢写日志中的数据，失败时指数退避"""
+        replay_interval = self.spill_config.get('replay_interval', 5)
+        max_backoff = self.spill_config.get('max_backoff', 60)
+        replay_batch_rows = self.spill_config.get('replay_batch_rows', 50000)
+        backoff = replay_interval
+
+        while self.is_running:
             try:
-                query = """
-                INSERT INTO minute_bars 
-                (symbol, frame, open, high, low, close, vol, amount, created_at)
-                VALUES
-                """
-                
-                values = []
-                for bar in batch_data:
-                    # 处理时间字段
-                    frame_time = bar['frame']
-                    if isinstance(frame_time, str):
-                        try:
-                            frame_time = datetime.fromisoformat(frame_time.replace('Z', '+00:00'))
-                        except:
-                            frame_time = datetime.now()
-                    
-                    values.append((
-                        bar['symbol'],
-                        frame_time,
-                        float(bar['open']),
-                        float(bar['high']),
-                        float(bar['low']),
-                        float(bar['close']),
-                        float(bar['vol']),
-                        float(bar['amount']),
-                        datetime.now()
-                    ))
-                
-                self.clickhouse_client.execute(query, values)
-                
-                # 更新统计信息
-                self.stats['total_inserted'] += len(batch_data)
-                self.stats['last_insert_time'] = datetime.now()
-                
-                self.logger.info(f"成功插入{len(batch_data)}条分钟线数据")
-                break
-                
+                if self.spill_log.has_pending():
+                    replayed = self.spill_log.replay(self.insert_minute_bars, max_rows=replay_batch_rows)
+                    if replayed:
+                        self.logger.info(f"溢写日志重放{replayed}条分钟线数据")
+                backoff = replay_interval
+
             except Exception as e:
-                retry_count += 1
-                self.stats['insert_errors'] += 1
-                self.logger.error(f"批量插入ClickHouse失败 (重试 {retry_count}/{self.max_retry_times}): {e}")
-                
-                if retry_count < self.max_retry_times:
-                    time.sleep(1)  # 等待1秒后重试
-                else:
-                    self.logger.error(f"批量插入最终失败，丢弃{len(batch_data)}条数据")
-                    
+                self.logger.warning(f"溢写日志重放失败，{backoff}秒后重试: {e}")
+                backoff = min(backoff * 2, max_backoff)
+
+            self._stop_event.wait(backoff)
+
     def print_stats(self):
         """打印统计信息"""
-        import threading
-        
         while self.is_running:
             try:
                 time.sleep(60)  # 每分钟打印一次
+                spill_stats = self.spill_log.get_stats()
                 self.logger.info(
                     f"统计信息 - 消费: {self.stats['total_consumed']}, "
                     f"插入: {self.stats['total_inserted']}, "
                     f"错误: {self.stats['insert_errors']}, "
+                    f"溢写: {spill_stats['spilled_rows']}, "
+                    f"重放: {spill_stats['replayed_rows']}, "
                     f"最后插入: {self.stats['last_insert_time']}"
                 )
             except Exception as e:
@@ -232,4 +292,5 @@ class MacDataConsumer:
     def stop_consuming(self):
         """停止消费"""
         self.is_running = False
+        self._stop_event.set()
         self.logger.info("停止数据消费")
@@ -178,7 +178,10 @@ def run_all(config):
         web_interface.run()
     except KeyboardInterrupt:
         logger.info("用户中断，停止所有服务")
+    finally:
+        # 等消费线程写完剩余批次并关闭溢写日志后再退出
         consumer.stop_consuming()
+        consumer_thread.join()
 
 
 def main():
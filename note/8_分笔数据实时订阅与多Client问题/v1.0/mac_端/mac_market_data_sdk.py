@@ -11,8 +11,10 @@ import redis
 from clickhouse_driver import Client
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
+import bisect
 import json
 import logging
+import time
 
 
 class MacMarketDataSDK:
@@ -47,6 +49,11 @@ class MacMarketDataSDK:
 
         self.logger = logging.getLogger(__name__)
 
+        # 股票代码注册表缓存（有序列表，用于列表和前缀搜索）
+        self.symbol_cache_ttl = config.get('sdk', {}).get('symbol_cache_ttl', 60)
+        self._symbol_cache = []
+        self._symbol_cache_time = 0.0
+
     def get_minute_bars(self, symbol: str, start_time: str, end_time: str,
                        period: str = '1min') -> pd.DataFrame:
         """
@@ -231,6 +238,36 @@ class MacMarketDataSDK:
             self.logger.error(f"获取最新价格失败: {e}")
             return None
 
+    def get_market_snapshot(self, symbols: List[str] = None, date: Optional[str] = None) -> pd.DataFrame:
+        """
+        获取全市场（或指定股票）最新一根分钟线
+
+        Windows端发布时维护 latest_bar:{date} 哈希（symbol -> 最新K线），
+        全市场一次HGETALL、指定股票一次HMGET即可取回。
+
+        Args:
+            symbols: 股票代码列表，如果为None则返回所有有数据的股票
+            date: 日期 (YYYY-MM-DD)，默认为今天
+
+        Returns:
+            pandas.DataFrame: 每只股票一行，按symbol排序
+        """
+        if date is None:
+            date = datetime.now().strftime('%Y-%m-%d')
+        key = f"latest_bar:{date}"
+
+        if symbols is None:
+            values = list(self.redis_client.hgetall(key).values())
+        else:
+            values = [value for value in self.redis_client.hmget(key, symbols) if value]
+
+        if not values:
+            return pd.DataFrame()
+
+        # 拼成一个JSON数组一次解析
+        df = pd.DataFrame(json.loads('[' + ','.join(values) + ']'))
+        return df.sort_values('symbol').reset_index(drop=True)
+
     def get_market_overview(self, symbols: List[str] = None) -> Dict[str, Dict[str, Any]]:
         """
         获取市场概览
@@ -244,22 +281,17 @@ class MacMarketDataSDK:
         try:
             result = {}
 
-            if symbols is None:
-                # 如果没有指定股票列表，从Redis获取所有有数据的股票
-                symbols = self.get_available_symbols()
-                # 限制返回数量，避免过多
-                if len(symbols) > 20:
-                    symbols = symbols[:20]
-
-            for symbol in symbols:
-                latest_price = self.get_latest_price(symbol)
-                if latest_price:
-                    result[symbol] = {
-                        'latest_price': latest_price['close'],
-                        'timestamp': latest_price['frame'],
-                        'volume': latest_price['vol'],
-                        'amount': latest_price['amount']
+            snapshot = self.get_market_snapshot(symbols)
+            if not snapshot.empty:
+                result = {
+                    row['symbol']: {
+                        'latest_price': row['close'],
+                        'timestamp': row['frame'],
+                        'volume': row['vol'],
+                        'amount': row['amount']
                     }
+                    for row in snapshot[['symbol', 'close', 'frame', 'vol', 'amount']].to_dict('records')
+                }
 
             self.logger.info(f"获取市场概览: {len(result)}只股票")
             return result
@@ -272,29 +304,30 @@ class MacMarketDataSDK:
         """
         获取所有有数据的股票代码
 
+        读取Windows端维护的当日集合 symbols:{date} 和Mac端维护的已入库集合 symbols:all，
+        不扫描Redis键空间；结果缓存 symbol_cache_ttl 秒。
+
         Returns:
             List[str]: 股票代码列表
         """
         try:
+            if time.monotonic() - self._symbol_cache_time < self.symbol_cache_ttl:
+                return self._symbol_cache
+
             date = datetime.now().strftime('%Y-%m-%d')
+            symbols = self.redis_client.sunion(f"symbols:{date}", "symbols:all")
 
-            # 从Redis获取所有当日有数据的股票代码
-            pattern = f"minute_bar:*:{date}"
-            keys = self.redis_client.keys(pattern)
+            if not symbols:
+                # 注册表为空（如首次部署）时从ClickHouse获取一次
+                symbols = [row[0] for row in self.clickhouse_client.execute(
+                    "SELECT DISTINCT symbol FROM minute_bars"
+                )]
 
-            symbols = []
-            for key in keys:
-                # 解析key格式: minute_bar:symbol:date
-                parts = key.split(':')
-                if len(parts) == 3:
-                    symbol = parts[1]
-                    symbols.append(symbol)
+            self._symbol_cache = sorted(symbols)
+            self._symbol_cache_time = time.monotonic()
 
-            # 去重并排序
-            symbols = sorted(list(set(symbols)))
-
-            self.logger.info(f"发现{len(symbols)}只有数据的股票")
-            return symbols
+            self.logger.info(f"发现{len(self._symbol_cache)}只有数据的股票")
+            return self._symbol_cache
 
         except Exception as e:
             self.logger.error(f"获取可用股票代码失败: {e}")
@@ -311,21 +344,22 @@ class MacMarketDataSDK:
             List[str]: 匹配的股票代码列表
         """
         try:
-            # 从ClickHouse查询匹配的股票代码
-            query = """
-            SELECT DISTINCT symbol
-            FROM minute_bars
-            WHERE symbol LIKE %(keyword)s
-            ORDER BY symbol
-            LIMIT 100
-            """
+            keyword = keyword.upper()
+            all_symbols = self.get_available_symbols()
 
-            result = self.clickhouse_client.execute(
-                query,
-                {'keyword': f'%{keyword.upper()}%'}
-            )
-
-            symbols = [row[0] for row in result]
+            # 前缀匹配：在有序列表中二分查找
+            start = bisect.bisect_left(all_symbols, keyword)
+            symbols = []
+            for symbol in all_symbols[start:]:
+                if not symbol.startswith(keyword) or len(symbols) >= 100:
+                    break
+                symbols.append(symbol)
+
+            # 前缀匹配不足时补充包含关键词的股票
+            if len(symbols) < 100:
+                matched = set(symbols)
+                symbols += [symbol for symbol in all_symbols
+                            if keyword in symbol and symbol not in matched][:100 - len(symbols)]
             self.logger.info(f"搜索关键词'{keyword}'找到{len(symbols)}只股票")
             return symbols
 
@@ -10,6 +10,7 @@ from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
 import json
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 import logging
 from mac_market_data_sdk import MacMarketDataSDK
@@ -57,6 +58,12 @@ class WebInterface:
                 start_date = data.get('start_date')
                 end_date = data.get('end_date')
                 period = data.get('period', '1min')
+                # 图表最多显示的K线数量，超出时按区间合并（保留区间内的开高低收），必须为正整数
+                max_points = data.get('max_points')
+                if max_points is not None:
+                    max_points = int(max_points)
+                    if max_points < 1:
+                        raise ValueError(f"max_points必须为正整数: {max_points}")
 
                 self.logger.info(f"查询请求: {symbol}, {start_date} - {end_date}, {period}")
 
@@ -69,7 +76,7 @@ class WebInterface:
                     df = self.sdk.get_minute_bars(symbol, start_time, end_time, period)
 
                 # 转换为前端需要的格式
-                result = self.format_chart_data(df)
+                result = self.format_chart_data(df, max_points)
 
                 return jsonify({
                     'success': True,
@@ -124,7 +131,7 @@ class WebInterface:
         def market_overview():
             """市场概览API"""
             try:
-                # 获取所有有数据的股票概览（限制数量）
+                # 获取所有有数据的股票概览
                 overview = self.sdk.get_market_overview()
 
                 return jsonify({
@@ -234,12 +241,14 @@ class WebInterface:
                     'error': str(e)
                 })
 
-    def format_chart_data(self, df):
+    def format_chart_data(self, df, max_points=None):
         """
         格式化图表数据
 
         Args:
             df (pd.DataFrame): 数据DataFrame
+            max_points (int): 最多返回的K线数量，超出时把相邻K线按区间合并
+                （区间第一根的开盘价、最后一根的收盘价、最高价、最低价，成交量求和）
 
         Returns:
             dict: 格式化后的图表数据
@@ -247,29 +256,31 @@ class WebInterface:
         if df.empty:
             return {'kline': [], 'volume': [], 'dates': []}
 
-        # K线数据格式: [open, close, low, high]
-        kline_data = []
-        volume_data = []
-        dates = []
-
-        for index, row in df.iterrows():
-            # 处理时间格式
-            if isinstance(index, str):
-                dates.append(index)
-            else:
-                dates.append(index.strftime('%Y-%m-%d %H:%M:%S'))
-
-            kline_data.append([
-                float(row['open']),
-                float(row['close']),
-                float(row['low']),
-                float(row['high'])
-            ])
-            volume_data.append(float(row['vol']))
+        open_ = df['open'].to_numpy(dtype=float)
+        close = df['close'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        high = df['high'].to_numpy(dtype=float)
+        vol = df['vol'].to_numpy(dtype=float)
+        index = df.index
+
+        if max_points and len(df) > max_points:
+            first = np.linspace(0, len(df), max_points, endpoint=False).astype(np.int64)
+            last = np.append(first[1:], len(df)) - 1
+            open_, close = open_[first], close[last]
+            low, high = np.minimum.reduceat(low, first), np.maximum.reduceat(high, first)
+            vol = np.add.reduceat(vol, first)
+            index = index[first]
+
+        # 处理时间格式
+        if isinstance(index, pd.DatetimeIndex):
+            dates = index.strftime('%Y-%m-%d %H:%M:%S').tolist()
+        else:
+            dates = [str(value) for value in index]
 
+        # K线数据格式: [open, close, low, high]
         return {
-            'kline': kline_data,
-            'volume': volume_data,
+            'kline': np.column_stack([open_, close, low, high]).tolist(),
+            'volume': vol.tolist(),
             'dates': dates
         }
 
@@ -506,14 +506,28 @@ class QMTMinuteSubscriber:
                 key = f"minute_bar:{minute_bar['symbol']}:{date_str}"
                 value = json.dumps(minute_bar, ensure_ascii=False, default=str)
 
+                # 一次往返完成全部写入
+                pipe = self.redis_client.pipeline(transaction=False)
+
                 # 推送到当日数据队列
-                self.redis_client.lpush(key, value)
+                pipe.lpush(key, value)
 
                 # 设置过期时间（7天）
-                self.redis_client.expire(key, 86400 * 7)
+                pipe.expire(key, 86400 * 7)
+
+                # 更新当日最新K线（每只股票一个字段，市场快照一次HGETALL即可取回）
+                latest_key = f"latest_bar:{date_str}"
+                pipe.hset(latest_key, minute_bar['symbol'], value)
+                pipe.expire(latest_key, 86400 * 7)
+
+                # 股票代码注册表：当日有数据的股票集合
+                symbols_key = f"symbols:{date_str}"
+                pipe.sadd(symbols_key, minute_bar['symbol'])
+                pipe.expire(symbols_key, 86400 * 7)
 
                 # 同时推送到消费队列
-                self.redis_client.lpush("minute_bar_queue", value)
+                pipe.lpush("minute_bar_queue", value)
+                pipe.execute()
 
                 # 更新统计信息
                 self.stats['total_published'] += 1
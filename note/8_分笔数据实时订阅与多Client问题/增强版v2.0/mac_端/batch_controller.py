@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+自适应批量控制器 - Mac端
+
+根据实测的插入延迟、积压数据量和目标端到端延迟，动态调整批量大小和批量超时：
+
+    端到端延迟 ≈ 组批等待(batch_timeout) + 排队等待(积压 / 写入速度) + 插入耗时
+
+- 盘中数据量小：积压为零，批量超时取 目标延迟 - 插入耗时，批量大小为这段时间内到达的数据量（小批次、低延迟）
+- 夜间回补积压大：目标延迟已无法满足，批量大小按积压量放大到上限，优先吞吐量
+- 每次调整取当前值与目标值的平均，避免抖动
+"""
+
+import threading
+import time
+
+
+class AdaptiveBatchController:
+    """自适应批量大小/超时控制器"""
+
+    def __init__(self, batch_size, batch_timeout, target_latency=2.0,
+                 min_batch_size=100, max_batch_size=50000,
+                 min_batch_timeout=0.2, max_batch_timeout=5.0,
+                 insert_workers=1, batch_builders=1):
+        """
+        初始化控制器
+
+        Args:
+            batch_size (int): 初始批量大小
+            batch_timeout (float): 初始批量超时(秒)
+            target_latency (float): 目标端到端延迟(秒)
+            min_batch_size (int): 批量大小下限
+            max_batch_size (int): 批量大小上限
+            min_batch_timeout (float): 批量超时下限(秒)
+            max_batch_timeout (float): 批量超时上限(秒)
+            insert_workers (int): 并发插入线程数（用于估算写入速度）
+            batch_builders (int): 同时组批的线程数（到达的数据平均分到各组批线程）
+        """
+        self.target_latency = target_latency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_batch_timeout = min_batch_timeout
+        self.max_batch_timeout = max_batch_timeout
+        self.insert_workers = max(insert_workers, 1)
+        self.batch_builders = max(batch_builders, 1)
+
+        self.batch_size = int(self._clamp(batch_size, min_batch_size, max_batch_size))
+        self.batch_timeout = self._clamp(batch_timeout, min_batch_timeout, max_batch_timeout)
+
+        # 观测值（平滑后）
+        self.insert_latency = 0.0    # 单次插入耗时(秒)
+        self.insert_rate = 0.0       # 单个插入线程的写入速度(条/秒)
+        self.arrival_rate = 0.0      # 数据到达速度(条/秒)
+        self.backlog = 0             # 积压数据量(条)
+
+        self._last_consumed = None
+        self._last_update = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_insert(self, rows, seconds):
+        """
+        记录一次插入的行数和耗时
+
+        Args:
+            rows (int): 插入行数
+            seconds (float): 插入耗时(秒)
+        """
+        if rows <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self.insert_latency = self._smooth(self.insert_latency, seconds)
+            self.insert_rate = self._smooth(self.insert_rate, rows / seconds)
+
+    def update(self, backlog, consumed_total):
+        """
+        根据最新观测值调整批量参数（由监控线程定期调用）
+
+        Args:
+            backlog (int): 当前积压数据量（Redis队列 + 本地队列）
+            consumed_total (int): 累计消费条数（用于计算到达速度）
+
+        Returns:
+            tuple: (批量大小, 批量超时)
+        """
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._last_update
+            if self._last_consumed is not None and elapsed > 0:
+                arrived = max(consumed_total - self._last_consumed, 0)
+                self.arrival_rate = self._smooth(self.arrival_rate, arrived / elapsed)
+            self._last_consumed = consumed_total
+            self._last_update = now
+            self.backlog = backlog
+
+            # 积压数据按当前写入速度需要的排队时间
+            drain_rate = self.insert_rate * self.insert_workers
+            queue_delay = backlog / drain_rate if drain_rate else 0.0
+
+            # 留给组批等待的时间
+            timeout_target = self._clamp(
+                self.target_latency - self.insert_latency - queue_delay,
+                self.min_batch_timeout, self.max_batch_timeout
+            )
+
+            # 组批等待时间内每个组批线程收到的数据量；有积压时按积压量放大批次，优先吞吐量
+            size_target = self.arrival_rate * timeout_target / self.batch_builders
+            if backlog > size_target * self.batch_builders:
+                size_target = max(size_target, backlog / self.batch_builders)
+
+            self.batch_timeout = (self.batch_timeout + timeout_target) / 2
+            self.batch_size = int(self._clamp((self.batch_size + size_target) / 2,
+                                              self.min_batch_size, self.max_batch_size))
+            return self.batch_size, self.batch_timeout
+
+    def get_stats(self):
+        """当前批量参数和观测值"""
+        with self._lock:
+            return {
+                'batch_size': self.batch_size,
+                'batch_timeout': self.batch_timeout,
+                'target_latency': self.target_latency,
+                'insert_latency': self.insert_latency,
+                'insert_rate': self.insert_rate,
+                'arrival_rate': self.arrival_rate,
+                'backlog': self.backlog
+            }
+
+    @staticmethod
+    def _smooth(current, observed):
+        """首次观测直接采用，之后取平均"""
+        return observed if not current else (current + observed) / 2
+
+    @staticmethod
+    def _clamp(value, low, high):
+        return min(max(value, low), high)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分钟线解码工作进程 - Mac端
+
+多进程模式下在子进程中执行JSON解析、质量评分和格式转换（不受主进程GIL限制），
+结果按列打包写入共享内存，主进程只拿到一个很小的描述信息，按列读出后写入ClickHouse。
+
+本模块只依赖标准库和numpy，子进程（macOS默认spawn方式）导入时不加载Redis/ClickHouse客户端。
+"""
+
+import json
+import signal
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+# 数值列及其类型（symbol列按批内最长代码确定宽度）
+NUMERIC_COLUMNS = [
+    ('frame', 'datetime64[s]'),
+    ('open', 'float64'),
+    ('high', 'float64'),
+    ('low', 'float64'),
+    ('close', 'float64'),
+    ('vol', 'float64'),
+    ('amount', 'float64'),
+    ('timestamp', 'float64'),
+    ('quality_score', 'float32')
+]
+
+# 质量分数低于该值的数据不入库
+MIN_QUALITY_SCORE = 0.5
+
+FRAME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y%m%d%H%M%S'
+]
+
+
+def calculate_quality_score(minute_bar):
+    """计算数据质量分数"""
+    try:
+        score = 1.0
+
+        # 检查必要字段
+        required_fields = ['symbol', 'open', 'high', 'low', 'close', 'vol']
+        for field in required_fields:
+            if field not in minute_bar or minute_bar[field] is None:
+                score -= 0.2
+
+        # 检查价格逻辑
+        try:
+            open_price = float(minute_bar.get('open', 0))
+            high_price = float(minute_bar.get('high', 0))
+            low_price = float(minute_bar.get('low', 0))
+            close_price = float(minute_bar.get('close', 0))
+
+            if high_price < low_price:
+                score -= 0.3
+
+            if not (low_price <= open_price <= high_price):
+                score -= 0.2
+
+            if not (low_price <= close_price <= high_price):
+                score -= 0.2
+
+        except (ValueError, TypeError):
+            score -= 0.3
+
+        # 检查成交量
+        try:
+            volume = float(minute_bar.get('vol', 0))
+            if volume < 0:
+                score -= 0.1
+        except (ValueError, TypeError):
+            score -= 0.1
+
+        return max(0.0, min(1.0, score))
+
+    except Exception:
+        return 0.5  # 默认中等质量
+
+
+def parse_frame(frame_str):
+    """解析时间字符串，无法解析时返回当前时间"""
+    if isinstance(frame_str, str):
+        # 尝试多种时间格式
+        for fmt in FRAME_FORMATS:
+            try:
+                return datetime.strptime(frame_str, fmt)
+            except ValueError:
+                continue
+    return datetime.now()
+
+
+def init_worker():
+    """工作进程初始化：忽略Ctrl+C，由主进程负责停止并等待在途批次处理完"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def decode_batch(payloads, quality_check=True):
+    """
+    解码一批原始JSON数据并按列写入共享内存（在工作进程中执行）
+
+    Args:
+        payloads (list): Redis中取出的JSON字符串列表
+        quality_check (bool): 是否进行数据质量检查
+
+    Returns:
+        dict: 共享内存描述信息和统计
+            shm_name: 共享内存名称（无有效数据时为None），由主进程读取后释放
+            rows: 行数
+            layout: [(列名, numpy类型, 偏移)]
+            consumed / quality_errors / json_errors: 统计
+            symbols: 本批出现的股票代码
+    """
+    symbols = []
+    values = {name: [] for name, _ in NUMERIC_COLUMNS}
+    quality_errors = 0
+    json_errors = 0
+
+    for payload in payloads:
+        try:
+            minute_bar = json.loads(payload)
+        except json.JSONDecodeError:
+            json_errors += 1
+            continue
+
+        if quality_check:
+            quality_score = calculate_quality_score(minute_bar)
+            minute_bar['quality_score'] = quality_score
+
+            if quality_score < MIN_QUALITY_SCORE:  # 质量分数过低
+                quality_errors += 1
+                continue
+
+        try:
+            row = (
+                parse_frame(minute_bar.get('frame')),
+                float(minute_bar.get('open', 0)),
+                float(minute_bar.get('high', 0)),
+                float(minute_bar.get('low', 0)),
+                float(minute_bar.get('close', 0)),
+                float(minute_bar.get('vol', 0)),
+                float(minute_bar.get('amount', 0)),
+                float(minute_bar.get('timestamp', time.time())),
+                float(minute_bar.get('quality_score', 1.0))
+            )
+        except (ValueError, TypeError):
+            # 数据格式转换失败，跳过该条
+            continue
+
+        symbols.append(str(minute_bar.get('symbol', '')).encode('utf-8'))
+        for (name, _), value in zip(NUMERIC_COLUMNS, row):
+            values[name].append(value)
+
+    result = {
+        'shm_name': None,
+        'rows': len(symbols),
+        'layout': [],
+        'consumed': len(symbols),
+        'quality_errors': quality_errors,
+        'json_errors': json_errors,
+        'symbols': sorted({symbol.decode('utf-8') for symbol in symbols})
+    }
+    if not symbols:
+        return result
+
+    columns = [('symbol', np.array(symbols, dtype=f'S{max(len(symbol) for symbol in symbols) or 1}'))]
+    columns += [(name, np.array(values[name], dtype=dtype)) for name, dtype in NUMERIC_COLUMNS]
+
+    # 各列按8字节对齐依次排列在同一块共享内存中
+    offset = 0
+    for name, array in columns:
+        result['layout'].append((name, array.dtype.str, offset))
+        offset += (array.nbytes + 7) // 8 * 8
+
+    shm = shared_memory.SharedMemory(create=True, size=offset)
+    try:
+        for (name, dtype, column_offset), (_, array) in zip(result['layout'], columns):
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=column_offset)[:] = array
+        result['shm_name'] = shm.name
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+
+    # 共享内存由主进程读取后释放，不让本进程的资源跟踪器在退出时清理
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return result
+
+
+def load_columns(result):
+    """
+    从共享内存读出列数据并释放共享内存（在主进程中执行）
+
+    Args:
+        result (dict): decode_batch 的返回值
+
+    Returns:
+        dict: 列名 -> numpy数组（无有效数据时为空字典）
+    """
+    if not result['shm_name']:
+        return {}
+
+    shm = shared_memory.SharedMemory(name=result['shm_name'])
+    try:
+        rows = result['rows']
+        return {
+            name: np.ndarray((rows,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset).copy()
+            for name, dtype, offset in result['layout']
+        }
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def release_columns(result):
+    """
+    释放批次的共享内存（在主进程中执行，已释放时不做任何事）
+
+    工作进程已把共享内存交给主进程管理，批次因出错或停止未经 load_columns 读取时
+    必须调用本函数，否则共享内存一直占用到系统重启。
+    """
+    if not result or not result.get('shm_name'):
+        return
+    try:
+        shm = shared_memory.SharedMemory(name=result['shm_name'])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def columns_to_insert_data(columns, created_at=None):
+    """
+    列数据转换为 minute_bars_enhanced 列式插入的参数
+
+    时间列转换为datetime列表：clickhouse_driver未启用use_numpy时不接受numpy datetime64；
+    字符串列为object数组：启用use_numpy时字符串列需要numpy数组。
+
+    Args:
+        columns (dict): load_columns 的返回值
+        created_at (datetime): 入库时间，默认当前时间
+
+    Returns:
+        list: 按 (symbol, frame, open, high, low, close, vol, amount, timestamp,
+              data_source, quality_score, created_at) 顺序排列的列
+    """
+    rows = len(columns['frame'])
+    return [
+        np.char.decode(columns['symbol'], 'utf-8').astype(object),
+        columns['frame'].astype('datetime64[s]').tolist(),
+        columns['open'],
+        columns['high'],
+        columns['low'],
+        columns['close'],
+        columns['vol'],
+        columns['amount'],
+        columns['timestamp'],
+        np.full(rows, 'qmt_enhanced', dtype=object),
+        columns['quality_score'],
+        [(created_at or datetime.now()).replace(microsecond=0)] * rows
+    ]
+
+
+def columns_to_bars(columns):
+    """列数据还原为分钟线字典列表（写入溢写日志用）"""
+    frames = np.datetime_as_string(columns['frame'], unit='s')
+    return [
+        {
+            'symbol': columns['symbol'][i].decode('utf-8'),
+            'frame': frames[i].replace('T', ' '),
+            'open': float(columns['open'][i]),
+            'high': float(columns['high'][i]),
+            'low': float(columns['low'][i]),
+            'close': float(columns['close'][i]),
+            'vol': float(columns['vol'][i]),
+            'amount': float(columns['amount'][i]),
+            'timestamp': float(columns['timestamp'][i]),
+            'quality_score': float(columns['quality_score'][i])
+        }
+        for i in range(len(frames))
+    ]
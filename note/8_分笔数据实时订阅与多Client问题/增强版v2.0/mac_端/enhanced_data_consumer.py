@@ -18,9 +18,20 @@ import time
 import traceback
 import queue
 from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import os
+import sys
 import psutil
 
+# 溢写日志模块与v1.0共用，位于上两级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from spill_log import SpillLog
+from batch_controller import AdaptiveBatchController
+from decode_worker import (calculate_quality_score, parse_frame, init_worker, decode_batch,
+                           load_columns, release_columns, columns_to_insert_data, columns_to_bars,
+                           MIN_QUALITY_SCORE)
+
 
 class EnhancedDataConsumer:
     """增强版数据消费器"""
@@ -43,6 +54,10 @@ class EnhancedDataConsumer:
 
         # 运行状态
         self.is_running = False
+        self._stop_event = threading.Event()
+        self.insert_threads = []
+        self.replay_thread = None
+        self.consume_thread = None
 
         # 数据队列和缓存
         self.data_queue = queue.Queue(maxsize=20000)
@@ -53,6 +68,33 @@ class EnhancedDataConsumer:
         self.batch_timeout = config.get('system', {}).get('batch_timeout', 5.0)
         self.worker_count = config.get('system', {}).get('worker_count', 4)
 
+        # 解码方式：thread（在消费线程中解码）或 process（解码进程池 + 共享内存列数据，插入线程只负责写入）
+        self.decode_mode = config.get('system', {}).get('decode_mode', 'thread')
+        self.process_count = config.get('system', {}).get('process_count', 0) or os.cpu_count() or 1
+        self.process_pool = None
+        self.pending_payloads = []          # 多进程模式下正在组批的原始JSON
+        self.column_queue = queue.Queue()   # 解码完成、等待写入的批次
+        # 在途批次上限（解码中 + 等待写入），满时暂停从Redis取数，数据留在Redis中
+        self.decode_slots = threading.BoundedSemaphore(self.process_count * 2)
+
+        # 自适应批量：按插入延迟、积压量和目标端到端延迟调整 batch_size / batch_timeout（上面的值作为初始值）
+        adaptive_config = config.get('adaptive_batch', {})
+        self.adjust_interval = adaptive_config.get('adjust_interval', 5)
+        self.batch_controller = None
+        if adaptive_config.get('enabled', True):
+            self.batch_controller = AdaptiveBatchController(
+                self.batch_size,
+                self.batch_timeout,
+                target_latency=adaptive_config.get('target_latency', 2.0),
+                min_batch_size=adaptive_config.get('min_batch_size', 100),
+                max_batch_size=adaptive_config.get('max_batch_size', 50000),
+                min_batch_timeout=adaptive_config.get('min_batch_timeout', 0.2),
+                max_batch_timeout=adaptive_config.get('max_batch_timeout', 5.0),
+                insert_workers=self.worker_count,
+                # 多进程模式由消费主循环统一组批，线程模式每个插入线程各自组批
+                batch_builders=1 if self.decode_mode == 'process' else self.worker_count
+            )
+
         # 性能统计
         self.stats = {
             'total_consumed': 0,
@@ -70,6 +112,15 @@ class EnhancedDataConsumer:
         # 重试配置
         self.max_retry_times = config.get('system', {}).get('max_retry_times', 3)
 
+        # 磁盘溢写：写不进ClickHouse的数据落盘，恢复后批量重放
+        self.spill_config = config.get('spill', {})
+        self.spill_log = None
+        if self.spill_config.get('enabled', True):
+            self.spill_log = SpillLog(
+                self.spill_config.get('directory', 'spill'),
+                segment_size=int(self.spill_config.get('segment_size_mb', 64)) * 1024 * 1024
+            )
+
     def init_redis_connection(self, config):
         """初始化Redis连接"""
         redis_config = config.get('redis', {})
@@ -124,8 +175,12 @@ class EnhancedDataConsumer:
             self.is_running = True
             self.logger.info("增强版数据消费器启动成功")
 
-            # 开始消费数据
-            self.consume_data_loop()
+            # 在独立线程中消费数据：主线程只等待，Ctrl+C在这里中断，
+            # 由stop_consumption等消费线程退出后再提交剩余批次、停止解码进程
+            self.consume_thread = threading.Thread(target=self.consume_data_loop, daemon=True)
+            self.consume_thread.start()
+            while self.consume_thread.is_alive():
+                self.consume_thread.join(timeout=1)
 
             return True
 
@@ -238,10 +293,19 @@ class EnhancedDataConsumer:
 
     def consume_data_loop(self):
         """数据消费主循环"""
+        if self.decode_mode == 'process':
+            self.consume_payload_loop()
+            return
+
         self.logger.info("开始消费Redis数据...")
 
         while self.is_running:
             try:
+                # 处理队列已满（如夜间回补）时暂停取数，数据留在Redis中，不逐条落盘
+                if self.data_queue.full():
+                    time.sleep(0.1)
+                    continue
+
                 # 从Redis队列获取数据
                 data = self.redis_client.brpop("minute_bar_queue", timeout=1)
 
@@ -260,79 +324,148 @@ class EnhancedDataConsumer:
                                 self.stats['data_quality_errors'] += 1
                                 continue
 
-                        # 添加到处理队列
-                        self.data_queue.put(minute_bar, timeout=0.1)
+                        # 添加到处理队列（只有本线程写入，取数前已确认有空位）
+                        self.data_queue.put(minute_bar)
                         self.stats['total_consumed'] += 1
                         self.stats['processed_symbols'].add(minute_bar.get('symbol', ''))
 
                     except json.JSONDecodeError as e:
                         self.logger.warning(f"JSON解析失败: {e}")
-                    except queue.Full:
-                        self.logger.warning("数据队列已满，丢弃数据")
 
             except Exception as e:
                 self.logger.error(f"消费数据失败: {e}")
                 time.sleep(1)
 
-    def calculate_quality_score(self, minute_bar):
-        """计算数据质量分数"""
-        try:
-            score = 1.0
-
-            # 检查必要字段
-            required_fields = ['symbol', 'open', 'high', 'low', 'close', 'vol']
-            for field in required_fields:
-                if field not in minute_bar or minute_bar[field] is None:
-                    score -= 0.2
+    def consume_payload_loop(self):
+        """多进程模式的消费主循环：按批取出原始JSON交给解码进程"""
+        self.logger.info(f"开始消费Redis数据（{self.process_count}个解码进程）...")
+        batch_started = time.time()
 
-            # 检查价格逻辑
+        while self.is_running:
             try:
-                open_price = float(minute_bar.get('open', 0))
-                high_price = float(minute_bar.get('high', 0))
-                low_price = float(minute_bar.get('low', 0))
-                close_price = float(minute_bar.get('close', 0))
-
-                if high_price < low_price:
-                    score -= 0.3
+                payloads = self.pop_raw_payloads(max(self.batch_size - len(self.pending_payloads), 1))
+                if payloads:
+                    if not self.pending_payloads:
+                        batch_started = time.time()
+                    self.pending_payloads.extend(payloads)
+
+                # 达到批量大小或超时，交给解码进程
+                if self.pending_payloads and (len(self.pending_payloads) >= self.batch_size or
+                                              time.time() - batch_started >= self.batch_timeout):
+                    self.submit_decode_batch(self.pending_payloads)
+                    self.pending_payloads = []
 
-                if not (low_price <= open_price <= high_price):
-                    score -= 0.2
+            except Exception as e:
+                self.logger.error(f"消费数据失败: {e}")
+                time.sleep(1)
 
-                if not (low_price <= close_price <= high_price):
-                    score -= 0.2
+    def pop_raw_payloads(self, max_count, timeout=1):
+        """
+        从Redis队列取出最多max_count条原始JSON（先阻塞等待一条，再在同一事务中取出其余积压数据）
 
-            except (ValueError, TypeError):
-                score -= 0.3
+        Returns:
+            list: JSON字符串列表，按入队顺序排列
+        """
+        data = self.redis_client.brpop("minute_bar_queue", timeout=timeout)
+        if not data:
+            return []
+
+        payloads = [data[1]]
+        if max_count > 1:
+            pipe = self.redis_client.pipeline()
+            pipe.lrange("minute_bar_queue", -(max_count - 1), -1)
+            pipe.ltrim("minute_bar_queue", 0, -max_count)
+            backlog, _ = pipe.execute()
+            payloads.extend(reversed(backlog))
+        return payloads
+
+    def submit_decode_batch(self, payloads):
+        """提交一批原始JSON给解码进程，在途批次已满时阻塞"""
+        self.decode_slots.acquire()
+        try:
+            future = self.process_pool.submit(decode_batch, payloads, self.quality_check)
+        except Exception:
+            self.decode_slots.release()
+            raise
+        future.add_done_callback(partial(self.on_batch_decoded, payloads))
 
-            # 检查成交量
-            try:
-                volume = float(minute_bar.get('vol', 0))
-                if volume < 0:
-                    score -= 0.1
-            except (ValueError, TypeError):
-                score -= 0.1
+    def on_batch_decoded(self, payloads, future):
+        """解码完成回调：更新统计，放入写入队列；解码进程出错时整批在主进程中解析后落盘"""
+        try:
+            result = future.result()
+        except Exception as e:
+            self.decode_slots.release()
+            if self.spill_log is not None:
+                self.spill_log.append(self.parse_payloads(payloads))
+                self.logger.error(f"解码进程处理失败，{len(payloads)}条数据写入溢写日志: {e}")
+            else:
+                self.stats['insert_errors'] += len(payloads)
+                self.logger.error(f"解码进程处理失败: {e}")
+            return
 
-            return max(0.0, min(1.0, score))
+        try:
+            self.stats['total_consumed'] += result['consumed']
+            self.stats['data_quality_errors'] += result['quality_errors']
+            self.stats['processed_symbols'].update(result['symbols'])
+            if result['json_errors']:
+                self.logger.warning(f"JSON解析失败: {result['json_errors']}条")
 
+            self.column_queue.put(result)
         except Exception as e:
-            self.logger.debug(f"计算质量分数失败: {e}")
-            return 0.5  # 默认中等质量
+            # 未进入写入队列的批次由这里释放共享内存
+            release_columns(result)
+            self.decode_slots.release()
+            self.logger.error(f"解码结果处理失败: {e}")
+
+    def parse_payloads(self, payloads):
+        """在主进程中解析一批原始JSON（跳过无法解析和质量分数过低的数据）"""
+        minute_bars = []
+        for payload in payloads:
+            try:
+                minute_bar = json.loads(payload)
+            except json.JSONDecodeError:
+                continue
+            if self.quality_check:
+                minute_bar['quality_score'] = self.calculate_quality_score(minute_bar)
+                if minute_bar['quality_score'] < MIN_QUALITY_SCORE:
+                    continue
+            minute_bars.append(minute_bar)
+        return minute_bars
+
+    def calculate_quality_score(self, minute_bar):
+        """计算数据质量分数"""
+        return calculate_quality_score(minute_bar)
 
     def start_worker_threads(self):
         """启动工作线程"""
-        # 批量插入工作线程
+        if self.decode_mode == 'process':
+            # 解码进程池，插入线程只负责把解码好的列数据写入ClickHouse
+            self.process_pool = ProcessPoolExecutor(max_workers=self.process_count, initializer=init_worker)
+            insert_worker = self.column_insert_worker
+        else:
+            insert_worker = self.batch_insert_worker
+
+        # 批量插入工作线程（停止时等待写完剩余数据）
+        self._stop_event.clear()
+        self.insert_threads = []
         for i in range(self.worker_count):
             worker_thread = threading.Thread(
-                target=self.batch_insert_worker,
+                target=insert_worker,
                 args=(f"worker-{i}",),
                 daemon=True
             )
             worker_thread.start()
+            self.insert_threads.append(worker_thread)
 
         # 数据清理线程
         cleanup_thread = threading.Thread(target=self.data_cleanup_worker, daemon=True)
         cleanup_thread.start()
 
+        # 溢写重放线程
+        if self.spill_log is not None:
+            self.replay_thread = threading.Thread(target=self.spill_replay_worker, daemon=True)
+            self.replay_thread.start()
+
     def batch_insert_worker(self, worker_name):
         """批量插入工作线程"""
         batch_data = []
@@ -371,82 +504,181 @@ class EnhancedDataConsumer:
                 time.sleep(1)
 
     def batch_insert_to_clickhouse(self, batch_data, worker_name):
-        """批量插入到ClickHouse"""
-        try:
-            if not batch_data:
-                return
+        """批量插入到ClickHouse，失败时写入溢写日志"""
+        if not batch_data:
+            return
 
-            # 准备批量数据
-            insert_data = []
-            for minute_bar in batch_data:
-                try:
-                    # 数据格式转换
-                    row = (
-                        minute_bar.get('symbol', ''),
-                        self.parse_datetime(minute_bar.get('frame')),
-                        float(minute_bar.get('open', 0)),
-                        float(minute_bar.get('high', 0)),
-                        float(minute_bar.get('low', 0)),
-                        float(minute_bar.get('close', 0)),
-                        float(minute_bar.get('vol', 0)),
-                        float(minute_bar.get('amount', 0)),
-                        float(minute_bar.get('timestamp', time.time())),
-                        'qmt_enhanced',
-                        float(minute_bar.get('quality_score', 1.0)),
-                        datetime.now()
-                    )
-                    insert_data.append(row)
+        # 溢写日志中还有未重放的数据，说明ClickHouse尚未恢复，直接落盘，不在这里等待
+        if self.spill_log is not None and self.spill_log.has_pending():
+            self.spill_log.append(batch_data)
+            return
 
-                except Exception as e:
-                    self.logger.debug(f"数据格式转换失败: {e}")
-                    continue
+        try:
+            inserted = self.insert_minute_bars(batch_data)
+            self.logger.debug(f"{worker_name} 批量插入 {inserted} 条数据")
 
-            if not insert_data:
-                return
+        except Exception as e:
+            if self.spill_log is not None:
+                self.spill_log.append(batch_data)
+                self.logger.warning(f"{worker_name} 批量插入失败，{len(batch_data)}条数据写入溢写日志: {e}")
+            else:
+                self.stats['insert_errors'] += len(batch_data)
+                self.logger.error(f"{worker_name} 批量插入失败: {e}")
 
-            # 执行批量插入
-            insert_sql = """
-            INSERT INTO minute_bars_enhanced
-            (symbol, frame, open, high, low, close, vol, amount, timestamp, data_source, quality_score, created_at)
-            VALUES
-            """
+    def column_insert_worker(self, worker_name):
+        """多进程模式的插入工作线程：读取共享内存中的列数据并写入ClickHouse"""
+        self.logger.info(f"启动列式插入工作线程: {worker_name}")
 
-            self.clickhouse_client.execute(insert_sql, insert_data)
+        while True:
+            try:
+                result = self.column_queue.get(timeout=0.5)
+            except queue.Empty:
+                # 停止后写入队列已空：在途批次已全部处理完
+                if not self.is_running and self.process_pool is None:
+                    break
+                continue
 
-            self.stats['total_inserted'] += len(insert_data)
-            self.stats['last_insert_time'] = datetime.now()
+            try:
+                self.insert_columns_to_clickhouse(load_columns(result), worker_name)
+            except Exception as e:
+                self.logger.error(f"列式插入工作线程{worker_name}错误: {e}")
+            finally:
+                # load_columns 读取后已释放；读取前出错时在这里释放共享内存
+                release_columns(result)
+                self.decode_slots.release()
+                self.column_queue.task_done()
+
+    def insert_columns_to_clickhouse(self, columns, worker_name):
+        """列式批量插入到ClickHouse，失败时写入溢写日志"""
+        if not columns:
+            return
+
+        # 溢写日志中还有未重放的数据，说明ClickHouse尚未恢复，直接落盘，不在这里等待
+        if self.spill_log is not None and self.spill_log.has_pending():
+            self.spill_log.append(columns_to_bars(columns))
+            return
 
-            self.logger.debug(f"{worker_name} 批量插入 {len(insert_data)} 条数据")
+        try:
+            inserted = self.insert_minute_columns(columns)
+            self.logger.debug(f"{worker_name} 列式插入 {inserted} 条数据")
 
         except Exception as e:
-            self.stats['insert_errors'] += len(batch_data)
-            self.logger.error(f"{worker_name} 批量插入失败: {e}")
+            if self.spill_log is not None:
+                self.spill_log.append(columns_to_bars(columns))
+                self.logger.warning(f"{worker_name} 列式插入失败，{len(columns['frame'])}条数据写入溢写日志: {e}")
+            else:
+                self.stats['insert_errors'] += len(columns['frame'])
+                self.logger.error(f"{worker_name} 列式插入失败: {e}")
 
-    def parse_datetime(self, frame_str):
-        """解析时间字符串"""
-        try:
-            if isinstance(frame_str, str):
-                # 尝试多种时间格式
-                formats = [
-                    '%Y-%m-%d %H:%M:%S',
-                    '%Y-%m-%dT%H:%M:%S',
-                    '%Y%m%d%H%M%S'
-                ]
-
-                for fmt in formats:
-                    try:
-                        return datetime.strptime(frame_str, fmt)
-                    except ValueError:
-                        continue
+    def insert_minute_columns(self, columns):
+        """
+        列式插入一批分钟线（numpy数组），插入失败时抛出异常
 
-                # 如果都失败，返回当前时间
-                return datetime.now()
-            else:
-                return datetime.now()
+        Args:
+            columns (dict): 列名 -> numpy数组，见 decode_worker.decode_batch
 
-        except Exception as e:
-            self.logger.debug(f"时间解析失败: {e}")
-            return datetime.now()
+        Returns:
+            int: 插入条数
+        """
+        rows = len(columns['frame'])
+        insert_sql = """
+        INSERT INTO minute_bars_enhanced
+        (symbol, frame, open, high, low, close, vol, amount, timestamp, data_source, quality_score, created_at)
+        VALUES
+        """
+
+        data = columns_to_insert_data(columns)
+        start = time.perf_counter()
+        self.clickhouse_client.execute(insert_sql, data, columnar=True)
+        if self.batch_controller is not None:
+            self.batch_controller.record_insert(rows, time.perf_counter() - start)
+
+        self.stats['total_inserted'] += rows
+        self.stats['last_insert_time'] = datetime.now()
+        return rows
+
+    def insert_minute_bars(self, batch_data, record=True):
+        """
+        转换并插入一批分钟线，插入失败时抛出异常
+
+        Args:
+            batch_data (list): 分钟线字典列表
+            record (bool): 是否把插入耗时计入自适应批量控制器（溢写重放的大批次不计入，
+                否则插入延迟和写入速度偏向回补批次，实时批量超时被压缩）
+
+        Returns:
+            int: 插入条数
+        """
+        # 准备批量数据
+        insert_data = []
+        for minute_bar in batch_data:
+            try:
+                # 数据格式转换
+                row = (
+                    minute_bar.get('symbol', ''),
+                    self.parse_datetime(minute_bar.get('frame')),
+                    float(minute_bar.get('open', 0)),
+                    float(minute_bar.get('high', 0)),
+                    float(minute_bar.get('low', 0)),
+                    float(minute_bar.get('close', 0)),
+                    float(minute_bar.get('vol', 0)),
+                    float(minute_bar.get('amount', 0)),
+                    float(minute_bar.get('timestamp', time.time())),
+                    'qmt_enhanced',
+                    float(minute_bar.get('quality_score', 1.0)),
+                    datetime.now()
+                )
+                insert_data.append(row)
+
+            except Exception as e:
+                self.logger.debug(f"数据格式转换失败: {e}")
+                continue
+
+        if not insert_data:
+            return 0
+
+        # 执行批量插入
+        insert_sql = """
+        INSERT INTO minute_bars_enhanced
+        (symbol, frame, open, high, low, close, vol, amount, timestamp, data_source, quality_score, created_at)
+        VALUES
+        """
+
+        start = time.perf_counter()
+        self.clickhouse_client.execute(insert_sql, insert_data)
+        if record and self.batch_controller is not None:
+            self.batch_controller.record_insert(len(insert_data), time.perf_counter() - start)
+
+        self.stats['total_inserted'] += len(insert_data)
+        self.stats['last_insert_time'] = datetime.now()
+        return len(insert_data)
+
+    def spill_replay_worker(self):
+        """溢写重放线程：按大批次把溢写日志中的数据写回ClickHouse，失败时指数退避"""
+        replay_interval = self.spill_config.get('replay_interval', 5)
+        max_backoff = self.spill_config.get('max_backoff', 60)
+        replay_batch_rows = self.spill_config.get('replay_batch_rows', 50000)
+        backoff = replay_interval
+        # 重放批次不计入自适应批量控制器，控制器只按实时插入调整
+        replay_insert = partial(self.insert_minute_bars, record=False)
+
+        while not self._stop_event.is_set():
+            try:
+                if self.spill_log.has_pending():
+                    replayed = self.spill_log.replay(replay_insert, max_rows=replay_batch_rows)
+                    if replayed:
+                        self.logger.info(f"溢写日志重放 {replayed} 条数据")
+                backoff = replay_interval
+
+            except Exception as e:
+                self.logger.warning(f"溢写日志重放失败，{backoff}秒后重试: {e}")
+                backoff = min(backoff * 2, max_backoff)
+
+            self._stop_event.wait(backoff)
+
+    def parse_datetime(self, frame_str):
+        """解析时间字符串"""
+        return parse_frame(frame_str)
 
     def data_cleanup_worker(self):
         """数据清理工作线程"""
@@ -483,6 +715,34 @@ class EnhancedDataConsumer:
         resource_thread = threading.Thread(target=self.resource_monitor, daemon=True)
         resource_thread.start()
 
+        # 批量参数调整线程
+        if self.batch_controller is not None:
+            tuning_thread = threading.Thread(target=self.batch_tuning_worker, daemon=True)
+            tuning_thread.start()
+
+    def get_backlog(self):
+        """积压数据量：Redis队列 + 本地待处理数据"""
+        try:
+            redis_backlog = self.redis_client.llen("minute_bar_queue")
+        except Exception:
+            redis_backlog = 0
+        return redis_backlog + self.data_queue.qsize() + len(self.pending_payloads)
+
+    def batch_tuning_worker(self):
+        """批量参数调整线程：定期把控制器计算的批量大小和超时应用到消费器"""
+        while True:
+            try:
+                if self.is_running:
+                    self.batch_size, self.batch_timeout = self.batch_controller.update(
+                        self.get_backlog(), self.stats['total_consumed']
+                    )
+
+                time.sleep(self.adjust_interval)
+
+            except Exception as e:
+                self.logger.error(f"批量参数调整错误: {e}")
+                time.sleep(self.adjust_interval)
+
     def performance_monitor(self):
         """性能监控"""
         while True:
@@ -514,6 +774,21 @@ class EnhancedDataConsumer:
                     self.logger.info(f"插入错误: {self.stats['insert_errors']}次")
                     self.logger.info(f"质量错误: {self.stats['data_quality_errors']}次")
                     self.logger.info(f"队列大小: {queue_size}")
+                    if self.batch_controller is not None:
+                        tuning = self.batch_controller.get_stats()
+                        self.logger.info(f"批量参数(自适应): 大小{self.batch_size}条, 超时{self.batch_timeout:.2f}秒, "
+                                       f"插入延迟{tuning['insert_latency'] * 1000:.0f}ms, "
+                                       f"到达{tuning['arrival_rate']:.1f}条/秒, 积压{tuning['backlog']}条, "
+                                       f"目标延迟{tuning['target_latency']}秒")
+                    else:
+                        self.logger.info(f"批量参数: 大小{self.batch_size}条, 超时{self.batch_timeout}秒")
+                    if self.decode_mode == 'process':
+                        self.logger.info(f"解码进程: {self.process_count}个, 组批中: {len(self.pending_payloads)}条, "
+                                       f"待写入批次: {self.column_queue.qsize()}")
+                    if self.spill_log is not None:
+                        spill_stats = self.spill_log.get_stats()
+                        self.logger.info(f"溢写日志: 落盘{spill_stats['spilled_rows']}条, 重放{spill_stats['replayed_rows']}条, "
+                                       f"待重放{spill_stats['pending_bytes'] / 1024 / 1024:.1f}MB")
                     self.logger.info(f"处理股票: {symbol_count}只")
                     self.logger.info(f"最后插入: {self.stats['last_insert_time']}")
                     self.logger.info("=" * 60)
@@ -568,6 +843,23 @@ class EnhancedDataConsumer:
             self.logger.info("正在停止增强版数据消费器...")
             self.is_running = False
 
+            # 等消费线程退出，之后不会再有线程修改组批中的数据或提交解码批次
+            if self.consume_thread is not None and self.consume_thread is not threading.current_thread():
+                self.consume_thread.join()
+
+            # 多进程模式：提交组批中的数据，等待解码进程和写入线程处理完全部在途批次
+            if self.process_pool is not None:
+                if self.pending_payloads:
+                    self.submit_decode_batch(self.pending_payloads)
+                    self.pending_payloads = []
+                self.process_pool.shutdown(wait=True)
+                self.column_queue.join()
+                self.process_pool = None
+
+            # 等待插入线程写完各自的剩余批次（写入失败时落盘）
+            for worker_thread in self.insert_threads:
+                worker_thread.join()
+
             # 处理剩余队列数据
             remaining_data = []
             while not self.data_queue.empty():
@@ -584,6 +876,13 @@ class EnhancedDataConsumer:
             # 打印最终统计
             self.print_final_stats()
 
+            # 等重放线程退出后关闭溢写日志，未重放的溢写数据保留在磁盘上，下次启动后重放
+            self._stop_event.set()
+            if self.replay_thread is not None:
+                self.replay_thread.join()
+            if self.spill_log is not None:
+                self.spill_log.close()
+
             self.logger.info("增强版数据消费器已停止")
 
         except Exception as e:
@@ -603,6 +902,11 @@ class EnhancedDataConsumer:
             self.logger.info(f"插入错误次数: {self.stats['insert_errors']}")
             self.logger.info(f"质量错误次数: {self.stats['data_quality_errors']}")
             self.logger.info(f"处理股票数量: {len(self.stats['processed_symbols'])}")
+            if self.spill_log is not None:
+                spill_stats = self.spill_log.get_stats()
+                self.logger.info(f"溢写落盘总数: {spill_stats['spilled_rows']}")
+                self.logger.info(f"溢写重放总数: {spill_stats['replayed_rows']}")
+                self.logger.info(f"待重放数据: {spill_stats['pending_bytes']} 字节")
 
             if runtime.total_seconds() > 0:
                 avg_consume_rate = self.stats['total_consumed'] / runtime.total_seconds()
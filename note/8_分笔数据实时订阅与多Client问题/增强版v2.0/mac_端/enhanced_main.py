@@ -81,8 +81,27 @@ def get_default_config():
             'batch_size': 1000,
             'batch_timeout': 5.0,
             'worker_count': 4,
+            'decode_mode': 'process',
+            'process_count': 0,
             'max_retry_times': 3,
             'log_level': 'INFO'
+        },
+        'adaptive_batch': {
+            'enabled': True,
+            'target_latency': 2.0,
+            'min_batch_size': 100,
+            'max_batch_size': 50000,
+            'min_batch_timeout': 0.2,
+            'max_batch_timeout': 5.0,
+            'adjust_interval': 5
+        },
+        'spill': {
+            'enabled': True,
+            'directory': 'spill',
+            'segment_size_mb': 64,
+            'replay_batch_rows': 50000,
+            'replay_interval': 5,
+            'max_backoff': 60
         }
     }
 
@@ -116,9 +135,16 @@ def print_config_info(config):
     print(f"ClickHouse服务器: {config['clickhouse']['host']}:{config['clickhouse']['port']}")
     print(f"批量大小: {config['system']['batch_size']}")
     print(f"批量超时: {config['system']['batch_timeout']}秒")
+    adaptive_config = config.get('adaptive_batch', {})
+    if adaptive_config.get('enabled', True):
+        print(f"自适应批量: 启用 (目标延迟 {adaptive_config.get('target_latency', 2.0)}秒)")
     print(f"工作线程数: {config['system']['worker_count']}")
+    if config['system'].get('decode_mode', 'thread') == 'process':
+        print(f"解码进程数: {config['system'].get('process_count') or os.cpu_count()}")
     print(f"数据质量检查: {'启用' if config['data']['quality_check'] else '禁用'}")
     print(f"数据保留天数: {config['data']['retention_days']}")
+    spill_config = config.get('spill', {})
+    print(f"磁盘溢写: {'启用 (' + spill_config.get('directory', 'spill') + ')' if spill_config.get('enabled', True) else '禁用'}")
     print(f"日志级别: {config['system']['log_level']}")
     print("=" * 60)
 
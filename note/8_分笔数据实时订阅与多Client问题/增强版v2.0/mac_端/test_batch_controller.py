@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+自适应批量控制器测试脚本
+测试盘中（无积压）和夜间回补（大量积压）两种情况下的批量参数调整（不需要Redis/ClickHouse服务）
+"""
+import time
+
+from batch_controller import AdaptiveBatchController
+
+
+def make_controller():
+    """4个插入线程各自组批，目标端到端延迟2秒"""
+    return AdaptiveBatchController(
+        1000, 5.0, target_latency=2.0,
+        min_batch_size=100, max_batch_size=50000,
+        min_batch_timeout=0.2, max_batch_timeout=5.0,
+        insert_workers=4, batch_builders=4
+    )
+
+
+def run_updates(controller, backlog, arrival_per_second, rounds=20):
+    """每轮模拟经过1秒、到达 arrival_per_second 条数据后调整一次"""
+    consumed = 0
+    controller.update(backlog, consumed)
+    for _ in range(rounds):
+        consumed += arrival_per_second
+        controller._last_update = time.monotonic() - 1.0
+        controller.update(backlog, consumed)
+    return controller.get_stats()
+
+
+def test_live_regime():
+    """测试盘中无积压：批量超时趋近 目标延迟 - 插入耗时，批量大小为这段时间内到达的数据量"""
+    print("测试盘中无积压...")
+    try:
+        controller = make_controller()
+        controller.record_insert(200, 0.05)
+        stats = run_updates(controller, backlog=0, arrival_per_second=500)
+
+        # 每个组批线程 1.95秒内收到约 500 * 1.95 / 4 ≈ 244 条
+        if (abs(stats['batch_timeout'] - 1.95) < 0.05 and 200 <= stats['batch_size'] <= 260
+                and stats['insert_latency'] == 0.05):
+            print("✓ 盘中无积压测试成功")
+            return True
+        else:
+            print(f"✗ 盘中无积压测试失败: {stats}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 盘中无积压测试失败: {e}")
+        return False
+
+
+def test_backfill_regime():
+    """测试夜间回补大量积压：批量超时降到下限，批量大小按积压量放大到上限"""
+    print("测试夜间回补积压...")
+    try:
+        controller = make_controller()
+        controller.record_insert(200, 0.05)
+        stats = run_updates(controller, backlog=1000000, arrival_per_second=20000)
+
+        if stats['batch_size'] == 50000 and stats['batch_timeout'] < 0.21:
+            print("✓ 夜间回补积压测试成功")
+            return True
+        else:
+            print(f"✗ 夜间回补积压测试失败: {stats}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 夜间回补积压测试失败: {e}")
+        return False
+
+
+def test_record_insert_smoothing():
+    """测试插入观测值取平均，无效观测被忽略"""
+    print("测试插入观测值...")
+    try:
+        controller = make_controller()
+        controller.record_insert(100, 0.1)
+        controller.record_insert(300, 0.1)
+        controller.record_insert(0, 0.5)
+        controller.record_insert(100, 0)
+        stats = controller.get_stats()
+
+        if abs(stats['insert_latency'] - 0.1) < 1e-9 and abs(stats['insert_rate'] - 2000) < 1e-6:
+            print("✓ 插入观测值测试成功")
+            return True
+        else:
+            print(f"✗ 插入观测值测试失败: {stats}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 插入观测值测试失败: {e}")
+        return False
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("=" * 50)
+    print("开始自适应批量控制器测试")
+    print("=" * 50)
+
+    tests = [
+        ("盘中无积压", test_live_regime),
+        ("夜间回补积压", test_backfill_regime),
+        ("插入观测值", test_record_insert_smoothing),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        print(f"\n{test_name}测试:")
+        results.append((test_name, test_func()))
+
+    print("\n" + "=" * 50)
+    passed = sum(1 for _, result in results if result)
+    for test_name, result in results:
+        print(f"{test_name}: {'✓ 通过' if result else '✗ 失败'}")
+    print(f"\n总计: {passed}/{len(tests)} 个测试通过")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    run_all_tests()
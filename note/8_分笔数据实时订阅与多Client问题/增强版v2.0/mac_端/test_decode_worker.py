@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+多进程解码测试脚本
+测试解码进程的共享内存列数据和ClickHouse列式插入参数（不需要Redis/ClickHouse服务）
+"""
+import json
+from datetime import datetime
+from multiprocessing import shared_memory
+
+from clickhouse_driver.bufferedwriter import BufferedSocketWriter
+from clickhouse_driver.columns.service import write_column
+from clickhouse_driver.context import Context
+
+from decode_worker import decode_batch, load_columns, release_columns, columns_to_insert_data, columns_to_bars
+
+
+# minute_bars_enhanced 的列类型（与 init_database_tables 一致）
+INSERT_COLUMN_TYPES = [
+    ('symbol', 'String'), ('frame', 'DateTime'), ('open', 'Float64'), ('high', 'Float64'),
+    ('low', 'Float64'), ('close', 'Float64'), ('vol', 'Float64'), ('amount', 'Float64'),
+    ('timestamp', 'Float64'), ('data_source', 'String'), ('quality_score', 'Float32'),
+    ('created_at', 'DateTime')
+]
+
+
+def make_payloads():
+    """两条正常数据、一条无法解析的JSON、一条价格逻辑错误的数据"""
+    bars = [
+        {'symbol': '000001.SZ', 'frame': '2024-01-02 09:31:00', 'open': 10.0, 'high': 10.5,
+         'low': 9.9, 'close': 10.2, 'vol': 1000, 'amount': 10200, 'timestamp': 1704159060.0},
+        {'symbol': '600519.SH', 'frame': '2024-01-02T09:31:00', 'open': 1700.0, 'high': 1710.0,
+         'low': 1695.0, 'close': 1705.0, 'vol': 200, 'amount': 341000, 'timestamp': 1704159060.0},
+        {'symbol': '000002.SZ', 'frame': '2024-01-02 09:31:00', 'open': 12.0, 'high': 9.0,
+         'low': 11.0, 'close': 15.0, 'vol': -1, 'amount': 0}
+    ]
+    return [json.dumps(bars[0]), json.dumps(bars[1]), '{broken', json.dumps(bars[2])]
+
+
+def shm_exists(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    return True
+
+
+def serialize_column(column_type, items, use_numpy):
+    """按clickhouse_driver插入时的方式序列化一列，返回写出的字节数"""
+    class Socket:
+        data = b''
+
+        def sendall(self, data):
+            self.data += bytes(data)
+
+    class ServerInfo:
+        def get_timezone(self):
+            return 'Asia/Shanghai'
+
+    context = Context()
+    context.settings = {}
+    context.server_info = ServerInfo()
+    context.client_settings = {
+        'insert_block_size': 1048576, 'strings_as_bytes': False, 'strings_encoding': 'utf-8',
+        'use_numpy': use_numpy, 'input_format_null_as_default': False, 'namedtuple_as_json': True
+    }
+    socket = Socket()
+    writer = BufferedSocketWriter(socket, 1 << 16)
+    write_column(context, 'column', column_type, items, writer)
+    writer.flush()
+    return len(socket.data)
+
+
+def test_shared_memory_columns():
+    """测试解码结果经共享内存传回主进程，读取后共享内存释放"""
+    print("测试共享内存列数据...")
+    try:
+        result = decode_batch(make_payloads())
+        columns = load_columns(result)
+
+        if (result['rows'] == 2 and result['json_errors'] == 1 and result['quality_errors'] == 1
+                and columns['symbol'].tolist() == [b'000001.SZ', b'600519.SH']
+                and columns['close'].tolist() == [10.2, 1705.0]
+                and str(columns['frame'][1]) == '2024-01-02T09:31:00'
+                and not shm_exists(result['shm_name'])):
+            print("✓ 共享内存列数据测试成功")
+            return True
+        else:
+            print(f"✗ 共享内存列数据测试失败: {result}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 共享内存列数据测试失败: {e}")
+        return False
+
+
+def test_release_unread_columns():
+    """测试未读取的批次由主进程释放共享内存"""
+    print("测试释放未读取的共享内存...")
+    try:
+        result = decode_batch(make_payloads())
+        existed = shm_exists(result['shm_name'])
+        release_columns(result)
+        # 重复释放、无数据批次都不报错
+        release_columns(result)
+        release_columns(decode_batch(['{broken']))
+
+        if existed and not shm_exists(result['shm_name']):
+            print("✓ 释放未读取的共享内存测试成功")
+            return True
+        else:
+            print(f"✗ 释放未读取的共享内存测试失败: 释放前存在={existed}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 释放未读取的共享内存测试失败: {e}")
+        return False
+
+
+def test_columnar_insert_serialization():
+    """测试列式插入参数能被clickhouse_driver序列化（use_numpy开启和关闭）"""
+    print("测试列式插入序列化...")
+    try:
+        columns = load_columns(decode_batch(make_payloads()))
+        data = columns_to_insert_data(columns, created_at=datetime(2024, 1, 2, 15, 0))
+
+        sizes = {
+            use_numpy: [
+                serialize_column(column_type, items, use_numpy)
+                for (_, column_type), items in zip(INSERT_COLUMN_TYPES, data)
+            ]
+            for use_numpy in (False, True)
+        }
+        # 每列2行：DateTime 4字节，Float64 8字节，Float32 4字节
+        if (len(data) == len(INSERT_COLUMN_TYPES) and sizes[False] == sizes[True]
+                and sizes[False][1] == 8 and sizes[False][2] == 16 and sizes[False][10] == 8):
+            print("✓ 列式插入序列化测试成功")
+            return True
+        else:
+            print(f"✗ 列式插入序列化测试失败: {sizes}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 列式插入序列化测试失败: {e}")
+        return False
+
+
+def test_columns_to_bars():
+    """测试列数据还原为溢写日志用的分钟线字典"""
+    print("测试列数据还原...")
+    try:
+        bars = columns_to_bars(load_columns(decode_batch(make_payloads())))
+
+        if (len(bars) == 2 and bars[0]['symbol'] == '000001.SZ'
+                and bars[1]['frame'] == '2024-01-02 09:31:00' and bars[1]['close'] == 1705.0):
+            print("✓ 列数据还原测试成功")
+            return True
+        else:
+            print(f"✗ 列数据还原测试失败: {bars}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 列数据还原测试失败: {e}")
+        return False
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("=" * 50)
+    print("开始多进程解码测试")
+    print("=" * 50)
+
+    tests = [
+        ("共享内存列数据", test_shared_memory_columns),
+        ("释放未读取的共享内存", test_release_unread_columns),
+        ("列式插入序列化", test_columnar_insert_serialization),
+        ("列数据还原", test_columns_to_bars),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        print(f"\n{test_name}测试:")
+        results.append((test_name, test_func()))
+
+    print("\n" + "=" * 50)
+    passed = sum(1 for _, result in results if result)
+    for test_name, result in results:
+        print(f"{test_name}: {'✓ 通过' if result else '✗ 失败'}")
+    print(f"\n总计: {passed}/{len(tests)} 个测试通过")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    run_all_tests()
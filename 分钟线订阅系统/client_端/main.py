@@ -9,17 +9,25 @@ Client端主程序 - 数据消费者
 """
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from datetime import datetime, date
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from datetime import datetime, date, timedelta
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
+import json
 
-from config import WEB_PORTS
-from database import RedisManager, ClickHouseManager
-from data_processor import DataMerger
+from config import WEB_PORTS, QUERY_SETTING_KEYS, QUERY_CACHE_CONFIG, QUERY_FETCH_WORKERS
+from database import RedisManager, get_clickhouse_manager
+from data_processor import (DataMerger, bars_to_columns, empty_bar_columns, columns_to_json,
+                            resample_bar_columns, downsample_bar_columns, adjust_bar_columns, DAILY_PERIOD)
 from models import QueryResponse
+from query_cache import BarQueryCache
+from live_push import LiveBroadcaster
+from symbol_registry import SymbolRegistry
+from bar_export import EXPORT_FORMATS, columns_to_arrow, normalize_table, iter_export_bytes
 
 
 class ClientDataService:
@@ -28,14 +36,23 @@ class ClientDataService:
     def __init__(self):
         try:
             self.redis_manager = RedisManager()
-            self.clickhouse_manager = ClickHouseManager()
+            self.clickhouse_manager = get_clickhouse_manager()
             self.data_merger = DataMerger()
+            # 历史数据查询缓存（按交易日分块，Mac端入库后自动失效）
+            self.query_cache = BarQueryCache(
+                self.clickhouse_manager.query_bar_frame, redis_client=self.redis_manager.client
+            ) if QUERY_CACHE_CONFIG['enabled'] else None
+            # 股票代码注册表（不扫描Redis键空间）
+            self.symbol_registry = SymbolRegistry(self.redis_manager, self.clickhouse_manager)
+            # 混合查询时在后台线程读取Redis，与ClickHouse查询并发执行
+            self.fetch_executor = ThreadPoolExecutor(max_workers=QUERY_FETCH_WORKERS, thread_name_prefix='redis_fetch')
             print("✓ Client端服务初始化成功")
         except Exception as e:
             print(f"✗ Client端服务初始化失败: {e}")
             raise
 
-    def query_bar_data(self, symbol: str, start_time: datetime, end_time: datetime, period: int) -> QueryResponse:
+    def query_bar_data(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                       settings: dict = None) -> QueryResponse:
         """
         查询分钟线数据
 
@@ -43,20 +60,21 @@ class ClientDataService:
         1. 如果查询的分钟线数据是当日的，则直接从Redis中读取合成的分钟线数据
         2. 如果查询的分钟线数据是历史的，则直接从ClickHouse中读取
         3. 如果查询的分钟线数据是既有当日的又有历史的，则合并数据返回给Client
+        两个数据源并发查询，耗时取决于较慢的一方。
         """
         try:
             today = date.today()
             start_date = start_time.date()
             end_date = end_time.date()
 
-            redis_data = []
+            redis_future = None
             clickhouse_data = []
 
-            # 1. 查询当日数据（从Redis读取）
+            # 1. 查询当日数据（从Redis读取，后台线程）
             if end_date >= today:
-                redis_data = self.redis_manager.get_current_bar_data(period, symbol)
-                # 过滤时间范围
-                redis_data = [bar for bar in redis_data if start_time <= bar.frame <= end_time]
+                redis_future = self.fetch_executor.submit(
+                    self._fetch_current_bars, period, symbol, start_time, end_time
+                )
 
             # 2. 查询历史数据（从ClickHouse读取）
             if start_date < today:
@@ -64,10 +82,11 @@ class ClientDataService:
                 hist_end_time = min(end_time, datetime.combine(today, datetime.min.time()))
                 if start_time < hist_end_time:
                     clickhouse_data = self.clickhouse_manager.query_bar_data(
-                        symbol, start_time, hist_end_time, period
+                        symbol, start_time, hist_end_time, period, settings=settings
                     )
 
             # 3. 合并数据
+            redis_data = redis_future.result() if redis_future is not None else []
             merged_data = self.data_merger.merge_bar_data(redis_data, clickhouse_data)
 
             return QueryResponse(
@@ -85,11 +104,258 @@ class ClientDataService:
                 total_count=0
             )
 
+    def query_bar_columns(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                          settings: dict = None, adjust: str = None) -> dict:
+        """
+        列式查询分钟线数据
+
+        数据来源与query_bar_data相同，但ClickHouse结果直接以numpy列返回，
+        不逐行构造BarData，适合大范围查询。
+        """
+        try:
+            today = date.today()
+
+            redis_future = None
+            clickhouse_columns = empty_bar_columns()
+
+            # 1. 查询当日数据（从Redis读取，后台线程）
+            if end_time.date() >= today:
+                redis_future = self.fetch_executor.submit(
+                    lambda: bars_to_columns(self._fetch_current_bars(period, symbol, start_time, end_time))
+                )
+
+            # 2. 查询历史数据（从ClickHouse读取）
+            if start_time.date() < today:
+                hist_end_time = min(end_time, datetime.combine(today, datetime.min.time()))
+                if start_time < hist_end_time:
+                    if self.query_cache is not None:
+                        clickhouse_columns = self.query_cache.get_columns(
+                            symbol, start_time, hist_end_time, period, settings=settings
+                        )
+                    else:
+                        clickhouse_columns = self.clickhouse_manager.query_bar_frame(
+                            symbol, start_time, hist_end_time, period, settings=settings
+                        )
+
+            # 3. 合并数据
+            redis_columns = redis_future.result() if redis_future is not None else empty_bar_columns()
+            merged_columns = self.data_merger.merge_bar_columns(redis_columns, clickhouse_columns)
+            if adjust:
+                merged_columns = self._adjust_columns(merged_columns, [symbol], start_time, end_time, adjust)
+            redis_count = len(redis_columns['frame'])
+            clickhouse_count = len(clickhouse_columns['frame'])
+            total_count = len(merged_columns['frame'])
+
+            return {
+                'success': True,
+                'message': f"当日数据: {redis_count} 条，历史数据: {clickhouse_count} 条，合并后: {total_count} 条",
+                'columns': merged_columns,
+                'total_count': total_count
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f"查询失败: {str(e)}",
+                'columns': empty_bar_columns(),
+                'total_count': 0
+            }
+
+    def query_bar_columns_batch(self, symbols: list, start_time: datetime, end_time: datetime, period: int,
+                                settings: dict = None, adjust: str = None) -> dict:
+        """
+        多股票列式查询分钟线数据
+
+        当日数据通过一个Redis pipeline取回，历史数据通过一次 symbol IN (...) 查询取回，
+        再按股票分别合并。
+        """
+        try:
+            today = date.today()
+
+            redis_future = None
+            clickhouse_frames = {}
+
+            # 1. 查询当日数据（从Redis读取，后台线程）
+            if end_time.date() >= today:
+                redis_future = self.fetch_executor.submit(
+                    self.redis_manager.get_current_bars_by_symbol, [period], symbols
+                )
+
+            # 2. 查询历史数据（从ClickHouse读取）
+            if start_time.date() < today:
+                hist_end_time = min(end_time, datetime.combine(today, datetime.min.time()))
+                if start_time < hist_end_time:
+                    clickhouse_frames = self.clickhouse_manager.query_bar_frames(
+                        symbols, start_time, hist_end_time, period, settings=settings
+                    )
+
+            # 3. 按股票合并数据（复权因子一次查询取回）
+            redis_bars = redis_future.result()[period] if redis_future is not None else {}
+            factors = (
+                self.clickhouse_manager.query_adjust_factors(symbols, start_time, end_time) if adjust else None
+            )
+            data = {}
+            total_count = 0
+            for symbol in symbols:
+                redis_columns = bars_to_columns(
+                    [bar for bar in redis_bars.get(symbol, []) if start_time <= bar.frame <= end_time]
+                )
+                clickhouse_columns = clickhouse_frames.get(symbol, empty_bar_columns())
+                data[symbol] = self.data_merger.merge_bar_columns(redis_columns, clickhouse_columns)
+                if adjust:
+                    data[symbol] = adjust_bar_columns(data[symbol], factors, adjust)
+                total_count += len(data[symbol]['frame'])
+
+            return {
+                'success': True,
+                'message': f"{len(symbols)} 只股票，合并后共 {total_count} 条",
+                'data': data,
+                'total_count': total_count
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f"查询失败: {str(e)}",
+                'data': {},
+                'total_count': 0
+            }
+
+    def query_resampled_columns(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                                settings: dict = None, adjust: str = None) -> dict:
+        """
+        任意N分钟周期重采样查询（列式）
+
+        历史部分在ClickHouse中由1分钟线聚合，当日部分对Redis中的1分钟线做相同规则的向量化聚合。
+        """
+        try:
+            today = date.today()
+
+            redis_future = None
+            clickhouse_columns = empty_bar_columns()
+
+            # 1. 当日数据（Redis中的1分钟线，后台线程读取并聚合）
+            if end_time.date() >= today:
+                redis_future = self.fetch_executor.submit(
+                    lambda: resample_bar_columns(
+                        bars_to_columns(self._fetch_current_bars(1, symbol, start_time, end_time)), period
+                    )
+                )
+
+            # 2. 历史数据（ClickHouse中聚合）
+            if start_time.date() < today:
+                hist_end_time = min(end_time, datetime.combine(today, datetime.min.time()) - timedelta(seconds=1))
+                if start_time < hist_end_time:
+                    clickhouse_columns = self.clickhouse_manager.query_resampled_frame(
+                        symbol, start_time, hist_end_time, period, settings=settings
+                    )
+
+            # 3. 合并数据（按日划分，两部分周期不重叠）
+            redis_columns = redis_future.result() if redis_future is not None else empty_bar_columns()
+            merged_columns = self.data_merger.merge_bar_columns(redis_columns, clickhouse_columns)
+            if adjust:
+                merged_columns = self._adjust_columns(merged_columns, [symbol], start_time, end_time, adjust)
+            total_count = len(merged_columns['frame'])
+
+            return {
+                'success': True,
+                'message': f"{period}分钟重采样，共 {total_count} 条",
+                'columns': merged_columns,
+                'total_count': total_count
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f"查询失败: {str(e)}",
+                'columns': empty_bar_columns(),
+                'total_count': 0
+            }
+
+    def _fetch_current_bars(self, period: int, symbol: str, start_time: datetime, end_time: datetime) -> list:
+        """Redis中指定时间范围的当日分钟线（按时间排序）"""
+        redis_data = self.redis_manager.get_current_bar_data(period, symbol)
+        return [bar for bar in redis_data if start_time <= bar.frame <= end_time]
+
+    def _adjust_columns(self, columns: dict, symbols: list, start_time: datetime, end_time: datetime,
+                        adjust: str) -> dict:
+        """按日线复权因子调整列式数据的价格（qfq/hfq）"""
+        factors = self.clickhouse_manager.query_adjust_factors(symbols, start_time, end_time)
+        return adjust_bar_columns(columns, factors, adjust)
+
+    def stream_bar_columns(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                           settings: dict = None):
+        """
+        流式列式查询分钟线数据（生成器，逐块返回列式数据）
+
+        先按frame游标分页读取ClickHouse历史数据，最后返回Redis中的当日数据；
+        历史数据只查询到今天之前，两部分时间不重叠，无需合并去重。
+        """
+        today = date.today()
+
+        # 1. 历史数据（从ClickHouse分页读取）
+        if start_time.date() < today:
+            hist_end_time = min(end_time, datetime.combine(today, datetime.min.time()))
+            if start_time < hist_end_time:
+                yield from self.clickhouse_manager.iter_bar_frame(
+                    symbol, start_time, hist_end_time, period, settings=settings
+                )
+
+        # 2. 当日数据（从Redis读取）
+        if end_time.date() >= today:
+            redis_columns = bars_to_columns(self._fetch_current_bars(period, symbol, start_time, end_time))
+            if len(redis_columns['frame']):
+                yield redis_columns
+
+    def export_bar_tables(self, symbols: list, start_time: datetime, end_time: datetime, period: int,
+                          settings: dict = None):
+        """
+        按交易日逐块导出分钟线（生成器，返回 pyarrow.Table）
+
+        历史数据每个交易日一次ClickHouse Arrow查询，最后一块为Redis中的当日数据；
+        symbols为空时导出全部股票。
+        """
+        today = date.today()
+
+        # 1. 历史数据（ClickHouse Arrow输出，按日分块控制内存）
+        if start_time.date() < today:
+            hist_end_time = min(end_time, datetime.combine(today, datetime.min.time()) - timedelta(seconds=1))
+            day_start = start_time
+            while day_start <= hist_end_time:
+                day_end = min(hist_end_time, datetime.combine(day_start.date(), datetime.max.time().replace(microsecond=0)))
+                table = self.clickhouse_manager.query_bar_frame(
+                    symbols or None, day_start, day_end, period, fmt='arrow', settings=settings
+                )
+                yield normalize_table(table)
+                day_start = datetime.combine(day_start.date() + timedelta(days=1), datetime.min.time())
+
+        # 2. 当日数据（从Redis读取原始JSON批量解析为列式数据）
+        if end_time.date() >= today:
+            yield columns_to_arrow(
+                self.redis_manager.get_current_bar_columns(period, symbols or None, start_time, end_time)
+            )
+
+    def get_data_status(self) -> dict:
+        """Redis当日数据和ClickHouse历史数据的条数"""
+        # 各周期的LLEN在一个pipeline中完成
+        pipe = self.redis_manager.client.pipeline(transaction=False)
+        for period in [1, 5, 15, 30]:
+            pipe.llen(f"current_bar_data_{period}min")
+        redis_status = {f"{period}min": count for period, count in zip([1, 5, 15, 30], pipe.execute())}
+
+        clickhouse_status = {}
+        for period in [1, 5, 15, 30]:
+            clickhouse_status[f"{period}min"] = self.clickhouse_manager.get_table_count(period)
+
+        return {
+            "redis_current_data": redis_status,
+            "clickhouse_historical_data": clickhouse_status,
+            "query_cache": self.query_cache.get_stats() if self.query_cache else None
+        }
+
     def get_available_symbols(self) -> list:
-        """获取可用的股票代码"""
-        # 这里可以从Redis或ClickHouse获取实际的股票列表
-        # 暂时返回模拟数据
-        return ["000001.SZ", "000002.SZ", "600000.SH", "600036.SH"]
+        """获取可用的股票代码（当日Redis中有数据或ClickHouse中有历史数据的股票）"""
+        return self.symbol_registry.get_symbols()
 
 
 # 创建FastAPI应用
@@ -98,6 +364,9 @@ app = FastAPI(title="Client端数据查询服务")
 # 全局服务实例
 service = None
 
+# WebSocket推送：数据状态每隔一段时间计算一次，当日分钟线由Redis频道转发，所有连接共用
+live_broadcaster = LiveBroadcaster(status_func=lambda: get_service().get_data_status(), subscribe_bars=True)
+
 def get_service():
     """获取服务实例"""
     global service
@@ -105,12 +374,23 @@ def get_service():
         service = ClientDataService()
     return service
 
+@app.on_event("startup")
+async def startup_event():
+    """启动事件"""
+    await live_broadcaster.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭事件"""
+    await live_broadcaster.stop()
+
 @app.get("/", response_class=HTMLResponse)
 async def get_query_page():
     """获取查询页面"""
     try:
         current_service = get_service()
-        symbols = current_service.get_available_symbols()
+        # 页面只预置前100只股票，其余通过 /api/symbols?prefix= 自动补全
+        symbols = current_service.get_available_symbols()[:100]
         symbol_options = ""
         for symbol in symbols:
             symbol_options += f'<option value="{symbol}">{symbol}</option>'
@@ -169,10 +449,11 @@ async def get_query_page():
                     <div class="row">
                         <div class="col-md-3">
                             <label for="symbol" class="form-label">股票代码</label>
-                            <select class="form-select" id="symbol" name="symbol" required>
-                                <option value="">请选择股票</option>
+                            <input class="form-control" id="symbol" name="symbol" list="symbolList"
+                                   placeholder="输入股票代码" autocomplete="off" required>
+                            <datalist id="symbolList">
                                 """ + symbol_options + """
-                            </select>
+                            </datalist>
                         </div>
                         <div class="col-md-2">
                             <label for="period" class="form-label">周期</label>
@@ -289,6 +570,8 @@ async def get_query_page():
 
     <script>
         let priceChart = null;
+        // 最近一次查询的股票和周期（用于追加实时推送的分钟线）
+        let lastQuery = null;
 
         // 初始化默认时间
         document.addEventListener('DOMContentLoaded', function() {
@@ -305,6 +588,20 @@ async def get_query_page():
             document.getElementById('end_minute').value = '00';
         });
 
+        // 股票代码自动补全（前缀搜索）
+        document.getElementById('symbol').addEventListener('input', function(e) {
+            const prefix = e.target.value.trim();
+            if (!prefix) {
+                return;
+            }
+            fetch(`/api/symbols?prefix=${encodeURIComponent(prefix)}&limit=20`)
+                .then(response => response.json())
+                .then(symbols => {
+                    document.getElementById('symbolList').innerHTML =
+                        symbols.map(symbol => `<option value="${symbol}">`).join('');
+                });
+        });
+
         // 日期格式化函数
         function formatDate(date) {
             const year = date.getFullYear();
@@ -372,21 +669,7 @@ async def get_query_page():
                 .then(response => response.json())
                 .then(data => {
                     if (data.success) {
-                        let html = '<div class="row mt-2">';
-                        html += '<div class="col-md-6">';
-                        html += '<h6>Redis当日数据:</h6>';
-                        for (const [period, count] of Object.entries(data.redis_current_data)) {
-                            html += `<small>${period}: ${count} 条</small><br>`;
-                        }
-                        html += '</div>';
-                        html += '<div class="col-md-6">';
-                        html += '<h6>ClickHouse历史数据:</h6>';
-                        for (const [period, count] of Object.entries(data.clickhouse_historical_data)) {
-                            html += `<small>${period}: ${count} 条</small><br>`;
-                        }
-                        html += '</div>';
-                        html += '</div>';
-                        statusDiv.innerHTML = html;
+                        renderDataStatus(data);
                     } else {
                         statusDiv.innerHTML = '<div class="text-danger">检查失败: ' + data.error + '</div>';
                     }
@@ -396,6 +679,82 @@ async def get_query_page():
                 });
         }
 
+        function renderDataStatus(data) {
+            const statusDiv = document.getElementById('dataStatus');
+            let html = '<div class="row mt-2">';
+            html += '<div class="col-md-6">';
+            html += '<h6>Redis当日数据:</h6>';
+            for (const [period, count] of Object.entries(data.redis_current_data)) {
+                html += `<small>${period}: ${count} 条</small><br>`;
+            }
+            html += '</div>';
+            html += '<div class="col-md-6">';
+            html += '<h6>ClickHouse历史数据:</h6>';
+            for (const [period, count] of Object.entries(data.clickhouse_historical_data)) {
+                html += `<small>${period}: ${count} 条</small><br>`;
+            }
+            html += '</div>';
+            html += '</div>';
+            statusDiv.innerHTML = html;
+        }
+
+        // 合并服务端推送的状态差异（值为null的字段表示已删除）
+        function mergeDelta(target, delta) {
+            for (const [key, value] of Object.entries(delta)) {
+                if (value === null) {
+                    delete target[key];
+                } else if (typeof value === 'object' && !Array.isArray(value)
+                           && typeof target[key] === 'object' && target[key] !== null) {
+                    mergeDelta(target[key], value);
+                } else {
+                    target[key] = value;
+                }
+            }
+            return target;
+        }
+
+        // 把推送的当日分钟线追加到当前图表（同一时间的K线覆盖更新）
+        function appendLiveBar(period, bar) {
+            if (!priceChart || !lastQuery || lastQuery.symbol !== bar.symbol || lastQuery.period !== period) {
+                return;
+            }
+            const label = new Date(bar.frame).toLocaleString();
+            const labels = priceChart.data.labels;
+            const prices = priceChart.data.datasets[0].data;
+            if (labels.length && labels[labels.length - 1] === label) {
+                prices[prices.length - 1] = bar.close;
+            } else {
+                labels.push(label);
+                prices.push(bar.close);
+            }
+            priceChart.update('none');
+        }
+
+        // WebSocket实时推送：数据状态变化和当前图表股票/周期的当日分钟线，断开后稍后重连
+        let liveStatus = {};
+        let liveSocket = null;
+        function subscribeLive() {
+            if (liveSocket && liveSocket.readyState === WebSocket.OPEN && lastQuery) {
+                liveSocket.send(JSON.stringify({action: 'subscribe', symbols: [lastQuery.symbol], periods: [lastQuery.period]}));
+            }
+        }
+        function connectLive() {
+            const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws/live`);
+            liveSocket = ws;
+            ws.onopen = subscribeLive;
+            ws.onmessage = event => {
+                const message = JSON.parse(event.data);
+                if (message.type === 'status') {
+                    liveStatus = message.full ? message.data : mergeDelta(liveStatus, message.data);
+                    renderDataStatus(liveStatus);
+                } else if (message.type === 'bar') {
+                    appendLiveBar(message.period, message.data);
+                }
+            };
+            ws.onclose = () => setTimeout(connectLive, 5000);
+        }
+        connectLive();
+
         // 时间调试
         function checkTimeDebug() {
             const debugDiv = document.getElementById('timeDebug');
@@ -510,8 +869,12 @@ async def get_query_page():
                 symbol: formData.get('symbol'),
                 period: parseInt(formData.get('period')),
                 start_time: getDateTime('start_date', 'start_hour', 'start_minute'),
-                end_time: getDateTime('end_date', 'end_hour', 'end_minute')
+                end_time: getDateTime('end_date', 'end_hour', 'end_minute'),
+                format: 'columnar',
+                max_points: 2000
             };
+            lastQuery = {symbol: queryData.symbol, period: queryData.period};
+            subscribeLive();
 
             // 24小时制时间格式，不需要转换
 
@@ -533,11 +896,13 @@ async def get_query_page():
             .then(data => {
                 if (data.success) {
                     statusDiv.className = 'alert alert-success';
-                    statusDiv.textContent = `查询成功，共找到 ${data.total_count} 条记录`;
+                    statusDiv.textContent = data.returned_count < data.total_count
+                        ? `查询成功，共找到 ${data.total_count} 条记录，合并为 ${data.returned_count} 根K线显示`
+                        : `查询成功，共找到 ${data.total_count} 条记录`;
 
                     // 更新图表和表格
-                    updateChart(data.data);
-                    updateTable(data.data);
+                    updateChart(data.columns);
+                    updateTable(data.columns);
                 } else {
                     statusDiv.className = 'alert alert-danger';
                     statusDiv.textContent = `查询失败: ${data.message}`;
@@ -549,19 +914,19 @@ async def get_query_page():
             });
         });
 
-        function updateChart(data) {
+        function updateChart(columns) {
             const ctx = document.getElementById('priceChart').getContext('2d');
 
             if (priceChart) {
                 priceChart.destroy();
             }
 
-            if (data.length === 0) {
+            if (columns.frame.length === 0) {
                 return;
             }
 
-            const labels = data.map(item => new Date(item.frame).toLocaleString());
-            const prices = data.map(item => item.close);
+            const labels = columns.frame.map(frame => new Date(frame).toLocaleString());
+            const prices = columns.close;
 
             priceChart = new Chart(ctx, {
                 type: 'line',
@@ -587,26 +952,26 @@ async def get_query_page():
             });
         }
 
-        function updateTable(data) {
+        function updateTable(columns) {
             const tbody = document.getElementById('dataTableBody');
             tbody.innerHTML = '';
 
-            if (data.length === 0) {
+            if (columns.frame.length === 0) {
                 const row = tbody.insertRow();
                 row.innerHTML = '<td colspan="7" class="text-center text-muted">没有找到数据</td>';
                 return;
             }
 
-            data.forEach(item => {
+            columns.frame.forEach((frame, i) => {
                 const row = tbody.insertRow();
                 row.innerHTML = `
-                    <td>${new Date(item.frame).toLocaleString()}</td>
-                    <td>${item.open.toFixed(2)}</td>
-                    <td>${item.high.toFixed(2)}</td>
-                    <td>${item.low.toFixed(2)}</td>
-                    <td>${item.close.toFixed(2)}</td>
-                    <td>${item.vol.toFixed(0)}</td>
-                    <td>${item.amount.toFixed(2)}</td>
+                    <td>${new Date(frame).toLocaleString()}</td>
+                    <td>${columns.open[i].toFixed(2)}</td>
+                    <td>${columns.high[i].toFixed(2)}</td>
+                    <td>${columns.low[i].toFixed(2)}</td>
+                    <td>${columns.close[i].toFixed(2)}</td>
+                    <td>${columns.vol[i].toFixed(0)}</td>
+                    <td>${columns.amount[i].toFixed(2)}</td>
                 `;
             });
         }
@@ -637,6 +1002,29 @@ async def get_query_page():
 </html>"""
         return error_html
 
+def parse_max_points(data: dict):
+    """解析请求中的 max_points，未指定时返回None，不是正整数时抛出ValueError"""
+    max_points = data.get('max_points')
+    if max_points is None:
+        return None
+    max_points = int(max_points)
+    if max_points < 1:
+        raise ValueError(f"max_points必须为正整数: {max_points}")
+    return max_points
+
+def downsample_result(data: dict, columns: dict) -> dict:
+    """按请求中的 max_points 合并K线（保留区间开高低收），未指定时原样返回"""
+    max_points = parse_max_points(data)
+    return downsample_bar_columns(columns, max_points) if max_points else columns
+
+def parse_query_settings(data: dict) -> dict:
+    """
+    解析请求中的ClickHouse查询设置（如max_threads、max_execution_time），
+    只接受 QUERY_SETTING_KEYS 中的设置项
+    """
+    settings = data.get('settings') or {}
+    return {key: int(value) for key, value in settings.items() if key in QUERY_SETTING_KEYS}
+
 @app.post("/api/query")
 async def query_data(request: Request):
     """查询数据API"""
@@ -648,6 +1036,10 @@ async def query_data(request: Request):
         period = data.get('period')
         start_time_str = data.get('start_time')
         end_time_str = data.get('end_time')
+        # 返回格式：rows（默认，逐条记录）或 columnar（按列返回）；两种格式都可用max_points限制返回的K线数量
+        response_format = data.get('format', 'rows')
+        settings = parse_query_settings(data)
+        max_points = parse_max_points(data)
 
         # 解析时间（24小时制格式：YYYY-MM-DDTHH:MM）
         start_time = datetime.fromisoformat(start_time_str)
@@ -655,7 +1047,42 @@ async def query_data(request: Request):
 
         # 执行查询
         current_service = get_service()
-        result = current_service.query_bar_data(symbol, start_time, end_time, period)
+
+        if response_format == 'columnar':
+            result = await run_in_threadpool(
+                current_service.query_bar_columns, symbol, start_time, end_time, period, settings,
+                data.get('adjust')
+            )
+            columns = downsample_result(data, result['columns'])
+            return JSONResponse(content={
+                "success": result['success'],
+                "message": result['message'],
+                "total_count": result['total_count'],
+                "returned_count": len(columns['frame']),
+                "symbol": symbol,
+                "period": period,
+                "format": "columnar",
+                "columns": columns_to_json(columns)
+            })
+
+        if data.get('adjust') or max_points is not None:
+            # 复权和K线合并在列式数据上计算，结果仍按逐条记录返回
+            result = await run_in_threadpool(
+                current_service.query_bar_columns, symbol, start_time, end_time, period, settings,
+                data.get('adjust')
+            )
+            columns = columns_to_json(downsample_result(data, result['columns']), include_symbol=True)
+            return JSONResponse(content={
+                "success": result['success'],
+                "message": result['message'],
+                "total_count": result['total_count'],
+                "returned_count": len(columns['frame']),
+                "data": [dict(zip(columns, values)) for values in zip(*columns.values())]
+            })
+
+        result = await run_in_threadpool(
+            current_service.query_bar_data, symbol, start_time, end_time, period, settings
+        )
 
         # 手动序列化数据，确保datetime正确转换
         data_list = []
@@ -686,35 +1113,258 @@ async def query_data(request: Request):
             "data": []
         })
 
+@app.post("/api/query-stream")
+async def query_data_stream(request: Request):
+    """
+    流式查询数据API（NDJSON）
+
+    每行一个JSON对象：数据块为 {"columns": {...}, "count": n}（列格式同 /api/query 的columnar），
+    最后一行为 {"done": true, "success": ..., "total_count": n}。
+    """
+    try:
+        data = await request.json()
+
+        symbol = data.get('symbol')
+        period = data.get('period')
+        start_time = datetime.fromisoformat(data.get('start_time'))
+        end_time = datetime.fromisoformat(data.get('end_time'))
+        settings = parse_query_settings(data)
+        if not symbol or not period:
+            raise ValueError("缺少symbol或period")
+
+    except Exception as e:
+        return JSONResponse(status_code=400, content={
+            "success": False,
+            "message": f"查询参数错误: {str(e)}"
+        })
+
+    current_service = get_service()
+
+    def generate():
+        # 同步生成器由StreamingResponse在线程池中迭代，不阻塞事件循环
+        total_count = 0
+        try:
+            for columns in current_service.stream_bar_columns(symbol, start_time, end_time, period, settings):
+                count = len(columns['frame'])
+                total_count += count
+                yield json.dumps({"columns": columns_to_json(columns), "count": count}) + "\n"
+            yield json.dumps({"done": True, "success": True, "symbol": symbol, "period": period,
+                              "total_count": total_count}) + "\n"
+        except Exception as e:
+            yield json.dumps({"done": True, "success": False, "message": f"查询失败: {str(e)}",
+                              "total_count": total_count}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/api/export")
+async def export_data(request: Request):
+    """
+    批量导出数据API
+
+    请求体：symbols（为空时导出全部股票）、period、start_time、end_time、format（arrow 或 parquet）；
+    返回Arrow IPC流或Parquet文件，边查询边输出。
+    """
+    try:
+        data = await request.json()
+
+        symbols = data.get('symbols') or []
+        period = data.get('period')
+        start_time = datetime.fromisoformat(data.get('start_time'))
+        end_time = datetime.fromisoformat(data.get('end_time'))
+        export_format = data.get('format', 'arrow')
+        settings = parse_query_settings(data)
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+
+    except Exception as e:
+        return JSONResponse(status_code=400, content={
+            "success": False,
+            "message": f"导出参数错误: {str(e)}"
+        })
+
+    current_service = get_service()
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"bars_{period}min_{start_time:%Y%m%d}_{end_time:%Y%m%d}.{extension}"
+
+    # 同步生成器由StreamingResponse在线程池中迭代
+    content = iter_export_bytes(
+        current_service.export_bar_tables(symbols, start_time, end_time, period, settings),
+        export_format
+    )
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/resample")
+async def query_resampled(request: Request):
+    """
+    任意周期重采样查询API
+
+    period为N分钟（如60、120），或 "1d" 表示由分钟线聚合的日线；返回格式同 /api/query 的columnar。
+    """
+    try:
+        data = await request.json()
+
+        symbol = data.get('symbol')
+        period = data.get('period')
+        period = DAILY_PERIOD if period == '1d' else int(period)
+        start_time = datetime.fromisoformat(data.get('start_time'))
+        end_time = datetime.fromisoformat(data.get('end_time'))
+        settings = parse_query_settings(data)
+
+        current_service = get_service()
+        result = await run_in_threadpool(
+            current_service.query_resampled_columns, symbol, start_time, end_time, period, settings,
+            data.get('adjust')
+        )
+        columns = downsample_result(data, result['columns'])
+
+        return JSONResponse(content={
+            "success": result['success'],
+            "message": result['message'],
+            "total_count": result['total_count'],
+            "returned_count": len(columns['frame']),
+            "symbol": symbol,
+            "period": period,
+            "format": "columnar",
+            "columns": columns_to_json(columns)
+        })
+
+    except Exception as e:
+        return JSONResponse(content={
+            "success": False,
+            "message": f"查询失败: {str(e)}",
+            "total_count": 0,
+            "columns": {}
+        })
+
+@app.post("/api/query-batch")
+async def query_data_batch(request: Request):
+    """多股票批量查询数据API（按股票分组的列式结果）"""
+    try:
+        data = await request.json()
+
+        # 解析请求参数
+        symbols = data.get('symbols') or []
+        period = data.get('period')
+        start_time = datetime.fromisoformat(data.get('start_time'))
+        end_time = datetime.fromisoformat(data.get('end_time'))
+        settings = parse_query_settings(data)
+
+        # 执行查询
+        current_service = get_service()
+        result = await run_in_threadpool(
+            current_service.query_bar_columns_batch, symbols, start_time, end_time, period, settings,
+            data.get('adjust')
+        )
+
+        return JSONResponse(content={
+            "success": result['success'],
+            "message": result['message'],
+            "total_count": result['total_count'],
+            "period": period,
+            "format": "columnar",
+            "data": {symbol: columns_to_json(columns) for symbol, columns in result['data'].items()}
+        })
+
+    except Exception as e:
+        return JSONResponse(content={
+            "success": False,
+            "message": f"查询失败: {str(e)}",
+            "total_count": 0,
+            "data": {}
+        })
+
+@app.post("/api/cross-section")
+async def query_cross_section(request: Request):
+    """截面查询API：某一时刻全部股票（或指定股票）的历史分钟线"""
+    try:
+        data = await request.json()
+
+        # 解析请求参数
+        period = data.get('period')
+        start_time = datetime.fromisoformat(data.get('time'))
+        end_time = datetime.fromisoformat(data['end_time']) if data.get('end_time') else None
+        symbols = data.get('symbols')
+        settings = parse_query_settings(data)
+
+        # 执行查询
+        current_service = get_service()
+        columns = await run_in_threadpool(
+            current_service.clickhouse_manager.query_cross_section, start_time, period, end_time, symbols, settings
+        )
+        total_count = len(columns['frame'])
+
+        return JSONResponse(content={
+            "success": True,
+            "message": f"截面数据: {total_count} 条",
+            "total_count": total_count,
+            "period": period,
+            "format": "columnar",
+            "columns": columns_to_json(columns, include_symbol=True)
+        })
+
+    except Exception as e:
+        return JSONResponse(content={
+            "success": False,
+            "message": f"查询失败: {str(e)}",
+            "total_count": 0,
+            "columns": {}
+        })
+
+@app.get("/api/snapshot")
+async def get_snapshot(period: int = 1, symbols: str = None):
+    """
+    市场快照API：全市场（或指定股票，逗号分隔）当日最新一根分钟线，列式返回
+    """
+    try:
+        current_service = get_service()
+        symbol_list = [symbol for symbol in symbols.split(',') if symbol] if symbols else None
+        columns = await run_in_threadpool(current_service.redis_manager.get_latest_snapshot, period, symbol_list)
+        total_count = len(columns['frame'])
+
+        return JSONResponse(content={
+            "success": True,
+            "message": f"最新K线: {total_count} 只股票",
+            "total_count": total_count,
+            "period": period,
+            "format": "columnar",
+            "columns": columns_to_json(columns, include_symbol=True)
+        })
+
+    except Exception as e:
+        return JSONResponse(content={
+            "success": False,
+            "message": f"查询失败: {str(e)}",
+            "total_count": 0,
+            "columns": {}
+        })
+
 @app.get("/api/symbols")
-async def get_symbols():
-    """获取可用股票代码API"""
+async def get_symbols(prefix: str = None, limit: int = 20):
+    """获取可用股票代码API（指定prefix时按前缀搜索，用于自动补全）"""
     current_service = get_service()
-    return current_service.get_available_symbols()
+    if prefix:
+        return await run_in_threadpool(current_service.symbol_registry.search, prefix, limit)
+    return await run_in_threadpool(current_service.get_available_symbols)
+
+@app.websocket("/ws/live")
+async def live_updates(websocket: WebSocket):
+    """实时推送（数据状态变化和当日分钟线）"""
+    await live_broadcaster.handle(websocket)
 
 @app.get("/api/data-status")
 async def get_data_status():
     """获取数据状态API"""
     try:
         current_service = get_service()
-
-        # 检查Redis当日数据状态
-        redis_status = {}
-        for period in [1, 5, 15, 30]:
-            current_data_key = f"current_bar_data_{period}min"
-            count = current_service.redis_manager.client.llen(current_data_key)
-            redis_status[f"{period}min"] = count
-
-        # 检查ClickHouse历史数据状态
-        clickhouse_status = {}
-        for period in [1, 5, 15, 30]:
-            count = current_service.clickhouse_manager.get_table_count(period)
-            clickhouse_status[f"{period}min"] = count
+        data_status = await run_in_threadpool(current_service.get_data_status)
 
         return {
             "success": True,
-            "redis_current_data": redis_status,
-            "clickhouse_historical_data": clickhouse_status,
+            **data_status,
             "check_time": datetime.now().isoformat()
         }
 
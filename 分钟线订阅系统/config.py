@@ -20,6 +20,46 @@ CLICKHOUSE_CONFIG = {
     'database': 'v1'
 }
 
+# ClickHouse连接池配置
+# maxsize: 连接池最大连接数（同时执行的查询数），compress: 传输压缩方式
+# query_settings: 查询默认设置，单次请求可覆盖
+CLICKHOUSE_POOL_CONFIG = {
+    'maxsize': 16,
+    'compress': 'lz4',
+    'connect_timeout': 10,
+    'send_receive_timeout': 300,
+    'query_settings': {
+        'max_threads': 4,
+        'max_execution_time': 60
+    }
+}
+
+# WebSocket实时推送配置
+# channel: Windows端发布当日分钟线时同时发布到的Redis频道
+# status_interval: 状态计算间隔（秒），client_queue_size: 每个连接最多积压的消息数
+LIVE_PUSH_CONFIG = {
+    'channel': 'live_bar_updates',
+    'status_interval': 5,
+    'client_queue_size': 1000,
+    # Redis订阅中断后的重连间隔（秒），每次失败翻倍直到上限
+    'reconnect_delay': 1,
+    'reconnect_max_delay': 30
+}
+
+# 股票代码注册表配置
+# redis_refresh_interval: 重新读取Redis股票代码集合的间隔（秒）
+# refresh_interval: 重新查询ClickHouse DISTINCT symbol 的间隔（秒，新入库的股票代码由 symbols:all 集合及时带入）
+SYMBOL_REGISTRY_CONFIG = {
+    'redis_refresh_interval': 5,
+    'refresh_interval': 3600
+}
+
+# 流式查询每页行数（按frame游标分页读取ClickHouse）
+STREAM_PAGE_ROWS = 50000
+
+# 单次请求允许覆盖的查询设置
+QUERY_SETTING_KEYS = ['max_threads', 'max_execution_time', 'max_memory_usage']
+
 # Redis队列名称
 REDIS_QUEUES = {
     'whole_quote_data': 'whole_quote_data',
@@ -37,9 +77,90 @@ CLICKHOUSE_TABLES = {
     'data_bar_for_30min': 'data_bar_for_30min'
 }
 
+# ClickHouse表结构版本
+# v1: symbol String、Float64无压缩编码、不分区（原始表结构）
+# v2: symbol LowCardinality(String)、frame/价格列压缩编码、按月分区、
+#     ReplacingMergeTree(version)去重，写入带去重令牌，重复写入和重试不会产生重复行
+# 已有v1表需先执行 python migrate_schema.py 迁移后再切换为v2
+CLICKHOUSE_SCHEMA_VERSION = 'v1'
+
+# v2表查询前检查分区是否有多个未合并part（决定是否使用FINAL）的结果缓存秒数
+# 本进程写入后立即失效；其他进程写入的数据最多在这段时间后才按FINAL去重读取
+CLICKHOUSE_FINAL_CHECK_TTL = 10
+
+# ClickHouse写缓冲配置（Mac端入库）
+# max_rows: 单表累积多少行触发写入；max_age: 最长缓冲秒数
+# （实时消费路径，取亚秒级使数据从Redis取出后1秒内在ClickHouse中可查询；积压时按max_rows整批写入）
+# async_insert: 是否使用ClickHouse服务端异步插入（由服务端再合并小批次）
+INSERT_BUFFER_CONFIG = {
+    'max_rows': 50000,
+    'max_age': 0.5,
+    'async_insert': False
+}
+
+# Mac端分钟线消费配置
+# 一次BRPOP阻塞等待所有周期队列，有数据立即唤醒；batch_size: 每个队列单次最多取走的条数
+# block_timeout: 无数据时BRPOP的阻塞秒数（只用于检查服务是否停止）
+# decode_workers: 每个周期的解码/校验线程数；queue_size: 每个周期解码队列容量（批次数），
+# 队列满时暂停从Redis取该周期的数据（写入线程由每个周期的写缓冲提供，见INSERT_BUFFER_CONFIG）
+BAR_CONSUMER_CONFIG = {
+    'batch_size': 1000,
+    'block_timeout': 1,
+    'decode_workers': 2,
+    'queue_size': 8
+}
+
+# Mac端夜间历史数据加载配置（nightly_loader.py）
+# decode_workers / insert_workers: 解码线程数和并发写入ClickHouse的线程数
+# 批次大小在 [min_batch_size, max_batch_size] 内自动调整，使单次写入耗时接近 target_insert_seconds
+# report_interval: 进度（吞吐量、预计剩余时间）输出间隔（秒）
+NIGHTLY_LOAD_CONFIG = {
+    'decode_workers': 4,
+    'insert_workers': 4,
+    'initial_batch_size': 20000,
+    'min_batch_size': 2000,
+    'max_batch_size': 200000,
+    'target_insert_seconds': 2.0,
+    'report_interval': 5
+}
+
+# 历史分钟线查询缓存配置（Client端）
+# max_blocks: 进程内LRU缓存的 (股票, 周期, 交易日) 数据块数量
+# redis_enabled: 是否启用Redis共享缓存（多个Client进程共用），redis_ttl: 共享缓存过期秒数
+# epoch_check_interval: 检查Mac端入库版本号的最小间隔（秒）
+QUERY_CACHE_CONFIG = {
+    'enabled': True,
+    'max_blocks': 20000,
+    'redis_enabled': False,
+    'redis_ttl': 7 * 24 * 3600,
+    'epoch_check_interval': 1
+}
+
+# Client端混合查询（既有当日又有历史）时并发读取Redis的线程数
+QUERY_FETCH_WORKERS = 8
+
+# 日线表（日线数据定时获取写入，含Tushare复权因子adjust），分钟线复权查询时读取
+# 需与分钟线表在同一ClickHouse实例，可写成 database.table
+DAY_BAR_TABLE = 'day_bar'
+
 # 分钟线周期
 BAR_PERIODS = [1, 5, 15, 30]
 
+# 高周期服务端聚合
+# 开启后只入库1分钟线，5/15/30分钟线由ClickHouse物化视图按交易时段对齐聚合到
+# data_bar_for_{n}min_agg（AggregatingMergeTree），查询高周期时从聚合表读取。
+# 已有数据需先执行 python migrate_schema.py --rollups 回填聚合表
+BAR_ROLLUP_ENABLED = False
+
+# 截面查询副本表
+# 开启后为每个分钟线表维护按 (frame, symbol) 排序的副本 {table}_by_frame（物化视图同步写入），
+# "某一时刻全部股票" 类查询自动改读副本，只扫描相关时间的数据块。
+# 已有数据需先执行 python migrate_schema.py --cross-section 回填副本表
+CROSS_SECTION_ENABLED = False
+
+# 需要入库的周期（开启服务端聚合时只有1分钟线）
+INGEST_PERIODS = [1] if BAR_ROLLUP_ENABLED else BAR_PERIODS
+
 # 交易时间配置
 TRADING_HOURS = {
     'morning_start': '09:30:00',
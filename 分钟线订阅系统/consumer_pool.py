@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Mac端分钟线消费工作池
+每个周期一条独立的流水线：
+
+    拉取线程（BLMOVE到在途列表） → 周期解码队列（有界） → 解码/校验线程 → 周期写缓冲（独立写入线程）
+    → ClickHouse → 确认后删除在途列表
+
+- 每个周期一个拉取线程，阻塞等待该周期的Redis队列，有数据立即唤醒；某个周期积压不会拖慢其他周期
+- 解码队列满时不再从Redis取该周期的数据；写缓冲满时解码线程阻塞。未取出的数据留在Redis队列中（背压）
+- 取出的数据原子转移到Redis在途列表，写入ClickHouse成功后才删除；
+  进程中断时在途数据仍在Redis中，下次启动时放回队列
+- 每个周期一个写缓冲和写入线程，同一周期的数据按顺序写入，不同周期并行写入
+- 写缓冲最长缓冲 max_age 秒（亚秒级），数据取出后1秒内在ClickHouse中可查询
+"""
+import itertools
+import queue
+import threading
+import time
+import logging
+from functools import partial
+from typing import Callable, Dict, List
+
+from config import INSERT_BUFFER_CONFIG, BAR_CONSUMER_CONFIG
+from insert_buffer import InsertBuffer
+
+
+class BarConsumerPool:
+    """分钟线消费工作池（每个周期独立的有界队列和工作线程）"""
+
+    def __init__(self, redis_manager, periods: List[int], decode_func: Callable[[int, List[str]], List],
+                 insert_func: Callable[[int, List], None], decode_workers: int = None,
+                 queue_size: int = None, name: str = 'bar_consumer'):
+        """
+        Args:
+            redis_manager: RedisManager
+            periods: 消费的周期
+            decode_func: 解码/校验函数，参数为 (周期, JSON字符串列表)，返回待写入的行
+            insert_func: 写入ClickHouse的函数，参数为 (周期, 行)
+            decode_workers: 每个周期的解码线程数
+            queue_size: 每个周期解码队列的容量（批次数，每批最多 batch_size 条）
+            name: 名称（用于线程名）
+        """
+        self.redis_manager = redis_manager
+        self.periods = list(periods)
+        self.decode_func = decode_func
+        self.decode_workers = decode_workers or BAR_CONSUMER_CONFIG['decode_workers']
+        self.queue_size = queue_size or BAR_CONSUMER_CONFIG['queue_size']
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+
+        self._queues: Dict[int, queue.Queue] = {
+            period: queue.Queue(maxsize=self.queue_size) for period in self.periods
+        }
+        # 每个周期一个写缓冲，即一个独立的写入线程
+        self.insert_buffers: Dict[int, InsertBuffer] = {
+            period: InsertBuffer(
+                insert_func,
+                max_rows=INSERT_BUFFER_CONFIG['max_rows'],
+                max_age=INSERT_BUFFER_CONFIG['max_age'],
+                name=f'{name}_insert_{period}min'
+            )
+            for period in self.periods
+        }
+        # 解码线程取走一批后通知拉取线程
+        self._space = threading.Condition()
+        self._batch_ids = itertools.count()
+        self._fetch_threads: List[threading.Thread] = []
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            period: {
+                'fetched_rows': 0,
+                'decoded_rows': 0,
+                'decode_busy_seconds': 0.0,
+                'blocked_seconds': 0.0
+            }
+            for period in self.periods
+        }
+
+    def start(self):
+        """
+        放回上次中断遗留的在途数据，启动各周期的拉取线程和解码线程
+
+        在服务启动时调用一次，此时没有任何组件在处理数据，放回全部组件遗留的在途批次。
+        """
+        recovered = self.redis_manager.release_all_bar_batches()
+        if recovered:
+            self.logger.info(f"{self.name} 放回上次中断的在途数据 {recovered} 条")
+        self._started_at = time.monotonic()
+        self._start_workers()
+
+    def pause(self):
+        """暂停消费（夜间加载期间）：停止拉取，已取出的数据写入ClickHouse并确认后返回"""
+        self._stop_workers()
+        for period, buffer in self.insert_buffers.items():
+            if not buffer.flush():
+                self.logger.error(f"{self.name} {period}分钟线暂停时写入失败，恢复后重试")
+
+    def resume(self):
+        """恢复暂停的消费"""
+        if not self._fetch_threads:
+            self._start_workers()
+
+    def stop(self):
+        """停止拉取，处理完解码队列中的数据并写入全部缓冲"""
+        self._stop_workers()
+        for period, buffer in self.insert_buffers.items():
+            if not buffer.close():
+                self.logger.error(
+                    f"{self.name} {period}分钟线写缓冲关闭时写入失败，"
+                    f"未写入 {sum(buffer.get_depth().values())} 条（仍在Redis在途列表中，下次启动时放回队列）"
+                )
+
+    def _start_workers(self):
+        """启动各周期的拉取线程和解码线程"""
+        self._running = True
+        self._fetch_threads = [
+            threading.Thread(target=self._fetch_loop, args=(period,), name=f'{self.name}_fetch_{period}min', daemon=True)
+            for period in self.periods
+        ]
+        self._threads = []
+        for period in self.periods:
+            for index in range(self.decode_workers):
+                self._threads.append(threading.Thread(
+                    target=self._decode_loop, args=(period,),
+                    name=f'{self.name}_decode_{period}min_{index}', daemon=True
+                ))
+        for thread in self._fetch_threads + self._threads:
+            thread.start()
+
+    def _stop_workers(self):
+        """停止拉取线程，解码线程处理完解码队列中的数据后退出"""
+        self._running = False
+        with self._space:
+            self._space.notify_all()
+        if not self._fetch_threads:
+            return
+
+        # 先等拉取线程退出（已取出的数据都放入解码队列），再通知解码线程处理完剩余数据后退出
+        for thread in self._fetch_threads:
+            thread.join(timeout=BAR_CONSUMER_CONFIG['block_timeout'] + 5)
+        for period in self.periods:
+            for _ in range(self.decode_workers):
+                self._queues[period].put(None)
+        for thread in self._threads:
+            thread.join(timeout=30)
+        self._fetch_threads = []
+        self._threads = []
+
+    def get_insert_stats(self) -> dict:
+        """各周期写缓冲的汇总统计（结构与 InsertBuffer.get_stats 相同）"""
+        buffer_stats = [buffer.get_stats() for buffer in self.insert_buffers.values()]
+        stats = {
+            name: sum(item[name] for item in buffer_stats)
+            for name in ('buffered_rows', 'flushed_rows', 'flush_count', 'failed_flushes',
+                         'pending_rows', 'total_flush_latency_ms')
+        }
+        stats['depth'] = {key: value for item in buffer_stats for key, value in item['depth'].items()}
+        stats['last_flush_latency_ms'] = max((item['last_flush_latency_ms'] for item in buffer_stats), default=0.0)
+        stats['max_flush_latency_ms'] = max((item['max_flush_latency_ms'] for item in buffer_stats), default=0.0)
+        stats['avg_flush_latency_ms'] = (
+            stats['total_flush_latency_ms'] / stats['flush_count'] if stats['flush_count'] else 0.0
+        )
+        return stats
+
+    def get_stats(self) -> dict:
+        """各周期的队列深度和工作线程利用率"""
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        result = {}
+        for period in self.periods:
+            with self._lock:
+                stats = dict(self.stats[period])
+            buffer_stats = self.insert_buffers[period].get_stats()
+            result[f'{period}min'] = {
+                'decode_queue': self._queues[period].qsize(),
+                'decode_queue_size': self.queue_size,
+                'insert_pending_rows': buffer_stats['pending_rows'],
+                'insert_pending_limit': self.insert_buffers[period].max_pending_rows,
+                'fetched_rows': stats['fetched_rows'],
+                'decoded_rows': stats['decoded_rows'],
+                'decode_workers': self.decode_workers,
+                # 解码线程用于解码的时间占比 / 因写缓冲已满而阻塞的时间占比
+                'decode_utilization': stats['decode_busy_seconds'] / (elapsed * self.decode_workers),
+                'decode_blocked': stats['blocked_seconds'] / (elapsed * self.decode_workers),
+                # 写入线程执行ClickHouse插入的时间占比
+                'insert_utilization': buffer_stats['total_flush_latency_ms'] / 1000 / elapsed
+            }
+        return result
+
+    def _fetch_loop(self, period: int):
+        """拉取线程：解码队列未满时阻塞等待该周期的Redis队列，取出的一批转移到在途列表后放入解码队列"""
+        block_timeout = BAR_CONSUMER_CONFIG['block_timeout']
+        decode_queue = self._queues[period]
+        while self._running:
+            with self._space:
+                self._space.wait_for(lambda: not self._running or not decode_queue.full(), timeout=block_timeout)
+            # 只有本线程写入该周期的解码队列，检查后放入一批不会阻塞
+            if not self._running or decode_queue.full():
+                continue
+
+            try:
+                inflight_key, payloads = self.redis_manager.claim_bar_batch(
+                    period, f"{self.name}:{int(time.time())}:{next(self._batch_ids)}",
+                    BAR_CONSUMER_CONFIG['batch_size'], timeout=block_timeout
+                )
+            except Exception as e:
+                self.logger.error(f"{self.name} 拉取{period}分钟线数据失败: {e}")
+                time.sleep(block_timeout)
+                continue
+            if not payloads:
+                continue
+
+            decode_queue.put((inflight_key, payloads))
+            with self._lock:
+                self.stats[period]['fetched_rows'] += len(payloads)
+
+    def _decode_loop(self, period: int):
+        """解码线程：解码、校验后交给周期写缓冲，写缓冲满时阻塞"""
+        while True:
+            batch = self._queues[period].get()
+            with self._space:
+                self._space.notify_all()
+            if batch is None:
+                return
+
+            inflight_key, payloads = batch
+            start = time.perf_counter()
+            try:
+                rows = self.decode_func(period, payloads)
+            except Exception as e:
+                # 无法解码的批次不放回队列（放回后会被反复取出），确认后丢弃
+                self.logger.error(f"{self.name} 解码{period}分钟线数据失败，丢弃 {len(payloads)} 条: {e}")
+                rows = []
+            decoded = time.perf_counter()
+
+            # 写入ClickHouse成功后才删除Redis在途列表；没有有效数据的批次立即确认
+            self.insert_buffers[period].add(period, rows, on_flushed=partial(self._confirm, inflight_key))
+            finished = time.perf_counter()
+
+            with self._lock:
+                stats = self.stats[period]
+                stats['decoded_rows'] += len(rows)
+                stats['decode_busy_seconds'] += decoded - start
+                stats['blocked_seconds'] += finished - decoded
+
+    def _confirm(self, inflight_key: str):
+        """在途批次已写入ClickHouse，删除Redis在途列表（失败时在途数据下次启动时放回，由去重令牌避免重复）"""
+        try:
+            self.redis_manager.confirm_bar_batch(inflight_key)
+        except Exception as e:
+            self.logger.error(f"{self.name} 确认在途批次 {inflight_key} 失败: {e}")
@@ -6,11 +6,246 @@
 from datetime import datetime, timedelta
 from typing import List, Dict
 from collections import defaultdict
+import json
+import numpy as np
 from models import TickData, BarData
 from trading_time_validator import TradingTimeValidator
+from config import TRADING_HOURS
 import logging
 
 
+# 列式分钟线数据的列类型（与ClickHouse query_np 返回类型一致）
+BAR_COLUMN_DTYPES = {
+    'symbol': object,
+    'frame': 'datetime64[s]',
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'vol': np.float64,
+    'amount': np.float64
+}
+
+
+def _minute_of_day(time_str: str) -> int:
+    """'HH:MM:SS' 转换为当日分钟数"""
+    hour, minute = time_str.split(':')[:2]
+    return int(hour) * 60 + int(minute)
+
+
+MORNING_START = _minute_of_day(TRADING_HOURS['morning_start'])
+AFTERNOON_START = _minute_of_day(TRADING_HOURS['afternoon_start'])
+SESSION_MINUTES = _minute_of_day(TRADING_HOURS['morning_end']) - MORNING_START
+
+# 重采样周期不小于一个交易日的分钟数时按日聚合（日线）
+DAILY_PERIOD = SESSION_MINUTES + _minute_of_day(TRADING_HOURS['afternoon_end']) - AFTERNOON_START
+
+
+def empty_bar_columns() -> Dict[str, np.ndarray]:
+    """空的列式分钟线数据"""
+    return {name: np.array([], dtype=dtype) for name, dtype in BAR_COLUMN_DTYPES.items()}
+
+
+def bars_to_columns(bars: List[BarData]) -> Dict[str, np.ndarray]:
+    """BarData列表转换为列式数据"""
+    return {
+        name: np.array([getattr(bar, name) for bar in bars], dtype=dtype)
+        for name, dtype in BAR_COLUMN_DTYPES.items()
+    }
+
+
+def payloads_to_columns(payloads: List[str]) -> Dict[str, np.ndarray]:
+    """
+    分钟线JSON字符串列表转换为列式数据（不构造BarData）
+
+    JSON拼成一个数组一次解析；其中有无法解析的数据时逐条解析并跳过。
+    整批转换列类型失败（缺少字段或字段值无法转换）时逐条检查，只跳过有问题的数据，不影响同批其他数据。
+    """
+    if not payloads:
+        return empty_bar_columns()
+
+    try:
+        items = json.loads('[' + ','.join(payloads) + ']')
+    except ValueError:
+        items = []
+        for data in payloads:
+            try:
+                items.append(json.loads(data))
+            except ValueError as e:
+                logging.getLogger(__name__).error(f"解析分钟线数据失败: {e}")
+
+    try:
+        return _items_to_columns(items)
+    except (KeyError, TypeError, ValueError):
+        valid_items = [item for item in items if _is_valid_bar_item(item)]
+        logging.getLogger(__name__).error(f"跳过 {len(items) - len(valid_items)} 条字段缺失或格式错误的分钟线数据")
+        return _items_to_columns(valid_items)
+
+
+def _items_to_columns(items: List[dict]) -> Dict[str, np.ndarray]:
+    return {
+        name: np.array([item[name] for item in items], dtype=dtype)
+        for name, dtype in BAR_COLUMN_DTYPES.items()
+    }
+
+
+def _is_valid_bar_item(item) -> bool:
+    """单条分钟线是否包含全部字段且能转换为列类型"""
+    try:
+        _items_to_columns([item])
+        return True
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def session_bucket(frames: np.ndarray, period: int) -> np.ndarray:
+    """
+    按交易时段对齐的N分钟周期起点（与ClickHouse中的session_bucket_expr规则一致）
+
+    period不小于 DAILY_PERIOD 时返回当日零点（日线）。
+    """
+    frames = frames.astype('datetime64[s]')
+    days = frames.astype('datetime64[D]').astype('datetime64[s]')
+    if period >= DAILY_PERIOD:
+        return days
+
+    minutes = (frames - days).astype(np.int64) // 60
+    session_start = np.where(minutes < AFTERNOON_START, MORNING_START, AFTERNOON_START)
+    offset = np.minimum(minutes - session_start, SESSION_MINUTES - 1)
+    return days + ((session_start + offset // period * period) * 60).astype('timedelta64[s]')
+
+
+def resample_bar_columns(columns: Dict[str, np.ndarray], period: int) -> Dict[str, np.ndarray]:
+    """
+    列式分钟线重采样为N分钟周期（向量化，结果与ClickHouse重采样查询一致）
+
+    输入需按 (symbol, frame) 或单只股票按frame排序。
+    """
+    if not len(columns['frame']):
+        return empty_bar_columns()
+
+    buckets = session_bucket(columns['frame'], period)
+    symbols = columns['symbol']
+
+    # 周期起点或股票变化的位置为新K线的起点
+    starts = np.ones(len(buckets), dtype=bool)
+    starts[1:] = (buckets[1:] != buckets[:-1]) | (symbols[1:] != symbols[:-1])
+    first = np.flatnonzero(starts)
+    last = np.append(first[1:], len(buckets)) - 1
+
+    return {
+        'symbol': symbols[first],
+        'frame': buckets[first],
+        'open': columns['open'][first],
+        'high': np.maximum.reduceat(columns['high'], first),
+        'low': np.minimum.reduceat(columns['low'], first),
+        'close': columns['close'][last],
+        'vol': np.add.reduceat(columns['vol'], first),
+        'amount': np.add.reduceat(columns['amount'], first)
+    }
+
+
+# 复权方式：qfq 前复权（以最新复权因子为基准），hfq 后复权
+ADJUST_TYPES = ('qfq', 'hfq')
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+
+def adjust_bar_columns(columns: Dict[str, np.ndarray], factors: Dict[str, np.ndarray],
+                       adjust: str) -> Dict[str, np.ndarray]:
+    """
+    按日线复权因子调整列式分钟线价格（向量化）
+
+    每根分钟线使用其所属股票在该日期或之前最近一个交易日的复权因子（当日因子尚未入库时沿用前一日），
+    该日期之前没有因子时使用该股票最早的因子。后复权价格 = 价格 × 因子；
+    前复权价格 = 价格 × 因子 / 该股票最新的因子。
+
+    Args:
+        columns: 列式分钟线（可包含多只股票）
+        factors: 复权因子 {'symbol', 'frame', 'adjust'}
+        adjust: 'qfq' 或 'hfq'
+    """
+    if adjust not in ADJUST_TYPES:
+        raise ValueError(f"不支持的复权方式: {adjust}")
+
+    count = len(columns['frame'])
+    if not count or not len(factors['frame']):
+        return columns
+
+    # 股票代码编码为整数，与日期组合成可二分查找的键
+    _, codes = np.unique(
+        np.concatenate([columns['symbol'], factors['symbol']]).astype(str), return_inverse=True
+    )
+    codes = codes.astype(np.int64)
+    bar_codes, factor_codes = codes[:count], codes[count:]
+    bar_keys = (bar_codes << 32) + columns['frame'].astype('datetime64[D]').astype(np.int64)
+    factor_keys = (factor_codes << 32) + factors['frame'].astype('datetime64[D]').astype(np.int64)
+
+    order = np.argsort(factor_keys, kind='stable')
+    factor_keys, factor_codes = factor_keys[order], factor_codes[order]
+    values = np.asarray(factors['adjust'], dtype=np.float64)[order]
+    last_index = len(factor_keys) - 1
+
+    # 当日或之前最近的因子
+    prev = np.clip(np.searchsorted(factor_keys, bar_keys, side='right') - 1, 0, last_index)
+    # 该股票最早和最新的因子
+    first = np.clip(np.searchsorted(factor_keys, bar_codes << 32, side='left'), 0, last_index)
+    latest = np.clip(np.searchsorted(factor_keys, (bar_codes + 1) << 32, side='left') - 1, 0, last_index)
+
+    has_factor = factor_codes[first] == bar_codes
+    factor = np.where(
+        (factor_codes[prev] == bar_codes) & (factor_keys[prev] <= bar_keys), values[prev],
+        np.where(has_factor, values[first], 1.0)
+    )
+    if adjust == 'qfq':
+        factor = factor / np.where(has_factor, values[latest], 1.0)
+
+    result = dict(columns)
+    for name in PRICE_COLUMNS:
+        result[name] = columns[name] * factor
+    return result
+
+
+def downsample_bar_columns(columns: Dict[str, np.ndarray], max_points: int) -> Dict[str, np.ndarray]:
+    """
+    把列式分钟线按区间合并到不超过 max_points 根（用于图表展示，向量化）
+
+    相邻K线均匀分成 max_points 个区间，每个区间保留第一根的时间和开盘价、最后一根的收盘价、
+    区间最高价和最低价，成交量和成交额求和，走势的高低点不会因为抽样丢失。
+    """
+    count = len(columns['frame'])
+    if not max_points or count <= max_points:
+        return columns
+
+    first = np.linspace(0, count, int(max_points), endpoint=False).astype(np.int64)
+    last = np.append(first[1:], count) - 1
+
+    return {
+        'symbol': columns['symbol'][first],
+        'frame': columns['frame'][first],
+        'open': columns['open'][first],
+        'high': np.maximum.reduceat(columns['high'], first),
+        'low': np.minimum.reduceat(columns['low'], first),
+        'close': columns['close'][last],
+        'vol': np.add.reduceat(columns['vol'], first),
+        'amount': np.add.reduceat(columns['amount'], first)
+    }
+
+
+def columns_to_json(columns: Dict[str, np.ndarray], include_symbol: bool = False) -> Dict[str, list]:
+    """
+    列式数据转换为可JSON序列化的列
+
+    时间列输出为不带时区的ISO字符串（与BarData.frame.isoformat()一致）；
+    单股票结果的symbol由响应中的symbol字段给出，截面结果需要 include_symbol=True。
+    """
+    result = {'frame': np.datetime_as_string(columns['frame'], unit='s').tolist()}
+    if include_symbol:
+        result['symbol'] = columns['symbol'].tolist()
+    for name in ('open', 'high', 'low', 'close', 'vol', 'amount'):
+        result[name] = columns[name].tolist()
+    return result
+
+
 class BarDataSynthesizer:
     """分钟线数据合成器"""
 
@@ -242,18 +477,98 @@ class DataMerger:
 
     @staticmethod
     def merge_bar_data(redis_data: List[BarData], clickhouse_data: List[BarData]) -> List[BarData]:
-        """合并分钟线数据"""
-        # 合并数据并按时间排序
-        all_data = redis_data + clickhouse_data
+        """
+        合并分钟线数据
+
+        两个来源都已按时间排序，各自去重后双指针线性归并；(symbol, frame)重复时保留ClickHouse的数据。
+        """
+        redis_data = DataMerger._unique_bars(redis_data)
+        clickhouse_data = DataMerger._unique_bars(clickhouse_data)
+        merged_data = []
+        i = j = 0
+        while i < len(redis_data) or j < len(clickhouse_data):
+            if j == len(clickhouse_data) or (i < len(redis_data) and redis_data[i].frame < clickhouse_data[j].frame):
+                merged_data.append(redis_data[i])
+                i += 1
+                continue
+            if i == len(redis_data) or clickhouse_data[j].frame < redis_data[i].frame:
+                merged_data.append(clickhouse_data[j])
+                j += 1
+                continue
+
+            # 同一时间点：ClickHouse数据全部保留，Redis中只保留ClickHouse没有的股票
+            frame = clickhouse_data[j].frame
+            clickhouse_symbols = set()
+            while j < len(clickhouse_data) and clickhouse_data[j].frame == frame:
+                clickhouse_symbols.add(clickhouse_data[j].symbol)
+                merged_data.append(clickhouse_data[j])
+                j += 1
+            while i < len(redis_data) and redis_data[i].frame == frame:
+                if redis_data[i].symbol not in clickhouse_symbols:
+                    merged_data.append(redis_data[i])
+                i += 1
 
-        # 去重（以frame和symbol为键）
-        unique_data = {}
-        for bar in all_data:
-            key = (bar.symbol, bar.frame)
-            unique_data[key] = bar
+        return merged_data
 
-        # 按时间排序
-        merged_data = list(unique_data.values())
-        merged_data.sort(key=lambda x: x.frame)
+    @staticmethod
+    def merge_bar_columns(redis_columns: Dict[str, np.ndarray],
+                          clickhouse_columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        合并单只股票的列式分钟线数据
+
+        两个来源都已按frame排序，不再整体排序：去掉Redis中ClickHouse已有的frame后，
+        用二分查找计算Redis数据在结果中的位置，一次写入。重复时保留ClickHouse的数据。
+        """
+        redis_columns = DataMerger._unique_frames(redis_columns)
+        clickhouse_columns = DataMerger._unique_frames(clickhouse_columns)
+        redis_frames = redis_columns['frame']
+        clickhouse_frames = clickhouse_columns['frame']
+
+        # 去掉与ClickHouse重复的frame
+        index = np.searchsorted(clickhouse_frames, redis_frames)
+        duplicated = np.zeros(len(redis_frames), dtype=bool)
+        in_range = index < len(clickhouse_frames)
+        duplicated[in_range] = clickhouse_frames[index[in_range]] == redis_frames[in_range]
+        keep = ~duplicated
+
+        # Redis数据在结果中的位置 = 前面的ClickHouse行数 + 前面的Redis行数
+        redis_positions = index[keep] + np.arange(keep.sum())
+        total = len(clickhouse_frames) + len(redis_positions)
+        from_redis = np.zeros(total, dtype=bool)
+        from_redis[redis_positions] = True
+
+        merged = {}
+        for name, dtype in BAR_COLUMN_DTYPES.items():
+            values = np.empty(total, dtype=dtype)
+            values[from_redis] = redis_columns[name][keep]
+            values[~from_redis] = clickhouse_columns[name]
+            merged[name] = values
+        return merged
 
-        return merged_data
+    @staticmethod
+    def _unique_bars(bars: List[BarData]) -> List[BarData]:
+        """按frame有序的分钟线去重（同一(symbol, frame)保留最后一条）"""
+        unique_bars = []
+        start = 0
+        while start < len(bars):
+            frame = bars[start].frame
+            latest = {}
+            end = start
+            while end < len(bars) and bars[end].frame == frame:
+                latest[bars[end].symbol] = bars[end]
+                end += 1
+            unique_bars.extend(latest.values())
+            start = end
+        return unique_bars
+
+    @staticmethod
+    def _unique_frames(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """按frame有序的列式数据去重（重复时保留最后一行）"""
+        frames = columns['frame']
+        if len(frames) < 2:
+            return columns
+        keep = np.ones(len(frames), dtype=bool)
+        keep[:-1] = frames[1:] != frames[:-1]
+        if keep.all():
+            return columns
+        return {name: values[keep] for name, values in columns.items()}
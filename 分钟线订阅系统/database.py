@@ -4,15 +4,245 @@
 """
 import redis
 import clickhouse_connect
+from clickhouse_connect import common as clickhouse_common
+from clickhouse_connect.driver import httputil
+import numpy as np
+import hashlib
 import json
-from datetime import datetime
-from typing import List, Optional
-from config import REDIS_CONFIG, CLICKHOUSE_CONFIG, REDIS_QUEUES, CLICKHOUSE_TABLES
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config import (REDIS_CONFIG, CLICKHOUSE_CONFIG, REDIS_QUEUES, CLICKHOUSE_TABLES,
+                    CLICKHOUSE_SCHEMA_VERSION, CLICKHOUSE_FINAL_CHECK_TTL, BAR_PERIODS, BAR_ROLLUP_ENABLED,
+                    INSERT_BUFFER_CONFIG, CROSS_SECTION_ENABLED, CLICKHOUSE_POOL_CONFIG,
+                    STREAM_PAGE_ROWS, LIVE_PUSH_CONFIG, DAY_BAR_TABLE)
 from models import BarData, TickData
+from data_processor import (empty_bar_columns, payloads_to_columns, MORNING_START,
+                            AFTERNOON_START, SESSION_MINUTES, DAILY_PERIOD)
 from trading_time_validator import TradingTimeValidator
+from symbol_registry import SYMBOLS_ALL_KEY, symbols_day_key
 import logging
 
 
+# 分钟线表结构定义（按版本）
+BAR_TABLE_DDL = {
+    # v1: 原始表结构
+    'v1': """
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        symbol String,
+        frame DateTime,
+        open Float64,
+        high Float64,
+        low Float64,
+        close Float64,
+        vol Float64,
+        amount Float64
+    ) ENGINE = MergeTree()
+    ORDER BY (symbol, frame)
+    """,
+    # v2: 低基数symbol + 列压缩编码 + 按月分区
+    # ReplacingMergeTree按version保留最新一行，重复补数在后台合并时去重；
+    # non_replicated_deduplication_window 使带去重令牌的重试插入直接被丢弃
+    'v2': """
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        symbol LowCardinality(String),
+        frame DateTime CODEC(DoubleDelta, ZSTD(1)),
+        open Float64 CODEC(Gorilla, ZSTD(1)),
+        high Float64 CODEC(Gorilla, ZSTD(1)),
+        low Float64 CODEC(Gorilla, ZSTD(1)),
+        close Float64 CODEC(Gorilla, ZSTD(1)),
+        vol Float64 CODEC(ZSTD(1)),
+        amount Float64 CODEC(ZSTD(1)),
+        version UInt64 DEFAULT toUnixTimestamp64Milli(now64()) CODEC(Delta, ZSTD(1))
+    ) ENGINE = ReplacingMergeTree(version)
+    PARTITION BY toYYYYMM(frame)
+    ORDER BY (symbol, frame)
+    SETTINGS non_replicated_deduplication_window = 10000
+    """
+}
+
+BAR_COLUMNS = ['symbol', 'frame', 'open', 'high', 'low', 'close', 'vol', 'amount']
+
+# 高周期聚合表：由1分钟线物化视图写入
+# bars 保存周期内每一分钟最新版本的1分钟线：{分钟: (version, open, high, low, close, vol, amount)}，
+# maxMap按元组比较，同一分钟保留version最大的一行。与ReplacingMergeTree源表语义一致：
+# 同一批数据以不同去重令牌重复写入时成交量不会重复累加，修正后的数据替换旧值
+ROLLUP_BAR_TYPE = 'Map(DateTime, Tuple(UInt64, Float64, Float64, Float64, Float64, Float64, Float64))'
+
+ROLLUP_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS {table_name} (
+    symbol LowCardinality(String),
+    frame DateTime CODEC(DoubleDelta, ZSTD(1)),
+    bars AggregateFunction(maxMap, """ + ROLLUP_BAR_TYPE + """)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(frame)
+ORDER BY (symbol, frame)
+SETTINGS non_replicated_deduplication_window = 10000
+"""
+
+# 任意周期重采样查询：由1分钟线在查询时聚合，不需要额外的表
+# 子查询中重命名源列，避免 frame 别名与聚合函数参数互相覆盖
+RESAMPLE_SELECT_SQL = """
+SELECT
+    symbol,
+    {bucket} AS frame,
+    argMin(o, ts) AS open,
+    max(h) AS high,
+    min(l) AS low,
+    argMax(c, ts) AS close,
+    sum(v) AS vol,
+    sum(a) AS amount
+FROM (
+    SELECT symbol, frame AS ts, open AS o, high AS h, low AS l, close AS c, vol AS v, amount AS a
+    FROM {source} {final}
+    WHERE {symbol_condition}
+    AND frame >= %(start_time)s
+    AND frame <= %(end_time)s
+)
+GROUP BY symbol, frame
+ORDER BY {order_by}
+"""
+
+# 1分钟线 → 高周期聚合状态（物化视图与回填共用）
+# 子查询中重命名源列，避免 frame 别名与聚合函数参数互相覆盖
+ROLLUP_SELECT_SQL = """
+SELECT
+    symbol,
+    {bucket} AS frame,
+    maxMapState(map(ts, (ver, o, h, l, c, v, a))) AS bars
+FROM (
+    SELECT symbol, frame AS ts, toUInt64({version}) AS ver,
+           toFloat64(open) AS o, toFloat64(high) AS h, toFloat64(low) AS l, toFloat64(close) AS c,
+           toFloat64(vol) AS v, toFloat64(amount) AS a
+    FROM {source}
+)
+GROUP BY symbol, frame
+"""
+
+# 聚合表查询：合并各分钟的最新行后计算开高低收量额
+ROLLUP_QUERY_SQL = """
+SELECT
+    symbol,
+    frame,
+    tupleElement(bars[arrayMin(mapKeys(bars))], 2) AS open,
+    arrayMax(arrayMap(bar -> tupleElement(bar, 3), mapValues(bars))) AS high,
+    arrayMin(arrayMap(bar -> tupleElement(bar, 4), mapValues(bars))) AS low,
+    tupleElement(bars[arrayMax(mapKeys(bars))], 5) AS close,
+    arraySum(arrayMap(bar -> tupleElement(bar, 6), mapValues(bars))) AS vol,
+    arraySum(arrayMap(bar -> tupleElement(bar, 7), mapValues(bars))) AS amount
+FROM (
+    SELECT symbol, frame, maxMapMerge(bars) AS bars
+    FROM {table}
+    WHERE {symbol_condition}
+    AND frame >= %(start_time)s
+    AND frame <= %(end_time)s
+    GROUP BY symbol, frame
+)
+ORDER BY {order_by}
+"""
+
+
+def session_bucket_expr(column: str, period: int) -> str:
+    """
+    生成按交易时段对齐的N分钟周期起点表达式
+
+    周期从每个交易时段开盘（09:30 / 13:00）起算，收盘那一分钟（11:30 / 15:00）
+    并入时段最后一个周期，不会单独形成一根K线。
+    """
+    minute = f"(toHour({column}) * 60 + toMinute({column}))"
+    session_start = f"if({minute} < {AFTERNOON_START}, {MORNING_START}, {AFTERNOON_START})"
+    offset = f"least({minute} - {session_start}, {SESSION_MINUTES - 1})"
+    return f"toStartOfDay({column}) + ({session_start} + intDiv({offset}, {period}) * {period}) * 60"
+
+
+def resample_bucket_expr(column: str, period: int) -> str:
+    """
+    重采样周期起点表达式：period为 DAILY_PERIOD 时按自然日聚合（日线），
+    其余按交易时段对齐（见session_bucket_expr）
+    """
+    if period >= DAILY_PERIOD:
+        return f"toStartOfDay({column})"
+    return session_bucket_expr(column, period)
+
+
+def rollup_select_sql(period: int, source: str) -> str:
+    """1分钟线 → period周期聚合状态的查询语句（v1表没有version列，按0处理）"""
+    return ROLLUP_SELECT_SQL.format(
+        bucket=session_bucket_expr('ts', period),
+        source=source,
+        version='version' if CLICKHOUSE_SCHEMA_VERSION == 'v2' else '0'
+    )
+
+
+def rollup_table_name(period: int) -> str:
+    """高周期聚合表名"""
+    return f"{CLICKHOUSE_TABLES[f'data_bar_for_{period}min']}_agg"
+
+
+def is_rollup_period(period: int) -> bool:
+    """该周期是否由1分钟线服务端聚合"""
+    return BAR_ROLLUP_ENABLED and period != 1
+
+
+def cross_section_table_name(table_name: str) -> str:
+    """按 (frame, symbol) 排序的截面查询副本表名"""
+    return f"{table_name}_by_frame"
+
+
+def order_by_frame(create_sql: str) -> str:
+    """将建表语句的排序键改为 (frame, symbol)"""
+    return create_sql.replace('ORDER BY (symbol, frame)', 'ORDER BY (frame, symbol)')
+
+
+# 多股票查询时，股票数不少于该值且时间跨度不超过 CROSS_SECTION_MAX_SPAN 时改读截面副本表
+CROSS_SECTION_MIN_SYMBOLS = 50
+CROSS_SECTION_MAX_SPAN = timedelta(days=1)
+
+# 夜间加载的在途批次：{在途列表键: 来源队列}，写入ClickHouse确认后删除
+BAR_INFLIGHT_KEY = 'bar_loader:inflight'
+
+# 从队尾（最早的数据）原子转移最多ARGV[1]条到在途列表并登记
+# KEYS: 队列, 在途列表, 在途登记表；分段RPUSH避免unpack参数过多
+CLAIM_BAR_BATCH_LUA = """
+local count = tonumber(ARGV[1])
+local items = redis.call('LRANGE', KEYS[1], -count, -1)
+if #items == 0 then
+    return items
+end
+redis.call('LTRIM', KEYS[1], 0, -count - 1)
+for i = 1, #items, 5000 do
+    redis.call('RPUSH', KEYS[2], unpack(items, i, math.min(i + 4999, #items)))
+end
+redis.call('HSET', KEYS[3], KEYS[2], KEYS[1])
+return items
+"""
+
+# 在途列表放回来源队列的队尾（下次最先取出）并删除登记
+# KEYS: 在途列表, 队列, 在途登记表
+RELEASE_BAR_BATCH_LUA = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = 1, #items, 5000 do
+    redis.call('RPUSH', KEYS[2], unpack(items, i, math.min(i + 4999, #items)))
+end
+redis.call('DEL', KEYS[1])
+redis.call('HDEL', KEYS[3], KEYS[1])
+return #items
+"""
+
+
+def bar_dedup_token(table_name: str, rows: list) -> str:
+    """
+    生成一次插入批次的去重令牌
+
+    令牌包含行内容摘要：完全相同的重试批次会被ClickHouse丢弃，
+    而修正后的数据内容不同，仍会正常写入并由ReplacingMergeTree按version替换旧行。
+    """
+    digest = hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+    return f"{table_name}:{digest}"
+
+
 class RedisManager:
     """Redis连接管理器"""
 
@@ -20,6 +250,8 @@ class RedisManager:
         self.client = redis.Redis(**REDIS_CONFIG)
         self.trading_validator = TradingTimeValidator()
         self.logger = logging.getLogger(__name__)
+        self._claim_script = self.client.register_script(CLAIM_BAR_BATCH_LUA)
+        self._release_script = self.client.register_script(RELEASE_BAR_BATCH_LUA)
 
     def publish_tick_data(self, tick_data: TickData):
         """发布分笔数据到Redis"""
@@ -53,16 +285,31 @@ class RedisManager:
 
         data = bar_data.model_dump_json()
 
+        pipe = self.client.pipeline(transaction=False)
+        # 股票代码注册表：按K线日期加入当日集合
+        day_key = symbols_day_key(bar_data.frame)
+        pipe.sadd(day_key, bar_data.symbol)
+        pipe.expire(day_key, 7 * 86400)
+
         if is_historical:
             # 历史数据：发布到队列供Mac端消费存储到ClickHouse
-            queue_name = f"bar_data_{period}min"
-            self.client.lpush(REDIS_QUEUES[queue_name], data)
+            # 开启服务端聚合时高周期由1分钟线生成，Mac端不消费这些队列，不再发布
+            if not is_rollup_period(period):
+                pipe.lpush(REDIS_QUEUES[f"bar_data_{period}min"], data)
+            pipe.execute()
         else:
             # 当日合成数据：存储在Redis中（用于实时查询）
             current_data_key = f"current_bar_data_{period}min"
-            self.client.lpush(current_data_key, data)
+            pipe.lpush(current_data_key, data)
             # 设置过期时间为第二天凌晨3点
-            self.client.expire(current_data_key, 86400)  # 24小时
+            pipe.expire(current_data_key, 86400)  # 24小时
+            # 每只股票的最新K线（市场快照一次HGETALL即可取回）
+            latest_key = f"latest_bar_{period}min"
+            pipe.hset(latest_key, bar_data.symbol, data)
+            pipe.expire(latest_key, 86400)
+            # 通知各服务的WebSocket推送
+            pipe.publish(LIVE_PUSH_CONFIG['channel'], f'{{"type": "bar", "period": {period}, "data": {data}}}')
+            pipe.execute()
 
     def consume_tick_data(self, timeout: int = 1) -> Optional[TickData]:
         """消费分笔数据"""
@@ -81,6 +328,73 @@ class RedisManager:
             return BarData(**data)
         return None
 
+    def claim_bar_batch(self, period: int, batch_id: str, max_count: int, timeout: int = None) -> tuple:
+        """
+        取出一批分钟线原始数据并保留在在途列表中（实时消费和夜间加载共用）
+
+        数据写入ClickHouse后调用 confirm_bar_batch 删除，失败时调用 release_bar_batch 放回队列；
+        进程中断遗留的在途批次由 release_all_bar_batches 放回。
+        batch_id 以组件名开头（如 "mac_consumer:..."），各组件只放回自己遗留的批次。
+
+        Args:
+            timeout: 指定时队列为空则阻塞等待（BLMOVE原子转移第一条到在途列表），有数据立即返回；
+                     超时无数据时返回空列表
+
+        Returns:
+            (在途列表键, 按入队顺序排列的JSON字符串列表)
+        """
+        queue_name = REDIS_QUEUES[f"bar_data_{period}min"]
+        inflight_key = f"{queue_name}:inflight:{batch_id}"
+        first = []
+        if timeout is not None:
+            # 先登记再转移，进程在两步之间中断时在途数据也能被 release_all_bar_batches 放回
+            self.client.hset(BAR_INFLIGHT_KEY, inflight_key, queue_name)
+            item = self.client.blmove(queue_name, inflight_key, timeout, 'RIGHT', 'RIGHT')
+            if item is None:
+                self.client.hdel(BAR_INFLIGHT_KEY, inflight_key)
+                return inflight_key, []
+            first, max_count = [item], max_count - 1
+        items = self._claim_script(keys=[queue_name, inflight_key, BAR_INFLIGHT_KEY], args=[max_count]) if max_count > 0 else []
+        return inflight_key, first + list(reversed(items))
+
+    def confirm_bar_batch(self, inflight_key: str):
+        """在途批次已写入ClickHouse，删除在途列表"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(inflight_key)
+        pipe.hdel(BAR_INFLIGHT_KEY, inflight_key)
+        pipe.execute()
+
+    def release_bar_batch(self, inflight_key: str, queue_name: str = None) -> int:
+        """在途批次放回来源队列，返回放回的条数"""
+        queue_name = queue_name or self.client.hget(BAR_INFLIGHT_KEY, inflight_key)
+        if not queue_name:
+            return 0
+        return self._release_script(keys=[inflight_key, queue_name, BAR_INFLIGHT_KEY])
+
+    def release_all_bar_batches(self, owner: str = None) -> int:
+        """
+        把上次中断遗留的在途批次放回来源队列，返回放回的条数
+
+        Args:
+            owner: 指定时只放回批次号以 "{owner}:" 开头的在途批次（该组件自己遗留的批次），
+                   不动其他组件仍在处理中的批次；不指定时放回全部（只在服务启动时调用）
+        """
+        return sum(
+            self.release_bar_batch(inflight_key, queue_name)
+            for inflight_key, queue_name in self.client.hgetall(BAR_INFLIGHT_KEY).items()
+            if owner is None or inflight_key.split(':inflight:', 1)[-1].startswith(f"{owner}:")
+        )
+
+    def decode_bar_payloads(self, payloads: List[str]) -> List[BarData]:
+        """解码claim_bar_batch取出的JSON字符串，跳过无法解析的数据"""
+        bars = []
+        for data in payloads:
+            try:
+                bars.append(BarData(**json.loads(data)))
+            except Exception as e:
+                self.logger.error(f"解析分钟线数据失败: {e}")
+        return bars
+
     def get_current_bar_data(self, period: int, symbol: str = None) -> List[BarData]:
         """获取当日分钟线数据（从Redis当日数据存储中获取）"""
         current_data_key = f"current_bar_data_{period}min"
@@ -101,11 +415,95 @@ class RedisManager:
         sorted_bars = sorted(bars, key=lambda x: x.frame)
         return sorted_bars
 
+    def get_current_bars_by_symbol(self, periods: List[int], symbols: List[str] = None) -> Dict[int, Dict[str, List[BarData]]]:
+        """
+        批量获取多个周期、多只股票的当日分钟线数据
+
+        所有周期的LRANGE在一个pipeline中完成；先按symbol过滤原始JSON再构造BarData。
+
+        Returns:
+            {周期: {symbol: 按时间排序的BarData列表}}
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for period in periods:
+            pipe.lrange(f"current_bar_data_{period}min", 0, -1)
+
+        symbol_set = set(symbols) if symbols else None
+        result = {}
+        for period, data_list in zip(periods, pipe.execute()):
+            grouped = defaultdict(list)
+            for data in data_list:
+                try:
+                    item = json.loads(data)
+                    if symbol_set is None or item.get('symbol') in symbol_set:
+                        grouped[item['symbol']].append(BarData(**item))
+                except Exception as e:
+                    self.logger.error(f"解析当日数据失败: {e}")
+                    continue
+
+            for bars in grouped.values():
+                bars.sort(key=lambda x: x.frame)
+            result[period] = dict(grouped)
+
+        return result
+
+    def get_current_bar_columns(self, period: int, symbols: List[str] = None,
+                                start_time: datetime = None, end_time: datetime = None) -> Dict[str, np.ndarray]:
+        """
+        获取当日分钟线数据（列式，按 (symbol, frame) 排序）
+
+        一次LRANGE取出原始JSON批量解析，不逐行构造BarData；按股票和时间范围过滤后返回。
+        """
+        values = self.client.lrange(f"current_bar_data_{period}min", 0, -1)
+        if not values:
+            return empty_bar_columns()
+
+        columns = payloads_to_columns(values)
+        mask = np.ones(len(columns['frame']), dtype=bool)
+        if symbols:
+            mask &= np.isin(columns['symbol'], list(symbols))
+        if start_time is not None:
+            mask &= columns['frame'] >= np.datetime64(start_time, 's')
+        if end_time is not None:
+            mask &= columns['frame'] <= np.datetime64(end_time, 's')
+        order = np.flatnonzero(mask)
+        order = order[np.lexsort((columns['frame'][order], columns['symbol'][order]))]
+        return {name: values[order] for name, values in columns.items()}
+
+    def get_latest_snapshot(self, period: int, symbols: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        获取全市场（或指定股票）当日最新一根分钟线（列式，按symbol排序）
+
+        全市场一次HGETALL，指定股票一次HMGET；JSON拼成一个数组一次解析。
+        """
+        latest_key = f"latest_bar_{period}min"
+        if symbols:
+            values = [value for value in self.client.hmget(latest_key, symbols) if value]
+        else:
+            values = list(self.client.hgetall(latest_key).values())
+
+        if not values:
+            return empty_bar_columns()
+
+        columns = payloads_to_columns(values)
+        order = np.argsort(columns['symbol'], kind='stable')
+        return {name: values[order] for name, values in columns.items()}
+
+    def register_symbols(self, symbols):
+        """把已写入ClickHouse的股票代码加入注册表（Mac端入库后调用）"""
+        symbols = set(symbols)
+        if symbols:
+            self.client.sadd(SYMBOLS_ALL_KEY, *symbols)
+
     def clear_all_queues(self):
         """清空所有队列"""
         for queue_name in REDIS_QUEUES.values():
             self.client.delete(queue_name)
 
+    def clear_queue(self, queue_name: str):
+        """清空指定队列"""
+        self.client.delete(queue_name)
+
     def get_queue_length(self, queue_name: str) -> int:
         """获取队列长度"""
         return self.client.llen(queue_name)
@@ -119,34 +517,326 @@ class RedisManager:
 
 
 class ClickHouseManager:
-    """ClickHouse连接管理器"""
+    """
+    ClickHouse连接管理器
+
+    底层HTTP连接来自大小可配置的连接池，并开启LZ4传输压缩；
+    不使用自动生成的session，同一实例上的并发查询各自占用池中的连接并行执行。
+    进程内请通过 get_clickhouse_manager() 获取共享实例。
+    """
 
     def __init__(self):
-        self.client = clickhouse_connect.get_client(**CLICKHOUSE_CONFIG)
+        # 带session的客户端不允许并发查询，共享实例必须关闭自动session
+        clickhouse_common.set_setting('autogenerate_session_id', False)
+        self.client = clickhouse_connect.get_client(
+            **CLICKHOUSE_CONFIG,
+            compress=CLICKHOUSE_POOL_CONFIG['compress'],
+            connect_timeout=CLICKHOUSE_POOL_CONFIG['connect_timeout'],
+            send_receive_timeout=CLICKHOUSE_POOL_CONFIG['send_receive_timeout'],
+            pool_mgr=httputil.get_pool_manager(
+                maxsize=CLICKHOUSE_POOL_CONFIG['maxsize'],
+                num_pools=1,
+                block=True
+            )
+        )
         self.trading_validator = TradingTimeValidator()
         self.logger = logging.getLogger(__name__)
+        # (表名, 月分区) -> (过期时间, 是否需要FINAL)
+        self._final_cache = {}
+        self._final_cache_lock = threading.Lock()
         self._create_tables()
 
     def _create_tables(self):
         """创建ClickHouse表"""
         for table_name in CLICKHOUSE_TABLES.values():
-            create_sql = f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                symbol String,
-                frame DateTime,
-                open Float64,
-                high Float64,
-                low Float64,
-                close Float64,
-                vol Float64,
-                amount Float64
-            ) ENGINE = MergeTree()
-            ORDER BY (symbol, frame)
-            """
-            self.client.command(create_sql)
+            self.client.command(self._build_create_sql(table_name, CLICKHOUSE_SCHEMA_VERSION))
+
+        if BAR_ROLLUP_ENABLED:
+            self._create_rollups()
+
+        if CROSS_SECTION_ENABLED:
+            self._create_cross_section_tables()
+
+    def _create_rollups(self):
+        """创建高周期聚合表和1分钟线物化视图"""
+        source_table = CLICKHOUSE_TABLES['data_bar_for_1min']
+        for period in BAR_PERIODS:
+            if period == 1:
+                continue
+
+            agg_table = rollup_table_name(period)
+            self._drop_outdated_rollup(agg_table)
+            self.client.command(ROLLUP_TABLE_DDL.format(table_name=agg_table))
+            self.client.command(
+                f"CREATE MATERIALIZED VIEW IF NOT EXISTS {agg_table}_mv TO {agg_table} AS "
+                + rollup_select_sql(period, source_table)
+            )
+
+    def _drop_outdated_rollup(self, agg_table: str):
+        """
+        删除旧结构（按字段累加状态）的聚合表及其物化视图
+
+        旧结构在重复写入时会重复累加成交量，删除后按新结构重建，需执行 backfill_rollups 回填历史数据。
+        """
+        result = self.client.query(
+            "SELECT groupArray(name) FROM system.columns "
+            "WHERE database = currentDatabase() AND table = %(table)s",
+            {'table': agg_table}
+        )
+        columns = result.result_rows[0][0] if result.result_rows else []
+        if not columns or 'bars' in columns:
+            return
+
+        self.client.command(f"DROP VIEW IF EXISTS {agg_table}_mv")
+        self.client.command(f"DROP TABLE IF EXISTS {agg_table}")
+        self.logger.warning(f"聚合表 {agg_table} 为旧结构，已删除重建，请执行 backfill_rollups 回填历史数据")
+
+    def backfill_rollups(self, periods: List[int] = None) -> dict:
+        """
+        由已入库的1分钟线按月分区重建高周期聚合表
+
+        每个月先清空聚合表分区再整月重算，可重复执行；
+        清空期间该月的实时写入会丢失，请在非交易时段执行。
+
+        Args:
+            periods: 需要回填的周期，默认全部高周期
+
+        Returns:
+            dict: 每个聚合表回填的月份数
+        """
+        self._create_rollups()
+
+        source_table = CLICKHOUSE_TABLES['data_bar_for_1min']
+        final_clause = 'FINAL' if CLICKHOUSE_SCHEMA_VERSION == 'v2' else ''
+        months = [row[0] for row in self.client.query(
+            f"SELECT DISTINCT toYYYYMM(frame) AS month FROM {source_table} ORDER BY month"
+        ).result_rows]
+
+        summary = {}
+        for period in periods or BAR_PERIODS:
+            if period == 1:
+                continue
+
+            agg_table = rollup_table_name(period)
+            for month in months:
+                self.client.command(f"ALTER TABLE {agg_table} DROP PARTITION {month}")
+                self.client.command(f"INSERT INTO {agg_table} " + rollup_select_sql(
+                    period, f"{source_table} {final_clause} WHERE toYYYYMM(frame) = {month}"
+                ))
+                self.logger.info(f"{agg_table} 分区 {month} 回填完成")
+
+            summary[agg_table] = len(months)
+
+        return summary
+
+    def _create_cross_section_tables(self):
+        """创建按 (frame, symbol) 排序的截面副本表，以及从源表同步写入的物化视图"""
+        source_table = CLICKHOUSE_TABLES['data_bar_for_1min']
+        for period in BAR_PERIODS:
+            if is_rollup_period(period):
+                # 高周期聚合表的副本直接由1分钟线聚合写入
+                frame_table = cross_section_table_name(rollup_table_name(period))
+                self._drop_outdated_rollup(frame_table)
+                self.client.command(order_by_frame(ROLLUP_TABLE_DDL.format(table_name=frame_table)))
+                self.client.command(
+                    f"CREATE MATERIALIZED VIEW IF NOT EXISTS {frame_table}_mv TO {frame_table} AS "
+                    + rollup_select_sql(period, source_table)
+                )
+            else:
+                table_name = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+                frame_table = cross_section_table_name(table_name)
+                self.client.command(order_by_frame(self._build_create_sql(frame_table, CLICKHOUSE_SCHEMA_VERSION)))
+                self.client.command(
+                    f"CREATE MATERIALIZED VIEW IF NOT EXISTS {frame_table}_mv TO {frame_table} AS "
+                    f"SELECT * FROM {table_name}"
+                )
+
+    def backfill_cross_section(self, periods: List[int] = None) -> dict:
+        """
+        由源表按月重建截面副本表
+
+        与backfill_rollups相同，每个月先清空再整月复制，可重复执行，请在非交易时段执行。
+
+        Args:
+            periods: 需要回填的周期，默认全部周期
+
+        Returns:
+            dict: 每个副本表回填的月份数
+        """
+        self._create_cross_section_tables()
+
+        source_table = CLICKHOUSE_TABLES['data_bar_for_1min']
+        summary = {}
+        for period in periods or BAR_PERIODS:
+            if is_rollup_period(period):
+                frame_table = cross_section_table_name(rollup_table_name(period))
+                month_source = source_table
+            else:
+                month_source = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+                frame_table = cross_section_table_name(month_source)
+
+            months = [row[0] for row in self.client.query(
+                f"SELECT DISTINCT toYYYYMM(frame) AS month FROM {month_source} ORDER BY month"
+            ).result_rows]
+
+            # v1表不分区，整表清空后按月复制
+            partitioned = is_rollup_period(period) or CLICKHOUSE_SCHEMA_VERSION == 'v2'
+            if not partitioned:
+                self.client.command(f"TRUNCATE TABLE {frame_table}")
+
+            for month in months:
+                if partitioned:
+                    self.client.command(f"ALTER TABLE {frame_table} DROP PARTITION {month}")
+
+                if is_rollup_period(period):
+                    final_clause = 'FINAL' if CLICKHOUSE_SCHEMA_VERSION == 'v2' else ''
+                    self.client.command(f"INSERT INTO {frame_table} " + rollup_select_sql(
+                        period, f"{source_table} {final_clause} WHERE toYYYYMM(frame) = {month}"
+                    ))
+                else:
+                    self.client.command(
+                        f"INSERT INTO {frame_table} SELECT * FROM {month_source} WHERE toYYYYMM(frame) = {month}"
+                    )
+                self.logger.info(f"{frame_table} 分区 {month} 回填完成")
+
+            summary[frame_table] = len(months)
+
+        return summary
+
+    @staticmethod
+    def _build_create_sql(table_name: str, version: str) -> str:
+        """生成指定版本的分钟线建表语句"""
+        if version not in BAR_TABLE_DDL:
+            raise ValueError(f"不支持的表结构版本: {version}")
+        return BAR_TABLE_DDL[version].format(table_name=table_name)
+
+    def get_schema_version(self, table_name: str) -> str:
+        """根据symbol列类型判断表结构版本"""
+        result = self.client.query(
+            "SELECT type FROM system.columns "
+            "WHERE database = currentDatabase() AND table = %(table)s AND name = 'symbol'",
+            {'table': table_name}
+        )
+        if not result.result_rows:
+            return ''
+        return 'v2' if result.result_rows[0][0].startswith('LowCardinality') else 'v1'
+
+    def migrate_to_v2(self, periods: List[int] = None, drop_old: bool = False) -> dict:
+        """
+        将v1分钟线表按月分区逐个复制到v2表结构
+
+        每个月的数据先清空目标分区再复制，中断后重新执行即可续跑；
+        全部月份行数校验通过后，替换前再比对一次各分区的源表行数，复制后有新写入的分区重新复制并校验，
+        然后原表重命名为 {table}_v1_backup，新表替换原表名。
+        追赶之后到替换之间写入的数据仍会丢失，迁移期间需停止Mac端服务和所有消费者。
+
+        Args:
+            periods: 需要迁移的周期，默认全部周期
+            drop_old: 迁移完成后是否删除v1备份表
+
+        Returns:
+            dict: 每个表的迁移结果
+        """
+        summary = {}
+        for period in periods or BAR_PERIODS:
+            table_name = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+            if self.get_schema_version(table_name) != 'v1':
+                summary[table_name] = {'status': 'skipped', 'message': '表不存在或已是v2结构'}
+                continue
+
+            new_table = f"{table_name}_v2"
+            self.client.command(self._build_create_sql(new_table, 'v2'))
+
+            months = self.client.query(
+                f"SELECT DISTINCT toYYYYMM(frame) AS month FROM {table_name} ORDER BY month"
+            ).result_rows
+
+            # 分区 -> (复制前的源表行数, 复制后的唯一行数)
+            copied = {month: self._copy_partition_v2(table_name, new_table, month) for (month,) in months}
+
+            # 追赶：复制之后有新写入（行数变化）或新出现的分区，在替换前重新复制并校验
+            source_rows = self.client.query(
+                f"SELECT toYYYYMM(frame) AS month, count() FROM {table_name} GROUP BY month ORDER BY month"
+            ).result_rows
+            for month, rows in source_rows:
+                if month not in copied or copied[month][0] != rows:
+                    self.logger.warning(f"{table_name} 分区 {month} 复制后有新数据写入，替换前重新复制")
+                    copied[month] = self._copy_partition_v2(table_name, new_table, month)
+
+            backup_table = f"{table_name}_v1_backup"
+            self.client.command(f"RENAME TABLE {table_name} TO {backup_table}, {new_table} TO {table_name}")
+            if drop_old:
+                self.client.command(f"DROP TABLE IF EXISTS {backup_table}")
+
+            summary[table_name] = {
+                'status': 'migrated',
+                'months': len(copied),
+                'rows': sum(target_count for _, target_count in copied.values()),
+                'backup_table': None if drop_old else backup_table
+            }
+
+        return summary
+
+    def _copy_partition_v2(self, table_name: str, new_table: str, month: int) -> tuple:
+        """清空v2表的一个月分区后从v1表重新复制并按唯一键校验，返回(复制前源表行数, 复制后唯一行数)"""
+        source_rows = self.client.query(
+            f"SELECT count() FROM {table_name} WHERE toYYYYMM(frame) = {month}"
+        ).result_rows[0][0]
+        self.client.command(f"ALTER TABLE {new_table} DROP PARTITION {month}")
+        self.client.command(f"""
+        INSERT INTO {new_table} ({', '.join(BAR_COLUMNS)})
+        SELECT {', '.join(BAR_COLUMNS)}
+        FROM {table_name}
+        WHERE toYYYYMM(frame) = {month}
+        """)
+
+        # v2为ReplacingMergeTree，源表中的重复行迁移后会被合并，按唯一键校验
+        source_count = self.client.query(
+            f"SELECT uniqExact(symbol, frame) FROM {table_name} WHERE toYYYYMM(frame) = {month}"
+        ).result_rows[0][0]
+        target_count = self.client.query(
+            f"SELECT count() FROM {new_table} FINAL WHERE toYYYYMM(frame) = {month}"
+        ).result_rows[0][0]
+        if source_count != target_count:
+            raise RuntimeError(
+                f"{table_name} 分区 {month} 行数校验失败: 源表 {source_count} 条，目标表 {target_count} 条"
+            )
+
+        self.logger.info(f"{table_name} 分区 {month} 迁移完成，{target_count} 条")
+        return source_rows, target_count
+
+    def get_storage_info(self, table_name: str) -> dict:
+        """获取表的磁盘占用信息"""
+        result = self.client.query("""
+        SELECT
+            sum(rows),
+            sum(bytes_on_disk),
+            sum(data_uncompressed_bytes),
+            count()
+        FROM system.parts
+        WHERE database = currentDatabase() AND table = %(table)s AND active
+        """, {'table': table_name})
+        rows, bytes_on_disk, uncompressed_bytes, parts = result.result_rows[0]
+        return {
+            'rows': rows,
+            'bytes_on_disk': bytes_on_disk,
+            'uncompressed_bytes': uncompressed_bytes,
+            'parts': parts,
+            'compression_ratio': uncompressed_bytes / bytes_on_disk if bytes_on_disk else 0
+        }
 
     def insert_bar_data(self, bar_data_list: List[BarData], period: int):
-        """插入历史分钟线数据（Mac端专用，只处理已验证的历史数据）"""
+        """
+        插入历史分钟线数据（Mac端专用，只处理已验证的历史数据）
+
+        v2表整批一次插入，携带去重令牌和统一的version，
+        重复执行的补数任务不会产生重复行。
+        开启服务端聚合时高周期由物化视图生成，只接受1分钟线。
+        """
+        if is_rollup_period(period):
+            self.logger.warning(f"已开启服务端聚合，忽略 {len(bar_data_list)} 条{period}分钟线")
+            return
+
         table_name = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
 
         valid_data = []
@@ -165,28 +855,211 @@ class ClickHouseManager:
                 bar.amount
             ])
 
-        if valid_data:
-            self.client.insert(table_name, valid_data)
-            self.logger.info(f"插入 {len(valid_data)} 条历史数据到 {table_name}")
+        if not valid_data:
+            return
+
+        settings = {}
+        if INSERT_BUFFER_CONFIG.get('async_insert'):
+            # 服务端异步插入：等待数据落入服务端缓冲后返回，仍保证写入成功才确认
+            settings.update({'async_insert': 1, 'wait_for_async_insert': 1, 'async_insert_deduplicate': 1})
+
+        if CLICKHOUSE_SCHEMA_VERSION == 'v1':
+            self.client.insert(table_name, valid_data, column_names=BAR_COLUMNS, settings=settings or None)
+        else:
+            # 重复插入被去重时，同时跳过物化视图的写入，避免高周期成交量重复累加
+            if BAR_ROLLUP_ENABLED or CROSS_SECTION_ENABLED:
+                settings['deduplicate_blocks_in_dependent_materialized_views'] = 1
+            version = time.time_ns() // 1_000_000
+            # 按 (symbol, frame) 排序，同一批数据无论到达顺序如何都生成相同的令牌
+            valid_data.sort(key=lambda row: (row[0], row[1]))
+            token = bar_dedup_token(table_name, valid_data)
+            self.client.insert(
+                table_name,
+                [row + [version] for row in valid_data],
+                column_names=BAR_COLUMNS + ['version'],
+                settings={**settings, 'insert_deduplication_token': token}
+            )
+            self._invalidate_final_cache(table_name)
+
+        self.logger.info(f"插入 {len(valid_data)} 条历史数据到 {table_name}")
+
+    def insert_bar_columns(self, columns: Dict[str, np.ndarray], period: int):
+        """
+        列式插入历史分钟线数据（夜间批量加载用，不逐行构造Python对象）
+
+        v2表与insert_bar_data相同，整批一次插入并携带去重令牌和统一的version；
+        令牌由列数据的字节摘要生成，同一批次重试时不会重复写入。
+        """
+        if is_rollup_period(period):
+            self.logger.warning(f"已开启服务端聚合，忽略 {len(columns['frame'])} 条{period}分钟线")
+            return
+        if not len(columns['frame']):
+            return
 
-    def query_bar_data(self, symbol: str, start_time: datetime, end_time: datetime, period: int) -> List[BarData]:
-        """查询历史分钟线数据"""
         table_name = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+        settings = {}
+        if INSERT_BUFFER_CONFIG.get('async_insert'):
+            settings.update({'async_insert': 1, 'wait_for_async_insert': 1, 'async_insert_deduplicate': 1})
 
-        query_sql = f"""
-        SELECT symbol, frame, open, high, low, close, vol, amount
-        FROM {table_name}
-        WHERE symbol = %(symbol)s
-        AND frame >= %(start_time)s
-        AND frame <= %(end_time)s
-        ORDER BY frame
+        if CLICKHOUSE_SCHEMA_VERSION == 'v1':
+            self.client.insert(
+                table_name, [columns[name] for name in BAR_COLUMNS], column_names=BAR_COLUMNS,
+                column_oriented=True, settings=settings or None
+            )
+        else:
+            if BAR_ROLLUP_ENABLED or CROSS_SECTION_ENABLED:
+                settings['deduplicate_blocks_in_dependent_materialized_views'] = 1
+            version = time.time_ns() // 1_000_000
+
+            # 按 (symbol, frame) 排序，同一批数据无论到达顺序如何都生成相同的令牌
+            symbols = columns['symbol'].astype(str)
+            order = np.lexsort((columns['frame'].astype('datetime64[s]'), symbols))
+            data = [columns[name][order] for name in BAR_COLUMNS]
+            # symbol为object列，字节不稳定，按文本计入摘要
+            digest = hashlib.sha1('\0'.join(symbols[order]).encode('utf-8'))
+            for values in data[1:]:
+                digest.update(np.ascontiguousarray(values).tobytes())
+            self.client.insert(
+                table_name,
+                data + [np.full(len(order), version, dtype=np.uint64)],
+                column_names=BAR_COLUMNS + ['version'],
+                column_oriented=True,
+                settings={**settings, 'insert_deduplication_token': f"{table_name}:{digest.hexdigest()}"}
+            )
+            self._invalidate_final_cache(table_name)
+
+        self.logger.info(f"列式插入 {len(columns['frame'])} 条历史数据到 {table_name}")
+
+    def _needs_final(self, table_name: str, start_time: datetime, end_time: datetime) -> bool:
+        """
+        判断查询范围内是否存在尚未合并的分区
+
+        已合并为单个part的分区中不会有重复行，可直接读取；
+        只有存在多个活动part的分区才需要FINAL去重。
+        每个 (表, 月分区) 的检查结果缓存 CLICKHOUSE_FINAL_CHECK_TTL 秒，本进程写入该表后失效。
+        """
+        if CLICKHOUSE_SCHEMA_VERSION == 'v1':
+            return False
+
+        months = []
+        month, end_month = start_time.year * 12 + start_time.month - 1, end_time.year * 12 + end_time.month - 1
+        while month <= end_month:
+            months.append((month // 12) * 100 + month % 12 + 1)
+            month += 1
+
+        now = time.monotonic()
+        with self._final_cache_lock:
+            cached = {m: self._final_cache.get((table_name, m)) for m in months}
+        if any(entry and entry[0] > now and entry[1] for entry in cached.values()):
+            return True
+        missing = [m for m, entry in cached.items() if not entry or entry[0] <= now]
+        if not missing:
+            return False
+
+        result = self.client.query("""
+        SELECT toUInt32(partition), count()
+        FROM system.parts
+        WHERE database = currentDatabase() AND table = %(table)s AND active
+        AND toUInt32(partition) BETWEEN %(start_month)s AND %(end_month)s
+        GROUP BY partition
+        """, {'table': table_name, 'start_month': missing[0], 'end_month': missing[-1]})
+        part_counts = dict(result.result_rows)
+
+        expires = now + CLICKHOUSE_FINAL_CHECK_TTL
+        with self._final_cache_lock:
+            for m in missing:
+                self._final_cache[(table_name, m)] = (expires, part_counts.get(m, 0) > 1)
+        return any(part_counts.get(m, 0) > 1 for m in missing)
+
+    def _invalidate_final_cache(self, table_name: str):
+        """写入后清除该表（及其截面副本表）的FINAL检查缓存"""
+        tables = {table_name, cross_section_table_name(table_name)}
+        with self._final_cache_lock:
+            for key in [key for key in self._final_cache if key[0] in tables]:
+                del self._final_cache[key]
+
+    @staticmethod
+    def _use_cross_section(symbol, start_time: datetime, end_time: datetime) -> bool:
+        """
+        根据查询形态判断是否读取 (frame, symbol) 排序的截面副本表
+
+        不限定股票（全市场截面）时读副本；多股票且时间跨度短时也读副本，
+        单股票或长时间范围查询仍读 (symbol, frame) 排序的源表。
+        """
+        if not CROSS_SECTION_ENABLED:
+            return False
+        if symbol is None:
+            return True
+        return (isinstance(symbol, (list, tuple)) and len(symbol) >= CROSS_SECTION_MIN_SYMBOLS
+                and end_time - start_time <= CROSS_SECTION_MAX_SPAN)
+
+    @staticmethod
+    def _query_settings(*settings_list) -> dict:
+        """
+        合并查询设置：配置中的默认设置 < 查询形态需要的设置 < 单次请求指定的设置
+        """
+        merged = dict(CLICKHOUSE_POOL_CONFIG.get('query_settings') or {})
+        for settings in settings_list:
+            if settings:
+                merged.update(settings)
+        return merged
+
+    def _build_bar_query(self, symbol, start_time: datetime, end_time: datetime, period: int,
+                         settings: dict = None):
         """
+        生成分钟线查询语句、参数和查询设置（行式与列式查询共用）
 
-        result = self.client.query(query_sql, {
+        symbol为列表时生成 symbol IN (...) 的多股票查询，结果按 (symbol, frame) 排序；
+        symbol为None时查询全部股票，结果按 (frame, symbol) 排序。
+        settings为单次请求的查询设置（如max_threads、max_execution_time）。
+        """
+        if symbol is None:
+            symbol_condition = '1 = 1'
+            order_by = 'frame, symbol'
+        elif isinstance(symbol, (list, tuple)):
+            symbol_condition = 'symbol IN %(symbol)s'
+            order_by = 'symbol, frame'
+            symbol = tuple(symbol)
+        else:
+            symbol_condition = 'symbol = %(symbol)s'
+            order_by = 'frame'
+
+        use_cross_section = self._use_cross_section(symbol, start_time, end_time)
+
+        if is_rollup_period(period):
+            agg_table = rollup_table_name(period)
+            if use_cross_section:
+                agg_table = cross_section_table_name(agg_table)
+            # 聚合表中同一周期可能还有多行未合并的聚合状态，查询时合并
+            query_sql = ROLLUP_QUERY_SQL.format(table=agg_table, symbol_condition=symbol_condition, order_by=order_by)
+            shape_settings = None
+        else:
+            table_name = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+            if use_cross_section:
+                table_name = cross_section_table_name(table_name)
+            final_clause = 'FINAL' if self._needs_final(table_name, start_time, end_time) else ''
+            query_sql = f"""
+            SELECT symbol, frame, open, high, low, close, vol, amount
+            FROM {table_name} {final_clause}
+            WHERE {symbol_condition}
+            AND frame >= %(start_time)s
+            AND frame <= %(end_time)s
+            ORDER BY {order_by}
+            """
+            shape_settings = {'do_not_merge_across_partitions_select_final': 1} if final_clause else None
+
+        parameters = {
             'symbol': symbol,
             'start_time': start_time,
             'end_time': end_time
-        })
+        }
+        return query_sql, parameters, self._query_settings(shape_settings, settings)
+
+    def query_bar_data(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                       settings: dict = None) -> List[BarData]:
+        """查询历史分钟线数据"""
+        query_sql, parameters, query_settings = self._build_bar_query(symbol, start_time, end_time, period, settings)
+        result = self.client.query(query_sql, parameters, settings=query_settings)
 
         bars = []
         for row in result.result_rows:
@@ -203,9 +1076,198 @@ class ClickHouseManager:
 
         return bars
 
+    def query_bar_frame(self, symbol, start_time: datetime, end_time: datetime, period: int,
+                        fmt: str = 'numpy', settings: dict = None):
+        """
+        列式查询历史分钟线数据
+
+        结果不逐行构造BarData，直接按列返回：
+        fmt='numpy' 返回 {列名: numpy数组}，fmt='arrow' 返回 pyarrow.Table（需要安装pyarrow）。
+        symbol可以是单个代码，也可以是代码列表（结果按 (symbol, frame) 排序）。
+        """
+        query_sql, parameters, query_settings = self._build_bar_query(symbol, start_time, end_time, period, settings)
+
+        if fmt == 'arrow':
+            return self.client.query_arrow(query_sql, parameters=parameters, settings=query_settings)
+        if fmt != 'numpy':
+            raise ValueError(f"不支持的返回格式: {fmt}")
+
+        result = self.client.query_np(query_sql, parameters=parameters, settings=query_settings)
+        if len(result) == 0:
+            return empty_bar_columns()
+        return {name: np.asarray(result[name]) for name in BAR_COLUMNS}
+
+    def query_resampled_frame(self, symbol, start_time: datetime, end_time: datetime, period: int,
+                              settings: dict = None) -> Dict[str, np.ndarray]:
+        """
+        任意N分钟周期重采样查询（列式），在ClickHouse中由1分钟线聚合
+
+        周期按交易时段对齐（与高周期聚合表规则相同），N不小于 DAILY_PERIOD 时返回日线。
+        开盘/收盘价用argMin/argMax按时间取，新周期不需要建表或额外入库。
+        symbol可以是单个代码、代码列表或None（全部股票）。
+        """
+        if period < 1:
+            raise ValueError(f"无效的重采样周期: {period}")
+
+        if symbol is None:
+            symbol_condition = '1 = 1'
+            order_by = 'frame, symbol'
+        elif isinstance(symbol, (list, tuple)):
+            symbol_condition = 'symbol IN %(symbol)s'
+            order_by = 'symbol, frame'
+            symbol = tuple(symbol)
+        else:
+            symbol_condition = 'symbol = %(symbol)s'
+            order_by = 'frame'
+
+        source_table = CLICKHOUSE_TABLES['data_bar_for_1min']
+        final_clause = 'FINAL' if self._needs_final(source_table, start_time, end_time) else ''
+        query_sql = RESAMPLE_SELECT_SQL.format(
+            bucket=resample_bucket_expr('ts', period),
+            source=source_table,
+            final=final_clause,
+            symbol_condition=symbol_condition,
+            order_by=order_by
+        )
+        shape_settings = {'do_not_merge_across_partitions_select_final': 1} if final_clause else None
+
+        result = self.client.query_np(
+            query_sql,
+            parameters={'symbol': symbol, 'start_time': start_time, 'end_time': end_time},
+            settings=self._query_settings(shape_settings, settings)
+        )
+        if len(result) == 0:
+            return empty_bar_columns()
+        return {name: np.asarray(result[name]) for name in BAR_COLUMNS}
+
+    def query_adjust_factors(self, symbols: List[str], start_time: datetime,
+                             end_time: datetime) -> Dict[str, np.ndarray]:
+        """
+        查询日线表中的复权因子（列式，按 (symbol, frame) 排序）
+
+        除区间内每个交易日的因子外，每只股票还返回区间之前最近一日和区间之后最新一日的因子：
+        前复权始终以该股票最新的因子为基准，与查询的结束日期无关。
+
+        Returns:
+            {'symbol', 'frame', 'adjust'}，frame为交易日期
+        """
+        query_sql = f"""
+        SELECT symbol, frame, adjust
+        FROM (
+            SELECT symbol, frame, any(adjust) AS adjust
+            FROM {DAY_BAR_TABLE}
+            WHERE symbol IN %(symbols)s
+            AND frame >= %(start_date)s
+            AND frame <= %(end_date)s
+            GROUP BY symbol, frame
+            UNION ALL
+            SELECT symbol, max(frame) AS frame, argMax(adjust, frame) AS adjust
+            FROM {DAY_BAR_TABLE}
+            WHERE symbol IN %(symbols)s
+            AND (frame < %(start_date)s OR frame > %(end_date)s)
+            GROUP BY symbol, frame > %(end_date)s
+        )
+        ORDER BY symbol, frame
+        """
+        result = self.client.query_np(
+            query_sql,
+            parameters={'symbols': tuple(symbols), 'start_date': start_time.date(), 'end_date': end_time.date()},
+            settings=self._query_settings({'prefer_column_name_to_alias': 1})
+        )
+        if len(result) == 0:
+            return {
+                'symbol': np.array([], dtype=object),
+                'frame': np.array([], dtype='datetime64[D]'),
+                'adjust': np.array([], dtype=np.float64)
+            }
+        return {name: np.asarray(result[name]) for name in ('symbol', 'frame', 'adjust')}
+
+    def iter_bar_frame(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                       page_size: int = STREAM_PAGE_ROWS, settings: dict = None):
+        """
+        按frame游标分页读取单只股票的历史分钟线，逐页返回列式数据
+
+        每页最多 page_size 行，下一页从上一页最后一根K线之后开始，
+        内存占用只与页大小有关，与查询的时间范围无关。
+        """
+        cursor = start_time
+        while cursor <= end_time:
+            query_sql, parameters, query_settings = self._build_bar_query(symbol, cursor, end_time, period, settings)
+            result = self.client.query_np(
+                f"{query_sql} LIMIT {int(page_size)}", parameters=parameters, settings=query_settings
+            )
+            if len(result) == 0:
+                return
+
+            columns = {name: np.asarray(result[name]) for name in BAR_COLUMNS}
+            yield columns
+
+            if len(columns['frame']) < page_size:
+                return
+            # frame为秒级时间，下一页从最后一根K线的下一秒开始
+            cursor = columns['frame'][-1].astype('datetime64[s]').astype(datetime) + timedelta(seconds=1)
+
+    def query_bar_frames(self, symbols: List[str], start_time: datetime, end_time: datetime,
+                         period: int, settings: dict = None) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        多股票列式查询历史分钟线数据
+
+        一次 symbol IN (...) 查询取回全部股票，再按symbol切分为各自的列式数据。
+
+        Returns:
+            {symbol: {列名: numpy数组}}，没有数据的股票不出现在结果中
+        """
+        if not symbols:
+            return {}
+
+        columns = self.query_bar_frame(list(symbols), start_time, end_time, period, settings=settings)
+        symbol_column = columns['symbol']
+        if len(symbol_column) == 0:
+            return {}
+
+        # 结果按 (symbol, frame) 排序，symbol变化的位置即各股票的分界
+        boundaries = np.flatnonzero(symbol_column[1:] != symbol_column[:-1]) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(symbol_column)]])
+
+        return {
+            symbol_column[start]: {name: values[start:end] for name, values in columns.items()}
+            for start, end in zip(starts, ends)
+        }
+
+    def query_cross_section(self, start_time: datetime, period: int, end_time: datetime = None,
+                            symbols: List[str] = None, settings: dict = None) -> Dict[str, np.ndarray]:
+        """
+        截面查询：某一时刻（或一小段时间）全部股票或指定股票的分钟线
+
+        开启CROSS_SECTION_ENABLED时自动读取 (frame, symbol) 排序的副本表。
+
+        Args:
+            start_time: 开始时间（只查询单个时刻时即为该时刻）
+            period: 周期（分钟）
+            end_time: 结束时间，默认与开始时间相同
+            symbols: 股票代码列表，默认全部股票
+
+        Returns:
+            {列名: numpy数组}，按 (frame, symbol) 排序
+        """
+        end_time = end_time or start_time
+        columns = self.query_bar_frame(symbols or None, start_time, end_time, period, settings=settings)
+        if symbols and len(columns['frame']) > 0:
+            # 指定股票时SQL按 (symbol, frame) 排序，这里转换为截面顺序
+            order = np.lexsort((columns['symbol'], columns['frame']))
+            columns = {name: values[order] for name, values in columns.items()}
+        return columns
+
+    def get_distinct_symbols(self, period: int = 1) -> List[str]:
+        """ClickHouse中有数据的全部股票代码（有序）"""
+        table_name = rollup_table_name(period) if is_rollup_period(period) else CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+        result = self.client.query(f"SELECT DISTINCT symbol FROM {table_name} ORDER BY symbol")
+        return [row[0] for row in result.result_rows]
+
     def get_table_count(self, period: int) -> int:
         """获取表记录数"""
-        table_name = CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
+        table_name = rollup_table_name(period) if is_rollup_period(period) else CLICKHOUSE_TABLES[f'data_bar_for_{period}min']
         result = self.client.query(f"SELECT COUNT(*) FROM {table_name}")
         return result.result_rows[0][0] if result.result_rows else 0
 
@@ -216,3 +1278,17 @@ class ClickHouseManager:
             count = self.get_table_count(period)
             info[f'{period}min_count'] = count
         return info
+
+
+_clickhouse_manager = None
+_clickhouse_manager_lock = threading.Lock()
+
+
+def get_clickhouse_manager() -> ClickHouseManager:
+    """获取进程内共享的ClickHouseManager实例（首次调用时创建）"""
+    global _clickhouse_manager
+    if _clickhouse_manager is None:
+        with _clickhouse_manager_lock:
+            if _clickhouse_manager is None:
+                _clickhouse_manager = ClickHouseManager()
+    return _clickhouse_manager
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+ClickHouse写缓冲（write-behind）
+按表累积待写入的行，达到行数上限、缓冲时间上限或关闭时批量写入，
+避免每次少量插入在ClickHouse中产生大量小part
+"""
+import threading
+import time
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, List
+
+
+class InsertBuffer:
+    """
+    按表（key）累积行并在后台线程中批量写入
+
+    - 某个key累积行数达到 max_rows 时立即唤醒后台线程写入
+    - 最早一行等待超过 max_age 秒时写入
+    - flush()/close() 同步写入剩余数据
+    - 缓冲总行数超过 max_pending_rows 时 add() 阻塞，对上游形成背压
+
+    写入失败的行会放回缓冲区，下一轮重试（v2表带去重令牌，重试不会重复写入）；
+    flush()/close() 返回是否全部写入成功，调用方据此处理写入失败的数据。
+    add() 可附带写入成功后的回调（如确认Redis在途批次），回调在这些行写入ClickHouse后才执行。
+    """
+
+    def __init__(self, flush_func: Callable[[Hashable, List], None], max_rows: int = 50000,
+                 max_age: float = 5.0, max_pending_rows: int = None, name: str = 'insert_buffer'):
+        """
+        Args:
+            flush_func: 写入函数，参数为 (key, rows)
+            max_rows: 单个key触发写入的行数
+            max_age: 缓冲最长时间（秒）
+            max_pending_rows: 缓冲总行数上限，默认 max_rows 的4倍
+            name: 名称（用于日志和后台线程名）
+        """
+        self.flush_func = flush_func
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.max_pending_rows = max_pending_rows or max_rows * 4
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+
+        self._buffers: Dict[Hashable, List] = defaultdict(list)
+        self._callbacks: Dict[Hashable, List[Callable[[], None]]] = defaultdict(list)
+        self._first_added: Dict[Hashable, float] = {}
+        self._pending_rows = 0
+        self._condition = threading.Condition()
+        # 同一时间只有一个线程执行写入，保证同一key的数据按顺序落库
+        self._flush_lock = threading.Lock()
+        self._running = True
+
+        self.stats = {
+            'buffered_rows': 0,
+            'flushed_rows': 0,
+            'flush_count': 0,
+            'failed_flushes': 0,
+            'last_flush_rows': 0,
+            'last_flush_latency_ms': 0.0,
+            'max_flush_latency_ms': 0.0,
+            'total_flush_latency_ms': 0.0
+        }
+
+        self._thread = threading.Thread(target=self._flush_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, key: Hashable, rows: List, on_flushed: Callable[[], None] = None):
+        """
+        添加待写入的行
+
+        Args:
+            on_flushed: 这些行写入成功后调用（在写入线程中执行）
+        """
+        if not rows:
+            if on_flushed is not None:
+                on_flushed()
+            return
+
+        with self._condition:
+            while self._running and self._pending_rows >= self.max_pending_rows:
+                self._condition.wait(timeout=1)
+
+            self._buffers[key].extend(rows)
+            if on_flushed is not None:
+                self._callbacks[key].append(on_flushed)
+            self._first_added.setdefault(key, time.monotonic())
+            self._pending_rows += len(rows)
+            self.stats['buffered_rows'] += len(rows)
+
+            if len(self._buffers[key]) >= self.max_rows:
+                self._condition.notify_all()
+
+    def flush(self, key: Hashable = None) -> bool:
+        """
+        同步写入指定key（默认全部key）的缓冲数据
+
+        Returns:
+            bool: 是否全部写入成功（失败的行仍留在缓冲区中）
+        """
+        keys = [key] if key is not None else None
+        return self._flush(keys)
+
+    def close(self) -> bool:
+        """
+        停止后台线程并写入剩余数据
+
+        Returns:
+            bool: 剩余数据是否全部写入成功（失败时可通过 get_depth() 查看未写入的行数）
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=self.max_age + 5)
+        return self._flush(None)
+
+    def get_depth(self) -> Dict[str, int]:
+        """各key当前缓冲的行数"""
+        with self._condition:
+            return {str(key): len(rows) for key, rows in self._buffers.items() if rows}
+
+    def get_stats(self) -> dict:
+        """缓冲区深度和写入延迟统计"""
+        with self._condition:
+            stats = dict(self.stats)
+            stats['pending_rows'] = self._pending_rows
+            stats['depth'] = {str(key): len(rows) for key, rows in self._buffers.items() if rows}
+
+        stats['avg_flush_latency_ms'] = (
+            stats['total_flush_latency_ms'] / stats['flush_count'] if stats['flush_count'] else 0.0
+        )
+        return stats
+
+    def _flush_loop(self):
+        """后台写入循环"""
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+                self._condition.wait(timeout=min(self.max_age / 4, 1.0))
+                due_keys = self._due_keys()
+
+            if due_keys:
+                self._flush(due_keys)
+
+    def _due_keys(self) -> List[Hashable]:
+        """达到行数或时间上限的key（调用方需持有锁）"""
+        now = time.monotonic()
+        return [
+            key for key, rows in self._buffers.items()
+            if rows and (len(rows) >= self.max_rows or now - self._first_added[key] >= self.max_age)
+        ]
+
+    def _flush(self, keys: List[Hashable] = None) -> bool:
+        """写入指定key的缓冲数据，keys为None时写入全部；返回是否全部写入成功"""
+        success = True
+        with self._flush_lock:
+            with self._condition:
+                batches = {}
+                for key in list(self._buffers.keys()) if keys is None else keys:
+                    rows = self._buffers.pop(key, None)
+                    callbacks = self._callbacks.pop(key, [])
+                    self._first_added.pop(key, None)
+                    if rows:
+                        batches[key] = (rows, callbacks)
+
+            for key, (rows, callbacks) in batches.items():
+                start = time.perf_counter()
+                try:
+                    self.flush_func(key, rows)
+                except Exception as e:
+                    self.logger.error(f"{self.name} 写入 {key} 失败（{len(rows)} 条，稍后重试）: {e}")
+                    with self._condition:
+                        self.stats['failed_flushes'] += 1
+                        self._buffers[key][:0] = rows
+                        self._callbacks[key][:0] = callbacks
+                        self._first_added[key] = time.monotonic()
+                    success = False
+                    continue
+
+                for callback in callbacks:
+                    try:
+                        callback()
+                    except Exception as e:
+                        self.logger.error(f"{self.name} 写入 {key} 后的回调失败: {e}")
+
+                latency_ms = (time.perf_counter() - start) * 1000
+                with self._condition:
+                    self._pending_rows -= len(rows)
+                    self.stats['flushed_rows'] += len(rows)
+                    self.stats['flush_count'] += 1
+                    self.stats['last_flush_rows'] = len(rows)
+                    self.stats['last_flush_latency_ms'] = latency_ms
+                    self.stats['max_flush_latency_ms'] = max(self.stats['max_flush_latency_ms'], latency_ms)
+                    self.stats['total_flush_latency_ms'] += latency_ms
+                    self._condition.notify_all()
+        return success
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+WebSocket实时推送
+每个服务进程一个共享的生产者：
+- 状态：后台任务按固定间隔计算一次状态，只把变化的部分推送给所有连接
+- 分钟线：订阅Windows端发布当日分钟线时的Redis频道，收到后只转发给订阅了该股票和周期的连接
+连接数增加不会增加Redis/ClickHouse的查询次数。
+
+连接建立后默认只接收状态，页面发送订阅消息后才接收分钟线：
+    {"action": "subscribe", "symbols": ["000001.SZ"], "periods": [1, 5]}
+    {"action": "unsubscribe"}
+symbols/periods 为空表示全部股票/全部周期，新的订阅替换之前的订阅。
+"""
+import asyncio
+import json
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+import redis
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from config import REDIS_CONFIG, LIVE_PUSH_CONFIG
+
+
+def dict_delta(old: dict, new: dict) -> dict:
+    """
+    计算两个嵌套字典的差异：只包含新增或变化的字段，被删除的字段值为None
+    （页面合并差异时删除值为None的字段）
+    """
+    delta = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        old_value = old.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            sub_delta = dict_delta(old_value, value)
+            if sub_delta:
+                delta[key] = sub_delta
+        elif value != old_value:
+            delta[key] = value
+    return delta
+
+
+class LiveClient:
+    """一个WebSocket连接的发送队列和订阅条件"""
+
+    # 发送队列中的重新同步标记：发送当前完整状态
+    RESYNC = None
+
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.symbols = None     # None 表示不接收分钟线，空集合表示全部股票
+        self.periods = set()    # 空集合表示全部周期
+        self.dropped_bars = 0
+        self.resyncs = 0
+
+    def subscribe(self, symbols, periods):
+        self.symbols = {str(symbol) for symbol in symbols or []}
+        self.periods = {int(period) for period in periods or []}
+
+    def unsubscribe(self):
+        self.symbols = None
+        self.periods = set()
+
+    def wants_bar(self, symbol: str, period: int) -> bool:
+        if self.symbols is None:
+            return False
+        return (not self.symbols or symbol in self.symbols) and (not self.periods or period in self.periods)
+
+
+class LiveBroadcaster:
+    """WebSocket推送的共享生产者"""
+
+    def __init__(self, status_func: Optional[Callable[[], dict]] = None, subscribe_bars: bool = False,
+                 status_interval: float = None):
+        """
+        Args:
+            status_func: 计算状态的函数（在线程池中执行），为None时不推送状态
+            subscribe_bars: 是否订阅并转发当日分钟线
+            status_interval: 状态计算间隔（秒）
+        """
+        self.status_func = status_func
+        self.subscribe_bars = subscribe_bars
+        self.status_interval = status_interval or LIVE_PUSH_CONFIG['status_interval']
+        self.logger = logging.getLogger(__name__)
+
+        self._clients: Dict[int, LiveClient] = {}
+        self._status = {}
+        self._loop = None
+        self._status_task = None
+        self._pubsub = None
+        self._running = False
+        self._stopped = threading.Event()
+
+    async def start(self):
+        """在事件循环中启动状态任务和分钟线订阅线程"""
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        self._stopped.clear()
+        if self.status_func is not None:
+            self._status_task = asyncio.create_task(self._status_loop())
+        if self.subscribe_bars:
+            threading.Thread(target=self._subscribe_loop, name='live_bar_subscriber', daemon=True).start()
+
+    async def stop(self):
+        """停止推送"""
+        self._running = False
+        self._stopped.set()
+        if self._status_task is not None:
+            self._status_task.cancel()
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+    async def handle(self, websocket: WebSocket):
+        """处理一个WebSocket连接：先发送完整状态，之后只推送增量和订阅的分钟线"""
+        await websocket.accept()
+        client = LiveClient(LIVE_PUSH_CONFIG['client_queue_size'])
+        self._clients[id(client)] = client
+        tasks = [
+            asyncio.create_task(self._send_loop(websocket, client)),
+            asyncio.create_task(self._receive_loop(websocket, client))
+        ]
+        try:
+            # 任一方向结束（连接断开）即关闭该连接
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._clients.pop(id(client), None)
+
+    def get_client_count(self) -> int:
+        return len(self._clients)
+
+    async def _send_loop(self, websocket: WebSocket, client: LiveClient):
+        """发送队列中的消息，遇到重新同步标记时发送当前完整状态"""
+        try:
+            client.queue.put_nowait(LiveClient.RESYNC)
+            while True:
+                message = await client.queue.get()
+                if message is LiveClient.RESYNC:
+                    if self._status:
+                        message = json.dumps({'type': 'status', 'full': True, 'data': self._status}, default=str)
+                    else:
+                        continue
+                await websocket.send_text(message)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def _receive_loop(self, websocket: WebSocket, client: LiveClient):
+        """接收页面的订阅消息"""
+        try:
+            while True:
+                try:
+                    request = json.loads(await websocket.receive_text())
+                    if request.get('action') == 'subscribe':
+                        client.subscribe(request.get('symbols'), request.get('periods'))
+                    elif request.get('action') == 'unsubscribe':
+                        client.unsubscribe()
+                except (ValueError, TypeError, AttributeError) as e:
+                    self.logger.debug(f"忽略无效的订阅消息: {e}")
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    def _broadcast_status(self, message: str):
+        """
+        把状态增量放入每个连接的发送队列（在事件循环线程中调用）
+
+        队列已满时丢弃队列中积压的消息，改为发送一次完整状态，
+        连接不会因为丢失增量而与服务端状态不一致。
+        """
+        for client in list(self._clients.values()):
+            if client.queue.full():
+                while not client.queue.empty():
+                    client.queue.get_nowait()
+                client.queue.put_nowait(LiveClient.RESYNC)
+                client.resyncs += 1
+            else:
+                client.queue.put_nowait(message)
+
+    def _broadcast_bar(self, message: str, symbol: str, period: int):
+        """
+        把分钟线放入订阅了该股票和周期的连接的发送队列（在事件循环线程中调用）
+
+        队列已满时丢弃这根分钟线（分钟线先于状态增量被丢弃），不阻塞其他连接。
+        """
+        for client in list(self._clients.values()):
+            if not client.wants_bar(symbol, period):
+                continue
+            if client.queue.full():
+                client.dropped_bars += 1
+            else:
+                client.queue.put_nowait(message)
+
+    async def _status_loop(self):
+        """按间隔计算一次状态，有变化时推送差异"""
+        while self._running:
+            try:
+                if self._clients or not self._status:
+                    status = await run_in_threadpool(self.status_func)
+                    delta = dict_delta(self._status, status)
+                    self._status = status
+                    if delta:
+                        self._broadcast_status(json.dumps({'type': 'status', 'full': False, 'data': delta}, default=str))
+            except Exception as e:
+                self.logger.error(f"计算推送状态失败: {e}")
+            await asyncio.sleep(self.status_interval)
+
+    def _subscribe_loop(self):
+        """订阅Redis频道，把当日分钟线转发到事件循环；连接中断后按退避间隔重连"""
+        delay = LIVE_PUSH_CONFIG['reconnect_delay']
+        while self._running:
+            try:
+                client = redis.Redis(**REDIS_CONFIG)
+                self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(LIVE_PUSH_CONFIG['channel'])
+                delay = LIVE_PUSH_CONFIG['reconnect_delay']
+                for message in self._pubsub.listen():
+                    if not self._running:
+                        return
+                    if self._clients:
+                        self._dispatch_bar(message['data'])
+            except Exception as e:
+                if not self._running:
+                    return
+                self.logger.error(f"分钟线订阅中断，{delay:.0f}秒后重连: {e}")
+            finally:
+                if self._pubsub is not None:
+                    self._pubsub.close()
+
+            if self._stopped.wait(delay):
+                return
+            delay = min(delay * 2, LIVE_PUSH_CONFIG['reconnect_max_delay'])
+
+    def _dispatch_bar(self, message):
+        """解析分钟线消息的股票代码和周期，交给事件循环按订阅转发"""
+        try:
+            bar = json.loads(message)
+            symbol, period = bar['data']['symbol'], int(bar['period'])
+        except (ValueError, TypeError, KeyError) as e:
+            self.logger.warning(f"忽略无法解析的分钟线消息: {e}")
+            return
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+        self._loop.call_soon_threadsafe(self._broadcast_bar, message, symbol, period)
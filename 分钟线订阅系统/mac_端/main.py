@@ -15,13 +15,17 @@ import asyncio
 import threading
 import time
 from datetime import datetime, time as dt_time
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket
 from fastapi.responses import HTMLResponse, JSONResponse
 import uvicorn
 import webbrowser
 
-from config import WEB_PORTS, DATA_CLEANUP_TIME
-from database import RedisManager, ClickHouseManager
+from config import WEB_PORTS, DATA_CLEANUP_TIME, INGEST_PERIODS, BAR_PERIODS, BAR_ROLLUP_ENABLED, REDIS_QUEUES
+from database import RedisManager, get_clickhouse_manager
+from consumer_pool import BarConsumerPool
+from nightly_loader import NightlyBarLoader
+from live_push import LiveBroadcaster
+from query_cache import bump_cache_epoch
 from models import SystemStatus
 from trading_time_validator import TradingTimeValidator
 
@@ -31,10 +35,22 @@ class MacDataService:
 
     def __init__(self):
         self.redis_manager = RedisManager()
-        self.clickhouse_manager = ClickHouseManager()
+        self.clickhouse_manager = get_clickhouse_manager()
         self.trading_validator = TradingTimeValidator()
+        # 消费工作池：每个周期独立的解码队列、解码线程和写缓冲（按周期累积后批量写入ClickHouse）
+        self.consumer_pool = BarConsumerPool(
+            self.redis_manager, INGEST_PERIODS, self._decode_bar_data, self._flush_bar_data,
+            name='mac_consumer'
+        )
+        # 夜间历史数据流水线加载（确认写入后才从Redis删除）
+        self.nightly_loader = NightlyBarLoader(
+            self.redis_manager, self.clickhouse_manager, INGEST_PERIODS, on_inserted=self._on_columns_inserted
+        )
         self.is_running = False
         self.is_processing = False
+        # 夜间加载在独立线程中运行，时间检查循环在处理窗口结束时通过停止事件让它不再取新批次
+        self._loader_thread = None
+        self._loader_stop = threading.Event()
         self.status = SystemStatus(
             service_name="Mac数据处理服务",
             status="stopped",
@@ -42,6 +58,26 @@ class MacDataService:
             message="服务未启动"
         )
 
+    def _flush_bar_data(self, period: int, rows: list):
+        """
+        写缓冲的写入函数：写入ClickHouse后登记股票代码并使Client端该周期的查询缓存失效
+
+        只有写入失败才抛出异常（数据留在队列中重试）；写入成功后的登记和缓存失效失败只记录日志，
+        不能让已写入的批次被当作写入失败重新写入。
+        """
+        self.clickhouse_manager.insert_bar_data(rows, period)
+        try:
+            self.redis_manager.register_symbols(bar.symbol for bar in rows)
+            # 开启服务端聚合时，1分钟线写入会同时更新各高周期聚合表
+            bump_cache_epoch(self.redis_manager.client, BAR_PERIODS if BAR_ROLLUP_ENABLED else [period])
+        except Exception as e:
+            print(f"{period}分钟线已写入 {len(rows)} 条，登记股票代码或更新缓存版本失败: {e}")
+
+    def _on_columns_inserted(self, period: int, columns: dict):
+        """夜间加载每批写入后：登记股票代码并使Client端该周期的查询缓存失效"""
+        self.redis_manager.register_symbols(set(columns['symbol']))
+        bump_cache_epoch(self.redis_manager.client, BAR_PERIODS if BAR_ROLLUP_ENABLED else [period])
+
     def start_service(self):
         """启动服务"""
         self.is_running = True
@@ -49,45 +85,23 @@ class MacDataService:
         self.status.message = "服务正在运行"
         self.status.last_update = datetime.now()
 
-        # 启动数据处理线程
-        threading.Thread(target=self._data_processing_loop, daemon=True).start()
+        # 启动消费工作池
+        self.consumer_pool.start()
         # 启动时间检查线程
         threading.Thread(target=self._time_check_loop, daemon=True).start()
 
     def stop_service(self):
         """停止服务"""
         self.is_running = False
+        # 等夜间加载写完已取出的批次，再停止消费并写入缓冲中剩余的数据
+        self._loader_stop.set()
+        if self._loader_thread is not None:
+            self._loader_thread.join(timeout=60)
+        self.consumer_pool.stop()
         self.status.status = "stopped"
         self.status.message = "服务已停止"
         self.status.last_update = datetime.now()
 
-    def _data_processing_loop(self):
-        """数据处理循环"""
-        while self.is_running:
-            try:
-                # 持续处理各个周期的分钟线数据
-                processed_any = False
-                for period in [1, 5, 15, 30]:
-                    count = self._process_bar_data(period)
-                    if count > 0:
-                        processed_any = True
-
-                if processed_any:
-                    self.status.last_update = datetime.now()
-                    self.status.message = "正在处理数据"
-                elif not self.is_processing:
-                    self.status.message = "等待数据"
-
-                # 如果是历史数据处理模式，处理间隔更短
-                sleep_time = 2 if self.is_processing else 10
-                time.sleep(sleep_time)
-
-            except Exception as e:
-                self.status.status = "error"
-                self.status.message = f"数据处理错误: {str(e)}"
-                self.status.last_update = datetime.now()
-                time.sleep(30)
-
     def _time_check_loop(self):
         """时间检查循环"""
         while self.is_running:
@@ -113,108 +127,84 @@ class MacDataService:
                 time.sleep(60)
 
     def _start_historical_data_processing(self):
-        """开始历史数据处理"""
+        """开始历史数据处理（在独立线程中运行，不阻塞时间检查循环）"""
+        if self._loader_thread is not None and self._loader_thread.is_alive():
+            return
         self.is_processing = True
+        self._loader_stop.clear()
         self.status.message = "正在处理历史数据"
         self.status.last_update = datetime.now()
+        self._loader_thread = threading.Thread(
+            target=self._run_historical_data_processing, name='nightly_loader', daemon=True
+        )
+        self._loader_thread.start()
 
+    def _run_historical_data_processing(self):
+        """夜间加载线程：暂停实时消费，加载完成后恢复"""
+        # 实时消费和夜间加载共用同一组Redis队列，加载期间暂停实时消费（已取出的数据先写入并确认）
+        self.consumer_pool.pause()
         try:
-            # 处理前一天的历史数据
-            total_processed = 0
+            # 处理前一天的历史数据（流水线加载，处理窗口结束或手动停止时不再取新批次）
+            result = self.nightly_loader.run(should_continue=lambda: not self._loader_stop.is_set())
+            total_processed = result['loaded_rows']
 
-            for period in [1, 5, 15, 30]:
-                processed_count = self._process_historical_bar_data(period)
-                total_processed += processed_count
-
-            # 清理Redis队列
-            self.redis_manager.clear_all_queues()
+            # 分笔队列不入库，直接清理；分钟线队列中的数据只在确认写入后删除
+            self.redis_manager.clear_queue(REDIS_QUEUES['whole_quote_data'])
+            # 开启服务端聚合后无人消费的高周期队列（如开启前积压的数据）一并清理，避免无限增长
+            for period in BAR_PERIODS:
+                if period not in INGEST_PERIODS:
+                    self.redis_manager.clear_queue(REDIS_QUEUES[f"bar_data_{period}min"])
 
             self.status.data_count = total_processed
             self.status.message = f"历史数据处理完成，共处理 {total_processed} 条记录"
+            if result['failed_batches']:
+                self.status.message += f"，{result['failed_batches']} 批写入失败已放回队列"
             self.status.last_update = datetime.now()
 
         except Exception as e:
             self.status.status = "error"
             self.status.message = f"历史数据处理错误: {str(e)}"
             self.status.last_update = datetime.now()
+        finally:
+            if self.is_running:
+                self.consumer_pool.resume()
 
     def _stop_historical_data_processing(self):
-        """停止历史数据处理"""
+        """停止历史数据处理（加载线程写完已取出的批次后退出）"""
         self.is_processing = False
+        self._loader_stop.set()
         self.status.message = "等待下次处理时间"
         self.status.last_update = datetime.now()
 
-    def _process_bar_data(self, period: int) -> int:
-        """处理历史分钟线数据，返回处理的数据条数"""
-        try:
-            bar_data_list = []
-
-            # 批量消费Redis队列中的历史分钟线数据
-            for _ in range(100):  # 每次最多处理100条
-                bar_data = self.redis_manager.consume_bar_data(period, timeout=1)
-                if bar_data:
-                    # 验证是否为交易时间内的数据
-                    bar_dict = {
-                        'frame': bar_data.frame,
-                        'symbol': bar_data.symbol,
-                        'open': bar_data.open,
-                        'high': bar_data.high,
-                        'low': bar_data.low,
-                        'close': bar_data.close,
-                        'vol': bar_data.vol,
-                        'amount': bar_data.amount
-                    }
-
-                    # 只处理交易时间内的历史数据
-                    if self.trading_validator.validate_bar_data(bar_dict):
-                        bar_data_list.append(bar_data)
-                    else:
-                        print(f"Mac端过滤非交易时间历史数据: {bar_data.symbol} at {bar_data.frame}")
-                else:
-                    break
-
-            # 批量插入ClickHouse（只存储历史数据）
-            if bar_data_list:
-                self.clickhouse_manager.insert_bar_data(bar_data_list, period)
-                self.status.data_count += len(bar_data_list)
-                return len(bar_data_list)
-
-            return 0
-
-        except Exception as e:
-            print(f"处理{period}分钟线历史数据错误: {e}")
-            return 0
-
-    def _process_historical_bar_data(self, period: int) -> int:
-        """处理历史分钟线数据"""
-        try:
-            bar_data_list = []
-            processed_count = 0
-
-            # 消费所有历史数据
-            while True:
-                bar_data = self.redis_manager.consume_bar_data(period, timeout=1)
-                if bar_data:
-                    bar_data_list.append(bar_data)
-
-                    # 批量插入（每1000条插入一次）
-                    if len(bar_data_list) >= 1000:
-                        self.clickhouse_manager.insert_bar_data(bar_data_list, period)
-                        processed_count += len(bar_data_list)
-                        bar_data_list = []
-                else:
-                    break
-
-            # 插入剩余数据
-            if bar_data_list:
-                self.clickhouse_manager.insert_bar_data(bar_data_list, period)
-                processed_count += len(bar_data_list)
+    def _decode_bar_data(self, period: int, payloads: list) -> list:
+        """工作池的解码函数：解码JSON并过滤非交易时间数据，返回待写入的行"""
+        bar_data_list = []
+
+        for bar_data in self.redis_manager.decode_bar_payloads(payloads):
+            # 验证是否为交易时间内的数据
+            bar_dict = {
+                'frame': bar_data.frame,
+                'symbol': bar_data.symbol,
+                'open': bar_data.open,
+                'high': bar_data.high,
+                'low': bar_data.low,
+                'close': bar_data.close,
+                'vol': bar_data.vol,
+                'amount': bar_data.amount
+            }
 
-            return processed_count
+            # 只处理交易时间内的历史数据
+            if self.trading_validator.validate_bar_data(bar_dict):
+                bar_data_list.append(bar_data)
+            else:
+                print(f"Mac端过滤非交易时间历史数据: {bar_data.symbol} at {bar_data.frame}")
 
-        except Exception as e:
-            print(f"处理{period}分钟线历史数据错误: {e}")
-            return 0
+        if bar_data_list:
+            self.status.data_count += len(bar_data_list)
+            self.status.last_update = datetime.now()
+            if not self.is_processing:
+                self.status.message = "正在处理数据"
+        return bar_data_list
 
     def get_status(self) -> SystemStatus:
         """获取服务状态"""
@@ -233,6 +223,7 @@ class MacDataService:
         """停止手动历史数据处理"""
         if self.is_processing:
             self.is_processing = False
+            self._loader_stop.set()
             self.status.message = "已停止历史数据处理"
             self.status.last_update = datetime.now()
             return True
@@ -247,6 +238,9 @@ class MacDataService:
             "service_status": self.status.model_dump(),
             "redis_info": redis_info,
             "clickhouse_info": clickhouse_info,
+            "insert_buffer": self.consumer_pool.get_insert_stats(),
+            "consumer_pool": self.consumer_pool.get_stats(),
+            "nightly_load": self.nightly_loader.get_progress(),
             "is_processing": self.is_processing
         }
 
@@ -254,15 +248,19 @@ class MacDataService:
 # 创建FastAPI应用
 app = FastAPI(title="Mac端数据处理服务")
 service = MacDataService()
+# 仪表板WebSocket推送：状态每隔一段时间计算一次，推送给所有连接
+live_broadcaster = LiveBroadcaster(status_func=service.get_system_info)
 
 @app.on_event("startup")
 async def startup_event():
     """启动事件"""
     service.start_service()
+    await live_broadcaster.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭事件"""
+    await live_broadcaster.stop()
     service.stop_service()
 
 @app.get("/", response_class=HTMLResponse)
@@ -333,51 +331,124 @@ async def get_dashboard():
             function updateStatus() {
                 fetch('/api/status')
                     .then(response => response.json())
-                    .then(data => {
-                        // 更新服务状态
-                        const serviceStatus = document.getElementById('service-status');
-                        const status = data.service_status;
-                        serviceStatus.innerHTML = `
-                            <p><strong>状态:</strong> <span class="badge bg-${status.status === 'running' ? 'success' : 'danger'}">${status.status}</span></p>
-                            <p><strong>消息:</strong> ${status.message}</p>
-                            <p><strong>数据计数:</strong> ${status.data_count}</p>
-                            <p><strong>最后更新:</strong> ${status.last_update}</p>
-                            <p><strong>正在处理:</strong> <span class="badge bg-${data.is_processing ? 'warning' : 'secondary'}">${data.is_processing ? '是' : '否'}</span></p>
-                        `;
-
-                        // 更新Redis状态
-                        const redisStatus = document.getElementById('redis-status');
-                        let redisHtml = '';
-                        for (const [key, value] of Object.entries(data.redis_info)) {
-                            redisHtml += `<p><strong>${key}:</strong> ${value}</p>`;
-                        }
-                        redisStatus.innerHTML = redisHtml;
-
-                        // 更新ClickHouse状态
-                        const clickhouseStatus = document.getElementById('clickhouse-status');
-                        let clickhouseHtml = '';
-                        for (const [key, value] of Object.entries(data.clickhouse_info)) {
-                            clickhouseHtml += `<p><strong>${key}:</strong> ${value}</p>`;
-                        }
-                        clickhouseStatus.innerHTML = clickhouseHtml;
-
-                        // 更新按钮状态
-                        const startBtn = document.getElementById('startProcessing');
-                        const stopBtn = document.getElementById('stopProcessing');
-
-                        if (data.is_processing) {
-                            startBtn.disabled = true;
-                            stopBtn.disabled = false;
-                        } else {
-                            startBtn.disabled = false;
-                            stopBtn.disabled = true;
-                        }
-                    })
+                    .then(data => renderStatus(data))
                     .catch(error => {
                         console.error('Error:', error);
                     });
             }
 
+            function renderStatus(data) {
+                // 更新服务状态
+                const serviceStatus = document.getElementById('service-status');
+                const status = data.service_status;
+                serviceStatus.innerHTML = `
+                    <p><strong>状态:</strong> <span class="badge bg-${status.status === 'running' ? 'success' : 'danger'}">${status.status}</span></p>
+                    <p><strong>消息:</strong> ${status.message}</p>
+                    <p><strong>数据计数:</strong> ${status.data_count}</p>
+                    <p><strong>最后更新:</strong> ${status.last_update}</p>
+                    <p><strong>正在处理:</strong> <span class="badge bg-${data.is_processing ? 'warning' : 'secondary'}">${data.is_processing ? '是' : '否'}</span></p>
+                `;
+
+                // 更新Redis状态
+                const redisStatus = document.getElementById('redis-status');
+                let redisHtml = '';
+                for (const [key, value] of Object.entries(data.redis_info)) {
+                    redisHtml += `<p><strong>${key}:</strong> ${value}</p>`;
+                }
+                redisStatus.innerHTML = redisHtml;
+
+                // 更新ClickHouse状态
+                const clickhouseStatus = document.getElementById('clickhouse-status');
+                let clickhouseHtml = '';
+                for (const [key, value] of Object.entries(data.clickhouse_info)) {
+                    clickhouseHtml += `<p><strong>${key}:</strong> ${value}</p>`;
+                }
+                clickhouseStatus.innerHTML = clickhouseHtml;
+
+                // 更新写缓冲状态
+                const buffer = data.insert_buffer;
+                const depth = Object.entries(buffer.depth).map(([key, value]) => `${key}min: ${value}`).join('，') || '空';
+                clickhouseStatus.innerHTML += `
+                    <hr>
+                    <p><strong>写缓冲深度:</strong> ${buffer.pending_rows} 条（${depth}）</p>
+                    <p><strong>已写入:</strong> ${buffer.flushed_rows} 条 / ${buffer.flush_count} 批，失败 ${buffer.failed_flushes} 次</p>
+                    <p><strong>写入延迟:</strong> 最近 ${buffer.last_flush_latency_ms.toFixed(1)} ms，平均 ${buffer.avg_flush_latency_ms.toFixed(1)} ms，最大 ${buffer.max_flush_latency_ms.toFixed(1)} ms</p>
+                `;
+
+                // 夜间加载进度
+                const load = data.nightly_load;
+                if (load.running || load.loaded_rows > 0) {
+                    const eta = load.eta_seconds === null ? '未知' : `${Math.round(load.eta_seconds)} 秒`;
+                    clickhouseStatus.innerHTML += `
+                        <p><strong>夜间加载:</strong> 已写入 ${load.loaded_rows} 条，剩余 ${load.remaining_rows} 条，
+                        ${Math.round(load.rows_per_second)} 条/秒，预计剩余 ${eta}，失败 ${load.failed_batches} 批</p>
+                    `;
+                }
+
+                // 更新消费工作池状态（各周期队列深度和线程利用率）
+                for (const [period, pool] of Object.entries(data.consumer_pool)) {
+                    clickhouseStatus.innerHTML += `
+                        <p><strong>${period}:</strong> 解码队列 ${pool.decode_queue}/${pool.decode_queue_size}，
+                        待写入 ${pool.insert_pending_rows}/${pool.insert_pending_limit} 条，
+                        解码 ${(pool.decode_utilization * 100).toFixed(0)}%（阻塞 ${(pool.decode_blocked * 100).toFixed(0)}%），
+                        写入 ${(pool.insert_utilization * 100).toFixed(0)}%</p>
+                    `;
+                }
+
+                // 更新按钮状态
+                const startBtn = document.getElementById('startProcessing');
+                const stopBtn = document.getElementById('stopProcessing');
+
+                if (data.is_processing) {
+                    startBtn.disabled = true;
+                    stopBtn.disabled = false;
+                } else {
+                    startBtn.disabled = false;
+                    stopBtn.disabled = true;
+                }
+            }
+
+            // 合并服务端推送的状态差异（值为null的字段表示已删除）
+            function mergeDelta(target, delta) {
+                for (const [key, value] of Object.entries(delta)) {
+                    if (value === null) {
+                        delete target[key];
+                    } else if (typeof value === 'object' && !Array.isArray(value)
+                               && typeof target[key] === 'object' && target[key] !== null) {
+                        mergeDelta(target[key], value);
+                    } else {
+                        target[key] = value;
+                    }
+                }
+                return target;
+            }
+
+            // WebSocket实时推送，连接断开时退回定时轮询并稍后重连
+            let liveStatus = {};
+            let pollTimer = null;
+            function connectLive() {
+                const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws/live`);
+                ws.onopen = () => {
+                    if (pollTimer) {
+                        clearInterval(pollTimer);
+                        pollTimer = null;
+                    }
+                };
+                ws.onmessage = event => {
+                    const message = JSON.parse(event.data);
+                    if (message.type === 'status') {
+                        liveStatus = message.full ? message.data : mergeDelta(liveStatus, message.data);
+                        renderStatus(liveStatus);
+                    }
+                };
+                ws.onclose = () => {
+                    if (!pollTimer) {
+                        pollTimer = setInterval(updateStatus, 5000);
+                    }
+                    setTimeout(connectLive, 5000);
+                };
+            }
+
             function controlProcessing(action) {
                 const statusDiv = document.getElementById('processingStatus');
                 statusDiv.innerHTML = '<div class="alert alert-info">正在执行操作...</div>';
@@ -417,14 +488,19 @@ async def get_dashboard():
                 });
             });
 
-            // 初始加载和定时更新
+            // 初始加载，之后由WebSocket推送状态变化
             updateStatus();
-            setInterval(updateStatus, 5000);
+            connectLive();
         </script>
     </body>
     </html>
     """
 
+@app.websocket("/ws/live")
+async def live_updates(websocket: WebSocket):
+    """仪表板实时推送（首次发送完整状态，之后只发送变化的部分）"""
+    await live_broadcaster.handle(websocket)
+
 @app.get("/api/status")
 async def get_status():
     """获取系统状态API"""
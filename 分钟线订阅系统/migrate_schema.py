@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+ClickHouse表结构迁移脚本
+将 data_bar_for_{n}min 表从v1结构按月分区逐个复制到v2结构
+
+用法:
+    python migrate_schema.py                 # 迁移全部周期
+    python migrate_schema.py --periods 1 5   # 只迁移指定周期
+    python migrate_schema.py --drop-old      # 迁移完成后删除v1备份表
+    python migrate_schema.py --rollups       # 由1分钟线回填高周期聚合表
+    python migrate_schema.py --cross-section # 回填 (frame, symbol) 排序的截面副本表
+
+迁移前必须停止Mac端服务和所有消费者：替换原表前会重新复制复制期间有新写入的分区，
+但追赶之后到 RENAME 之间写入的数据只会进入v1备份表
+
+迁移完成后请将 config.py 中的 CLICKHOUSE_SCHEMA_VERSION 修改为 'v2'
+"""
+import argparse
+import logging
+
+from config import BAR_PERIODS
+from database import ClickHouseManager
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='分钟线表结构迁移（v1 → v2）')
+    parser.add_argument('--periods', type=int, nargs='+', default=BAR_PERIODS,
+                        help='需要迁移的周期，默认全部周期')
+    parser.add_argument('--drop-old', action='store_true', help='迁移完成后删除v1备份表')
+    parser.add_argument('--rollups', action='store_true', help='只回填高周期聚合表，不迁移表结构')
+    parser.add_argument('--cross-section', action='store_true', help='只回填截面副本表，不迁移表结构')
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+
+    print("=" * 60)
+    print("分钟线表结构迁移（v1 → v2）")
+    print("=" * 60)
+
+    clickhouse_manager = ClickHouseManager()
+
+    if not args.rollups and not args.cross_section:
+        print("迁移期间请确认Mac端服务和所有消费者已停止写入")
+
+    if args.rollups:
+        for table_name, months in clickhouse_manager.backfill_rollups(periods=args.periods).items():
+            print(f"✓ {table_name}: 回填 {months} 个月分区")
+        return
+
+    if args.cross_section:
+        for table_name, months in clickhouse_manager.backfill_cross_section(periods=args.periods).items():
+            print(f"✓ {table_name}: 回填 {months} 个月分区")
+        return
+
+    summary = clickhouse_manager.migrate_to_v2(periods=args.periods, drop_old=args.drop_old)
+
+    for table_name, result in summary.items():
+        if result['status'] == 'migrated':
+            print(f"✓ {table_name}: {result['months']} 个月分区，共 {result['rows']} 条")
+            if result['backup_table']:
+                print(f"  原表已保留为 {result['backup_table']}")
+            print(f"  存储信息: {clickhouse_manager.get_storage_info(table_name)}")
+        else:
+            print(f"- {table_name}: {result['message']}")
+
+    print("\n迁移完成后请将 config.py 中的 CLICKHOUSE_SCHEMA_VERSION 修改为 'v2'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Mac端夜间历史分钟线加载（流水线）
+
+    Redis批量取出（原子转移到在途列表） → 解码为列式数据 → 并发写入ClickHouse → 确认后删除在途列表
+
+- 三个阶段重叠执行：取数在主线程，解码和写入各有线程池，在途批次数有上限以控制内存
+- 批次大小按每个周期实测的写入速度自动调整，使单次写入耗时接近目标值
+- 只有写入ClickHouse成功的批次才从Redis删除；写入失败的批次放回队列，进程中断遗留的批次下次启动时放回
+- 运行中按间隔输出吞吐量和预计剩余时间，get_progress() 返回同样的信息
+"""
+import itertools
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from config import NIGHTLY_LOAD_CONFIG, REDIS_QUEUES
+from data_processor import payloads_to_columns
+
+
+class NightlyBarLoader:
+    """夜间历史分钟线流水线加载器"""
+
+    def __init__(self, redis_manager, clickhouse_manager, periods: List[int],
+                 on_inserted: Optional[Callable[[int, dict], None]] = None, name: str = 'nightly_loader'):
+        """
+        Args:
+            redis_manager: RedisManager
+            clickhouse_manager: ClickHouseManager
+            periods: 加载的周期
+            on_inserted: 每批写入成功后的回调，参数为 (周期, 列式数据)
+            name: 名称，作为在途批次号的前缀（只放回自己遗留的在途批次）
+        """
+        self.redis_manager = redis_manager
+        self.clickhouse_manager = clickhouse_manager
+        self.periods = list(periods)
+        self.name = name
+        self.on_inserted = on_inserted
+        self.config = NIGHTLY_LOAD_CONFIG
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._batch_ids = itertools.count()
+        self._batch_sizes = {period: self.config['initial_batch_size'] for period in self.periods}
+        self._failed_periods = set()
+        self._progress = self._new_progress(0, running=False)
+
+    def run(self, should_continue: Callable[[], bool] = lambda: True) -> dict:
+        """
+        加载各周期队列中的全部历史数据
+
+        Args:
+            should_continue: 返回False时停止取新批次（已取出的批次仍会写完并确认）
+
+        Returns:
+            加载结果（与 get_progress 相同，另含各周期写入条数 loaded_by_period）
+        """
+        # 只放回本加载器上次遗留的在途批次；暂停中的实时消费池仍持有的批次由它自己写入或放回
+        recovered = self.redis_manager.release_all_bar_batches(owner=self.name)
+        if recovered:
+            print(f"放回上次中断的在途数据 {recovered} 条")
+
+        self._failed_periods = set()
+        self._progress = self._new_progress(self._queued_rows())
+        max_inflight = self.config['decode_workers'] + self.config['insert_workers'] * 2
+        slots = threading.BoundedSemaphore(max_inflight)
+        decode_pool = ThreadPoolExecutor(self.config['decode_workers'], thread_name_prefix='nightly_decode')
+        insert_pool = ThreadPoolExecutor(self.config['insert_workers'], thread_name_prefix='nightly_insert')
+        decode_futures = []
+        last_report = time.monotonic()
+
+        try:
+            active = list(self.periods)
+            while active and should_continue():
+                # 各周期轮流取一批，避免某个周期独占写入线程
+                for period in list(active):
+                    if period in self._failed_periods:
+                        active.remove(period)
+                        continue
+
+                    slots.acquire()
+                    try:
+                        inflight_key, payloads = self.redis_manager.claim_bar_batch(
+                            period, f"{self.name}:{int(time.time())}:{next(self._batch_ids)}", self._batch_sizes[period]
+                        )
+                    except Exception:
+                        slots.release()
+                        raise
+                    if not payloads:
+                        slots.release()
+                        active.remove(period)
+                        continue
+
+                    decode_futures.append(decode_pool.submit(
+                        self._decode_batch, period, inflight_key, payloads, insert_pool, slots
+                    ))
+
+                if time.monotonic() - last_report >= self.config['report_interval']:
+                    self._report()
+                    last_report = time.monotonic()
+
+            # 等待已取出的批次全部写入并确认
+            for future in decode_futures:
+                insert_future = future.result()
+                if insert_future is not None:
+                    insert_future.result()
+        finally:
+            decode_pool.shutdown(wait=True)
+            insert_pool.shutdown(wait=True)
+
+        self._report()
+        with self._lock:
+            self._progress['running'] = False
+            return dict(self._progress)
+
+    def get_progress(self) -> dict:
+        """加载进度：已写入条数、吞吐量、预计剩余时间、各周期当前批次大小"""
+        with self._lock:
+            progress = dict(self._progress)
+        progress['batch_sizes'] = {f"{period}min": size for period, size in self._batch_sizes.items()}
+        return progress
+
+    def _new_progress(self, queued_rows: int, running: bool = True) -> dict:
+        return {
+            'running': running,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'started': time.monotonic(),
+            'queued_rows': queued_rows,
+            'remaining_rows': queued_rows,
+            'loaded_rows': 0,
+            'loaded_by_period': {period: 0 for period in self.periods},
+            'batches': 0,
+            'failed_batches': 0,
+            'failed_periods': [],
+            'rows_per_second': 0.0,
+            'eta_seconds': None
+        }
+
+    def _queued_rows(self) -> int:
+        """各周期队列中待加载的条数"""
+        pipe = self.redis_manager.client.pipeline(transaction=False)
+        for period in self.periods:
+            pipe.llen(REDIS_QUEUES[f"bar_data_{period}min"])
+        return sum(pipe.execute())
+
+    def _decode_batch(self, period: int, inflight_key: str, payloads: List[str],
+                      insert_pool: ThreadPoolExecutor, slots: threading.BoundedSemaphore):
+        """解码阶段：JSON转换为列式数据后交给写入线程池，返回写入任务"""
+        try:
+            columns = payloads_to_columns(payloads)
+            return insert_pool.submit(self._insert_batch, period, inflight_key, columns, slots)
+        except Exception as e:
+            self._fail_batch(period, inflight_key, f"解码失败: {e}")
+            slots.release()
+            return None
+
+    def _insert_batch(self, period: int, inflight_key: str, columns: dict, slots: threading.BoundedSemaphore):
+        """写入阶段：列式写入ClickHouse，成功后删除在途列表并调整批次大小"""
+        try:
+            rows = len(columns['frame'])
+            start = time.perf_counter()
+            self.clickhouse_manager.insert_bar_columns(columns, period)
+            elapsed = time.perf_counter() - start
+
+            self.redis_manager.confirm_bar_batch(inflight_key)
+        except Exception as e:
+            self._fail_batch(period, inflight_key, f"写入失败: {e}")
+            slots.release()
+            return
+
+        self._tune_batch_size(period, rows, elapsed)
+        with self._lock:
+            self._progress['loaded_rows'] += rows
+            self._progress['loaded_by_period'][period] += rows
+            self._progress['batches'] += 1
+
+        try:
+            if self.on_inserted is not None:
+                self.on_inserted(period, columns)
+        except Exception as e:
+            self.logger.error(f"{period}分钟线批次 {inflight_key} 已写入，后续处理失败: {e}")
+        finally:
+            slots.release()
+
+    def _fail_batch(self, period: int, inflight_key: str, reason: str):
+        """批次放回队列，该周期停止取新批次（留给下次加载或实时消费）"""
+        self.logger.error(f"{period}分钟线批次 {inflight_key} {reason}，放回队列")
+        try:
+            self.redis_manager.release_bar_batch(inflight_key)
+        except Exception as e:
+            self.logger.error(f"放回批次 {inflight_key} 失败（下次加载时放回）: {e}")
+        with self._lock:
+            self._failed_periods.add(period)
+            self._progress['failed_batches'] += 1
+            self._progress['failed_periods'] = sorted(self._failed_periods)
+
+    def _tune_batch_size(self, period: int, rows: int, elapsed: float):
+        """按本批写入速度调整下一批大小，使单次写入耗时接近目标值（平滑调整）"""
+        if rows <= 0 or elapsed <= 0:
+            return
+        target = rows / elapsed * self.config['target_insert_seconds']
+        size = (self._batch_sizes[period] + target) / 2
+        self._batch_sizes[period] = int(min(max(size, self.config['min_batch_size']), self.config['max_batch_size']))
+
+    def _report(self):
+        """更新并输出吞吐量和预计剩余时间"""
+        try:
+            remaining = self._queued_rows()
+        except Exception:
+            remaining = None
+
+        with self._lock:
+            progress = self._progress
+            elapsed = max(time.monotonic() - progress['started'], 1e-6)
+            progress['rows_per_second'] = progress['loaded_rows'] / elapsed
+            if remaining is not None:
+                progress['remaining_rows'] = remaining
+            progress['eta_seconds'] = (
+                progress['remaining_rows'] / progress['rows_per_second'] if progress['rows_per_second'] else None
+            )
+            loaded, speed, eta = progress['loaded_rows'], progress['rows_per_second'], progress['eta_seconds']
+            remaining = progress['remaining_rows']
+
+        eta_text = f"{eta:.0f} 秒" if eta is not None else "未知"
+        print(f"夜间加载: 已写入 {loaded} 条，剩余 {remaining} 条，{speed:.0f} 条/秒，预计剩余 {eta_text}")
@@ -13,6 +13,7 @@ import uuid
 import logging
 
 from models import BarData, HistoricalDataRequest, HistoricalDataResponse
+from config import BAR_ROLLUP_ENABLED
 from database import RedisManager
 from trading_time_validator import TradingTimeValidator
 
@@ -118,8 +119,9 @@ class QMTHistoricalFetcher:
                     self.task_status[task_id]["processed_symbols"] = processed_symbols
                     self.task_status[task_id]["message"] = f"正在处理 {symbol}"
 
-                    # 获取各个周期的数据
-                    for period in request.periods:
+                    # 获取各个周期的数据（开启服务端聚合时只需1分钟线，高周期由ClickHouse生成）
+                    periods = [1] if BAR_ROLLUP_ENABLED else request.periods
+                    for period in periods:
                         bars = self._fetch_symbol_data(symbol, request.start_time, request.end_time, period)
 
                         # 过滤交易时间内的数据并发布到Redis（标记为历史数据）
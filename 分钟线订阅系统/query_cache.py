@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+历史分钟线查询缓存
+ClickHouse中的历史数据入库后不再变化，按 (symbol, period, 交易日) 缓存列式数据块：
+- 第一层：进程内LRU
+- 第二层：可选的Redis共享缓存（多个Client进程共用）
+查询时由缓存的按日数据块拼接，只有缺失的日期才查询ClickHouse。
+今天的数据（尾部）仍在写入，只在版本号未变化且不超过版本号检查间隔时复用。
+
+Mac端每次写入ClickHouse后递增对应周期的缓存版本号（epoch），
+Client端发现版本号变化后丢弃该周期的全部缓存块。
+"""
+import io
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import redis
+
+from config import REDIS_CONFIG, QUERY_CACHE_CONFIG
+from data_processor import BAR_COLUMN_DTYPES, MORNING_START, empty_bar_columns
+
+
+CACHE_EPOCH_KEY = 'bar_cache:epoch:{period}'
+CACHE_BLOCK_KEY = 'bar_cache:{period}:{epoch}:{symbol}:{day}'
+
+# 缓存块中保存的列（单股票数据块不保存symbol列，取出时按股票代码补齐）
+BLOCK_COLUMNS = [name for name in BAR_COLUMN_DTYPES if name != 'symbol']
+
+
+def bump_cache_epoch(redis_client, periods: List[int]):
+    """递增指定周期的缓存版本号，使各Client端的缓存失效（Mac端写入ClickHouse后调用）"""
+    pipe = redis_client.pipeline()
+    for period in periods:
+        pipe.incr(CACHE_EPOCH_KEY.format(period=period))
+    pipe.execute()
+
+
+def encode_block(columns: Dict[str, np.ndarray]) -> bytes:
+    """列式数据块编码为紧凑的二进制（npz，不含Python对象）"""
+    buffer = io.BytesIO()
+    np.savez(buffer, **{name: np.ascontiguousarray(columns[name]) for name in BLOCK_COLUMNS})
+    return buffer.getvalue()
+
+
+def decode_block(payload: bytes) -> Dict[str, np.ndarray]:
+    """解码encode_block生成的二进制数据块"""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return {name: data[name] for name in BLOCK_COLUMNS}
+
+
+class BarQueryCache:
+    """
+    按交易日分块的历史分钟线缓存
+
+    只缓存今天之前的日期；没有数据的日期（周末、停牌）同样缓存为空块，避免重复查询。
+    今天的部分按 (symbol, period) 保留最近一次查询结果，短时间内的重复查询直接复用。
+    """
+
+    def __init__(self, fetch_func: Callable[[str, datetime, datetime, int], Dict[str, np.ndarray]],
+                 redis_client=None, max_blocks: int = None, redis_enabled: bool = None,
+                 redis_ttl: int = None, epoch_check_interval: float = None):
+        """
+        Args:
+            fetch_func: 查询ClickHouse的函数，参数为 (symbol, start_time, end_time, period, settings=...)，返回列式数据
+            redis_client: 读取缓存版本号的Redis客户端（decode_responses=True）
+            max_blocks: 进程内LRU最多缓存的数据块数量
+            redis_enabled: 是否启用Redis共享缓存
+            redis_ttl: Redis缓存块的过期时间（秒）
+            epoch_check_interval: 检查缓存版本号的最小间隔（秒）
+        """
+        self.fetch_func = fetch_func
+        self.redis_client = redis_client
+        self.max_blocks = max_blocks or QUERY_CACHE_CONFIG['max_blocks']
+        self.redis_ttl = redis_ttl or QUERY_CACHE_CONFIG['redis_ttl']
+        self.epoch_check_interval = (
+            epoch_check_interval if epoch_check_interval is not None
+            else QUERY_CACHE_CONFIG['epoch_check_interval']
+        )
+        if redis_enabled is None:
+            redis_enabled = QUERY_CACHE_CONFIG['redis_enabled']
+        # 缓存块为二进制数据，需要单独的不解码响应的连接
+        self.block_client = (
+            redis.Redis(**{**REDIS_CONFIG, 'decode_responses': False}) if redis_enabled else None
+        )
+        self.logger = logging.getLogger(__name__)
+
+        self._blocks: 'OrderedDict[Tuple[str, int, date], Dict[str, np.ndarray]]' = OrderedDict()
+        self._epochs: Dict[int, int] = {}
+        self._epoch_checked: Dict[int, float] = {}
+        # (symbol, period) -> (版本号, 查询时间, 开始时间, 结束时间, 列式数据)
+        self._tails: Dict[Tuple[str, int], Tuple[int, float, datetime, datetime, Dict[str, np.ndarray]]] = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'memory_hits': 0,
+            'redis_hits': 0,
+            'tail_hits': 0,
+            'misses': 0,
+            'clickhouse_queries': 0,
+            'invalidations': 0
+        }
+
+    def get_columns(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                    settings: dict = None) -> Dict[str, np.ndarray]:
+        """
+        查询历史分钟线（列式），结果与 ClickHouseManager.query_bar_frame 相同
+
+        时间范围包含今天的部分不按日缓存，由 _get_tail 查询ClickHouse或复用最近一次的结果；
+        今天的部分在开盘之前结束时（如只到今天零点）不可能有数据，不查询。
+        settings 只影响查询执行（线程数、超时等），未命中缓存时传给ClickHouse查询，不影响缓存的结果。
+        """
+        today = date.today()
+        cache_end = min(end_time, datetime.combine(today, datetime.min.time()) - timedelta(seconds=1))
+        epoch = self._current_epoch(period)
+
+        parts = []
+        if start_time <= cache_end:
+            days = [start_time.date() + timedelta(days=i) for i in range((cache_end.date() - start_time.date()).days + 1)]
+            blocks = self._get_blocks(symbol, period, days, epoch, settings)
+            parts = [blocks[day] for day in days]
+        session_open = datetime.combine(today, datetime.min.time()) + timedelta(minutes=MORNING_START)
+        if end_time > cache_end and end_time >= session_open:
+            tail_start = max(start_time, cache_end + timedelta(seconds=1))
+            parts.append(self._get_tail(symbol, tail_start, end_time, period, epoch, settings))
+        if not parts:
+            parts = [self._strip_symbol(empty_bar_columns())]
+
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in BLOCK_COLUMNS}
+        mask = (columns['frame'] >= np.datetime64(start_time, 's')) & (columns['frame'] <= np.datetime64(end_time, 's'))
+        result = {name: values[mask] for name, values in columns.items()}
+        result['symbol'] = np.full(len(result['frame']), symbol, dtype=object)
+        return {name: result[name] for name in BAR_COLUMN_DTYPES}
+
+    def invalidate(self, period: int = None):
+        """丢弃进程内指定周期（默认全部周期）的缓存块"""
+        with self._lock:
+            keys = [key for key in self._blocks if period is None or key[1] == period]
+            for key in keys:
+                del self._blocks[key]
+            for key in [key for key in self._tails if period is None or key[1] == period]:
+                del self._tails[key]
+            self.stats['invalidations'] += 1
+
+    def get_stats(self) -> dict:
+        """缓存命中统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['blocks'] = len(self._blocks)
+            stats['epochs'] = dict(self._epochs)
+        lookups = stats['memory_hits'] + stats['redis_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['redis_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _current_epoch(self, period: int) -> int:
+        """读取周期的缓存版本号，版本号变化时清空该周期的进程内缓存"""
+        if self.redis_client is None:
+            return 0
+
+        now = time.monotonic()
+        if period in self._epochs and now - self._epoch_checked.get(period, 0) < self.epoch_check_interval:
+            return self._epochs[period]
+
+        try:
+            epoch = int(self.redis_client.get(CACHE_EPOCH_KEY.format(period=period)) or 0)
+        except Exception as e:
+            self.logger.warning(f"读取缓存版本号失败，跳过缓存: {e}")
+            self.invalidate(period)
+            return -1
+
+        if self._epochs.get(period) != epoch:
+            if period in self._epochs:
+                self.invalidate(period)
+            self._epochs[period] = epoch
+        self._epoch_checked[period] = now
+        return epoch
+
+    def _get_blocks(self, symbol: str, period: int, days: List[date], epoch: int,
+                    settings: dict = None) -> Dict[date, Dict[str, np.ndarray]]:
+        """按日期取缓存块，缺失的连续日期合并为一次ClickHouse查询"""
+        blocks = {}
+        missing = []
+
+        # 1. 进程内LRU
+        with self._lock:
+            for day in days:
+                block = self._blocks.get((symbol, period, day))
+                if block is not None:
+                    self._blocks.move_to_end((symbol, period, day))
+                    blocks[day] = block
+                else:
+                    missing.append(day)
+            self.stats['memory_hits'] += len(blocks)
+
+        # 2. Redis共享缓存
+        if missing and self.block_client is not None and epoch >= 0:
+            try:
+                payloads = self.block_client.mget(
+                    [self._block_key(symbol, period, day, epoch) for day in missing]
+                )
+                still_missing = []
+                for day, payload in zip(missing, payloads):
+                    if payload is None:
+                        still_missing.append(day)
+                    else:
+                        blocks[day] = decode_block(payload)
+                        self._store_local(symbol, period, day, blocks[day])
+                self.stats['redis_hits'] += len(missing) - len(still_missing)
+                missing = still_missing
+            except Exception as e:
+                self.logger.warning(f"读取Redis缓存失败: {e}")
+
+        # 3. ClickHouse（连续缺失日期合并为一次查询）
+        if missing:
+            self.stats['misses'] += len(missing)
+            fetched = {}
+            for first_day, last_day in self._day_ranges(missing):
+                fetched.update(self._fetch_days(symbol, period, first_day, last_day, settings))
+            for day, block in fetched.items():
+                blocks[day] = block
+                if epoch >= 0:
+                    self._store_local(symbol, period, day, block)
+            if self.block_client is not None and epoch >= 0:
+                self._store_redis(symbol, period, fetched, epoch)
+
+        return blocks
+
+    def _get_tail(self, symbol: str, start_time: datetime, end_time: datetime, period: int,
+                  epoch: int, settings: dict = None) -> Dict[str, np.ndarray]:
+        """
+        查询今天的数据（不含symbol列）
+
+        最近一次查询的范围覆盖本次范围、版本号未变化且查询时间不超过版本号检查间隔时直接复用，
+        否则查询ClickHouse并替换该股票周期的尾部结果。
+        """
+        now = time.monotonic()
+        key = (symbol, period)
+        with self._lock:
+            tail = self._tails.get(key)
+            if (tail is not None and epoch >= 0 and tail[0] == epoch and now - tail[1] < self.epoch_check_interval
+                    and tail[2] <= start_time and end_time <= tail[3]):
+                self.stats['tail_hits'] += 1
+                return tail[4]
+
+        columns = self._strip_symbol(self.fetch_func(symbol, start_time, end_time, period, settings=settings))
+        self.stats['clickhouse_queries'] += 1
+        if epoch >= 0:
+            with self._lock:
+                self._tails[key] = (epoch, now, start_time, end_time, columns)
+        return columns
+
+    def _fetch_days(self, symbol: str, period: int, first_day: date, last_day: date,
+                    settings: dict = None) -> Dict[date, Dict[str, np.ndarray]]:
+        """查询连续日期范围并按日切分为数据块"""
+        start_time = datetime.combine(first_day, datetime.min.time())
+        end_time = datetime.combine(last_day, datetime.max.time().replace(microsecond=0))
+        columns = self._strip_symbol(self.fetch_func(symbol, start_time, end_time, period, settings=settings))
+        self.stats['clickhouse_queries'] += 1
+
+        # 结果按frame有序，按日边界二分切分
+        day_count = (last_day - first_day).days + 1
+        boundaries = np.arange(
+            np.datetime64(first_day, 'D'), np.datetime64(last_day, 'D') + 2, dtype='datetime64[D]'
+        ).astype('datetime64[s]')
+        offsets = np.searchsorted(columns['frame'], boundaries)
+
+        return {
+            first_day + timedelta(days=i): {
+                name: columns[name][offsets[i]:offsets[i + 1]].copy() for name in BLOCK_COLUMNS
+            }
+            for i in range(day_count)
+        }
+
+    @staticmethod
+    def _day_ranges(days: List[date]) -> List[Tuple[date, date]]:
+        """有序日期列表合并为连续区间"""
+        ranges = []
+        for day in days:
+            if ranges and (day - ranges[-1][1]).days == 1:
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+
+    @staticmethod
+    def _strip_symbol(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """去掉symbol列并统一列类型"""
+        if not len(columns['frame']):
+            columns = empty_bar_columns()
+        return {name: np.asarray(columns[name], dtype=BAR_COLUMN_DTYPES[name]) for name in BLOCK_COLUMNS}
+
+    @staticmethod
+    def _block_key(symbol: str, period: int, day: date, epoch: int) -> str:
+        return CACHE_BLOCK_KEY.format(period=period, epoch=epoch, symbol=symbol, day=day.strftime('%Y%m%d'))
+
+    def _store_local(self, symbol: str, period: int, day: date, block: Dict[str, np.ndarray]):
+        """写入进程内LRU，超出容量时淘汰最久未使用的数据块"""
+        with self._lock:
+            self._blocks[(symbol, period, day)] = block
+            self._blocks.move_to_end((symbol, period, day))
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+    def _store_redis(self, symbol: str, period: int, blocks: Dict[date, Dict[str, np.ndarray]], epoch: int):
+        """写入Redis共享缓存"""
+        try:
+            pipe = self.block_client.pipeline()
+            for day, block in blocks.items():
+                pipe.set(self._block_key(symbol, period, day, epoch), encode_block(block), ex=self.redis_ttl)
+            pipe.execute()
+        except Exception as e:
+            self.logger.warning(f"写入Redis缓存失败: {e}")
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+ClickHouse表结构性能测试
+对比v1与v2分钟线表结构的磁盘占用和范围扫描耗时
+
+测试数据在ClickHouse内部由 numbers() 生成，按交易时段（每日240根1分钟线）排列。
+
+用法:
+    python schema_benchmark.py --symbols 500 --days 60 --repeat 10
+"""
+import argparse
+import time
+import statistics
+
+from database import ClickHouseManager, BAR_COLUMNS
+
+
+BENCH_TABLES = {
+    'v1': 'bench_schema_v1',
+    'v2': 'bench_schema_v2'
+}
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='分钟线表结构性能测试')
+    parser.add_argument('--symbols', type=int, default=500, help='股票数量，默认500')
+    parser.add_argument('--days', type=int, default=60, help='交易日数量，默认60')
+    parser.add_argument('--repeat', type=int, default=10, help='每个查询重复次数，默认10')
+    parser.add_argument('--keep', action='store_true', help='测试结束后保留测试表')
+    return parser.parse_args()
+
+
+def generate_data(clickhouse_manager: ClickHouseManager, table_name: str, symbols: int, days: int):
+    """生成测试数据：每只股票每日240根1分钟线，价格为带噪声的随机游走近似"""
+    clickhouse_manager.client.command(f"""
+    INSERT INTO {table_name} ({', '.join(BAR_COLUMNS)})
+    SELECT
+        concat(leftPad(toString(number % {symbols}), 6, '0'), if(number % 2 = 0, '.SZ', '.SH')) AS symbol,
+        toDateTime('2024-01-02 00:00:00')
+            + intDiv(intDiv(number, {symbols}), 240) * 86400
+            + if(intDiv(number, {symbols}) % 240 < 120,
+                 570 + intDiv(number, {symbols}) % 240,
+                 780 + intDiv(number, {symbols}) % 240 - 120) * 60 AS frame,
+        round(10 + number % {symbols} % 90 + 2 * sin(intDiv(number, {symbols}) / 97), 2) AS open,
+        round(open + (rand() % 50) / 1000, 2) AS high,
+        round(open - (rand(1) % 50) / 1000, 2) AS low,
+        round(low + (high - low) * (rand(2) % 100) / 100, 2) AS close,
+        100 * (rand(3) % 5000) AS vol,
+        round(vol * close, 2) AS amount
+    FROM numbers({symbols * days * 240})
+    """)
+    clickhouse_manager.client.command(f"OPTIMIZE TABLE {table_name} FINAL")
+
+
+def time_query(clickhouse_manager: ClickHouseManager, sql: str, repeat: int) -> float:
+    """执行查询并返回耗时中位数（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clickhouse_manager.client.query(sql)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    clickhouse_manager = ClickHouseManager()
+
+    queries = {
+        '单股票一个月范围扫描': """
+            SELECT symbol, frame, open, high, low, close, vol, amount FROM {table}
+            WHERE symbol = '000001.SH' AND frame >= '2024-01-02 00:00:00' AND frame < '2024-02-01 00:00:00'
+            ORDER BY frame
+        """,
+        '全市场单日聚合': """
+            SELECT symbol, max(high), min(low), sum(vol) FROM {table}
+            WHERE frame >= '2024-01-10 00:00:00' AND frame < '2024-01-11 00:00:00'
+            GROUP BY symbol
+        """,
+        '全表收盘价扫描': "SELECT avg(close) FROM {table}"
+    }
+
+    results = {}
+    for version, table_name in BENCH_TABLES.items():
+        print(f"生成 {version} 测试数据: {args.symbols} 只股票 × {args.days} 个交易日...")
+        clickhouse_manager.client.command(f"DROP TABLE IF EXISTS {table_name}")
+        clickhouse_manager.client.command(clickhouse_manager._build_create_sql(table_name, version))
+        generate_data(clickhouse_manager, table_name, args.symbols, args.days)
+
+        results[version] = {
+            'storage': clickhouse_manager.get_storage_info(table_name),
+            'queries': {
+                name: time_query(clickhouse_manager, sql.format(table=table_name), args.repeat)
+                for name, sql in queries.items()
+            }
+        }
+
+    print("\n" + "=" * 60)
+    print("测试结果")
+    print("=" * 60)
+    print(f"{'指标':<20}{'v1':>14}{'v2':>14}{'v2/v1':>10}")
+
+    v1_storage, v2_storage = results['v1']['storage'], results['v2']['storage']
+    print(f"{'行数':<20}{v1_storage['rows']:>14}{v2_storage['rows']:>14}")
+    v1_mb = v1_storage['bytes_on_disk'] / 1024 / 1024
+    v2_mb = v2_storage['bytes_on_disk'] / 1024 / 1024
+    print(f"{'磁盘占用(MB)':<20}{v1_mb:>14.2f}{v2_mb:>14.2f}{v2_mb / max(v1_mb, 1e-9):>10.2f}")
+    print(f"{'压缩比':<20}{v1_storage['compression_ratio']:>14.2f}{v2_storage['compression_ratio']:>14.2f}")
+
+    for name in queries:
+        v1_ms, v2_ms = results['v1']['queries'][name], results['v2']['queries'][name]
+        print(f"{name + '(ms)':<20}{v1_ms:>14.2f}{v2_ms:>14.2f}{v2_ms / max(v1_ms, 1e-9):>10.2f}")
+
+    if not args.keep:
+        for table_name in BENCH_TABLES.values():
+            clickhouse_manager.client.command(f"DROP TABLE IF EXISTS {table_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+股票代码注册表
+- Windows端发布分钟线时把股票代码加入当日集合 symbols:{YYYYMMDD}
+- Mac端写入ClickHouse时把股票代码加入集合 symbols:all
+- ClickHouse中 DISTINCT symbol 的结果缓存在进程内，只在超过刷新间隔时重新查询
+  （新入库的股票代码已由 symbols:all 集合带入，不需要每次入库后扫描ClickHouse）
+股票列表和前缀搜索只读这两个集合和进程内的有序列表，不扫描Redis键空间。
+"""
+import bisect
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import List
+
+from config import SYMBOL_REGISTRY_CONFIG
+
+
+SYMBOLS_DAY_KEY = 'symbols:{day}'
+SYMBOLS_ALL_KEY = 'symbols:all'
+
+
+def symbols_day_key(day: datetime) -> str:
+    """当日股票代码集合的键"""
+    return SYMBOLS_DAY_KEY.format(day=day.strftime('%Y%m%d'))
+
+
+class SymbolRegistry:
+    """股票代码注册表（有序列表 + 前缀搜索）"""
+
+    def __init__(self, redis_manager, clickhouse_manager=None, refresh_interval: float = None):
+        """
+        Args:
+            redis_manager: RedisManager
+            clickhouse_manager: ClickHouseManager，为None时不合并ClickHouse中的股票代码
+            refresh_interval: 股票列表最长缓存时间（秒）
+        """
+        self.redis_manager = redis_manager
+        self.clickhouse_manager = clickhouse_manager
+        self.refresh_interval = refresh_interval or SYMBOL_REGISTRY_CONFIG['refresh_interval']
+        self.logger = logging.getLogger(__name__)
+
+        self._symbols: List[str] = []
+        self._clickhouse_symbols = set()
+        self._clickhouse_refreshed_at = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_symbols(self) -> List[str]:
+        """全部股票代码（有序）"""
+        self._refresh_if_stale()
+        return self._symbols
+
+    def search(self, prefix: str, limit: int = 20) -> List[str]:
+        """按前缀搜索股票代码（二分查找有序列表）"""
+        symbols = self.get_symbols()
+        prefix = prefix.upper()
+        start = bisect.bisect_left(symbols, prefix)
+        result = []
+        for symbol in symbols[start:]:
+            if not symbol.startswith(prefix) or len(result) >= limit:
+                break
+            result.append(symbol)
+        return result
+
+    def _refresh_if_stale(self):
+        """超过缓存时间时重新读取Redis集合；超过刷新间隔时重新查询ClickHouse DISTINCT"""
+        if time.monotonic() - self._refreshed_at < SYMBOL_REGISTRY_CONFIG['redis_refresh_interval']:
+            return
+
+        with self._lock:
+            if time.monotonic() - self._refreshed_at < SYMBOL_REGISTRY_CONFIG['redis_refresh_interval']:
+                return
+
+            client = self.redis_manager.client
+            pipe = client.pipeline(transaction=False)
+            pipe.smembers(symbols_day_key(datetime.now()))
+            pipe.smembers(SYMBOLS_ALL_KEY)
+            today_symbols, inserted_symbols = pipe.execute()
+
+            if self.clickhouse_manager is not None and (
+                    self._clickhouse_refreshed_at is None
+                    or time.monotonic() - self._clickhouse_refreshed_at >= self.refresh_interval):
+                try:
+                    self._clickhouse_symbols = set(self.clickhouse_manager.get_distinct_symbols())
+                    self._clickhouse_refreshed_at = time.monotonic()
+                except Exception as e:
+                    self.logger.error(f"查询ClickHouse股票代码失败: {e}")
+
+            self._symbols = sorted(set(today_symbols) | set(inserted_symbols) | self._clickhouse_symbols)
+            self._refreshed_at = time.monotonic()
@@ -7,7 +7,14 @@ import sys
 import time
 from datetime import datetime, timedelta
 from database import RedisManager, ClickHouseManager
-from data_processor import BarDataSynthesizer, DataMerger
+from data_processor import (BarDataSynthesizer, DataMerger, bars_to_columns, resample_bar_columns,
+                            downsample_bar_columns, adjust_bar_columns, payloads_to_columns)
+from insert_buffer import InsertBuffer
+from consumer_pool import BarConsumerPool
+from nightly_loader import NightlyBarLoader
+from query_cache import BarQueryCache
+from bar_export import normalize_table, iter_export_bytes
+from live_push import LiveBroadcaster, LiveClient
 from models import TickData, BarData, HistoricalDataRequest
 from qmt_historical_fetcher import QMTHistoricalFetcher
 from trading_time_validator import TradingTimeValidator
@@ -184,14 +191,30 @@ def test_data_merger():
             )
         ]
 
-        # 测试合并
+        # 测试合并：重复的frame保留ClickHouse数据，结果按时间排序
+        clickhouse_data.append(BarData(
+            symbol="TEST001",
+            frame=base_time,
+            open=10.0, high=10.3, low=9.8, close=10.2,
+            vol=1100, amount=11200
+        ))
         merged_data = DataMerger.merge_bar_data(redis_data, clickhouse_data)
 
-        if len(merged_data) == 2:
+        # Redis中同一frame重复推送：保留最后一条
+        repeated_data = [
+            BarData(symbol="TEST001", frame=base_time + timedelta(minutes=offset),
+                    open=10.0, high=10.5, low=9.5, close=close, vol=100, amount=1000)
+            for offset, close in [(1, 2.0), (1, 1.0), (2, 3.0)]
+        ]
+        repeated_merged = DataMerger.merge_bar_data(repeated_data, clickhouse_data)
+
+        if (len(merged_data) == 2 and [bar.close for bar in merged_data] == [10.0, 10.2]
+                and [bar.close for bar in repeated_merged] == [10.0, 10.2, 1.0, 3.0]):
             print("✓ 数据合并测试成功")
             return True
         else:
-            print(f"✗ 数据合并测试失败，期望2条记录，实际{len(merged_data)}条")
+            print(f"✗ 数据合并测试失败，期望2条记录，实际{len(merged_data)}条；"
+                  f"重复frame合并结果: {[bar.close for bar in repeated_merged]}")
             return False
 
     except Exception as e:
@@ -199,6 +222,808 @@ def test_data_merger():
         return False
 
 
+def test_columnar_merger():
+    """测试列式数据合并功能"""
+    print("测试列式数据合并功能...")
+    try:
+        base_time = datetime.now().replace(second=0, microsecond=0)
+
+        redis_columns = bars_to_columns([
+            BarData(
+                symbol="TEST001",
+                frame=base_time,
+                open=10.0, high=10.2, low=9.8, close=10.1,
+                vol=1000, amount=10100
+            ),
+            BarData(
+                symbol="TEST001",
+                frame=base_time + timedelta(minutes=1),
+                open=10.1, high=10.4, low=10.0, close=10.3,
+                vol=900, amount=9300
+            )
+        ])
+
+        clickhouse_columns = bars_to_columns([
+            BarData(
+                symbol="TEST001",
+                frame=base_time - timedelta(minutes=1),
+                open=9.9, high=10.1, low=9.7, close=10.0,
+                vol=1200, amount=12000
+            ),
+            BarData(
+                symbol="TEST001",
+                frame=base_time,
+                open=10.0, high=10.3, low=9.8, close=10.2,
+                vol=1100, amount=11200
+            )
+        ])
+
+        # 测试合并：重复的frame保留ClickHouse数据，结果按时间排序
+        merged = DataMerger.merge_bar_columns(redis_columns, clickhouse_columns)
+
+        if len(merged['frame']) == 3 and merged['close'].tolist() == [10.0, 10.2, 10.3]:
+            print("✓ 列式数据合并测试成功")
+            return True
+        else:
+            print(f"✗ 列式数据合并测试失败，合并结果: {merged['close'].tolist()}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 列式数据合并测试失败: {e}")
+        return False
+
+
+def test_insert_buffer():
+    """测试写缓冲功能"""
+    print("测试写缓冲功能...")
+    try:
+        flushed = []
+        buffer = InsertBuffer(lambda key, rows: flushed.append((key, len(rows))), max_rows=100, max_age=0.5)
+
+        # 达到行数上限时由后台线程写入
+        buffer.add(1, list(range(100)))
+        # 未达到上限的数据在超过缓冲时间后写入
+        buffer.add(5, list(range(10)))
+        time.sleep(1.5)
+        # 关闭时写入剩余数据
+        buffer.add(15, list(range(3)))
+        closed = buffer.close()
+
+        # 写入失败时关闭返回False，数据留在缓冲区中
+        def fail(key, rows):
+            raise RuntimeError("ClickHouse不可用")
+
+        failing = InsertBuffer(fail, max_rows=100, max_age=60)
+        failing.add(1, list(range(5)))
+        failed_close = failing.close()
+
+        stats = buffer.get_stats()
+        if (sorted(flushed) == [(1, 100), (5, 10), (15, 3)] and stats['pending_rows'] == 0 and closed
+                and not failed_close and failing.get_depth() == {'1': 5}):
+            print(f"✓ 写缓冲测试成功，共写入 {stats['flush_count']} 批")
+            return True
+        else:
+            print(f"✗ 写缓冲测试失败，写入记录: {flushed}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 写缓冲测试失败: {e}")
+        return False
+
+
+def test_consumer_pool_ack():
+    """测试实时消费池只在写入ClickHouse成功后确认Redis在途批次"""
+    print("测试消费池写入确认...")
+    try:
+        class FakeRedisManager:
+            """按批次返回数据的Redis替身，记录确认的在途批次"""
+
+            def __init__(self, batches):
+                self.batches = list(batches)
+                self.confirmed = []
+                self.released = 0
+
+            def release_all_bar_batches(self, owner=None):
+                self.released += 1
+                return 0
+
+            def claim_bar_batch(self, period, batch_id, max_count, timeout=None):
+                if not self.batches:
+                    time.sleep(0.05)
+                    return f"inflight:{batch_id}", []
+                return self.batches.pop(0)
+
+            def confirm_bar_batch(self, inflight_key):
+                self.confirmed.append(inflight_key)
+
+        redis_manager = FakeRedisManager([("inflight:a", ["1", "2"]), ("inflight:b", ["broken"])])
+        inserted = []
+        attempts = []
+
+        def decode(period, payloads):
+            if payloads == ["broken"]:
+                raise ValueError("无法解析")
+            return [int(payload) for payload in payloads]
+
+        def insert(period, rows):
+            # 记录每次写入时已确认的批次
+            attempts.append(list(redis_manager.confirmed))
+            # 第一次写入失败：数据留在缓冲区重试，在途批次不确认
+            if len(attempts) == 1:
+                raise RuntimeError("ClickHouse不可用")
+            inserted.extend(rows)
+
+        pool = BarConsumerPool(redis_manager, [1], decode, insert, decode_workers=1, queue_size=2)
+        pool.start()
+        time.sleep(2)
+        pool.stop()
+
+        # 无法解码的批次立即确认丢弃；正常批次在重试写入成功后才确认
+        if (redis_manager.released == 1 and attempts == [["inflight:b"], ["inflight:b"]]
+                and sorted(redis_manager.confirmed) == ["inflight:a", "inflight:b"]
+                and inserted == [1, 2]):
+            print("✓ 消费池写入确认测试成功")
+            return True
+        else:
+            print(f"✗ 消费池写入确认测试失败: 确认 {redis_manager.confirmed}，写入 {attempts}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 消费池写入确认测试失败: {e}")
+        return False
+
+
+def test_nightly_claim_confirm_release():
+    """测试夜间加载：写入成功的批次确认删除，写入失败的批次放回队列，只先放回自己上次遗留的在途批次"""
+    print("测试夜间加载批次确认...")
+    try:
+        class FakePipeline:
+            def __init__(self, queues):
+                self.queues, self.lengths = queues, []
+
+            def llen(self, queue_name):
+                self.lengths.append(len(self.queues.get(queue_name, [])))
+
+            def execute(self):
+                return self.lengths
+
+        class FakeRedisManager:
+            """内存中的队列和在途列表（队列按入队顺序排列，先取最早的数据）"""
+
+            def __init__(self, queues, inflight):
+                self.queues, self.inflight = queues, inflight
+                self.client = self
+                self.confirmed = 0
+
+            def pipeline(self, transaction=False):
+                return FakePipeline(self.queues)
+
+            def claim_bar_batch(self, period, batch_id, max_count, timeout=None):
+                queue_name = f"bar_data_{period}min"
+                items = self.queues[queue_name][:max_count]
+                del self.queues[queue_name][:max_count]
+                inflight_key = f"{queue_name}:inflight:{batch_id}"
+                if items:
+                    self.inflight[inflight_key] = (queue_name, items)
+                return inflight_key, items
+
+            def confirm_bar_batch(self, inflight_key):
+                del self.inflight[inflight_key]
+                self.confirmed += 1
+
+            def release_bar_batch(self, inflight_key, queue_name=None):
+                queue_name, items = self.inflight.pop(inflight_key)
+                self.queues[queue_name][:0] = items
+                return len(items)
+
+            def release_all_bar_batches(self, owner=None):
+                return sum(self.release_bar_batch(key) for key in list(self.inflight)
+                           if owner is None or key.split(':inflight:', 1)[-1].startswith(f"{owner}:"))
+
+        class FakeClickHouseManager:
+            def __init__(self):
+                self.inserted = {1: 0, 5: 0}
+
+            def insert_bar_columns(self, columns, period):
+                if period == 5:
+                    raise RuntimeError("ClickHouse不可用")
+                self.inserted[period] += len(columns['frame'])
+
+        payloads = [
+            BarData(symbol="TEST001", frame=datetime(2024, 1, 2, 9, 31) + timedelta(minutes=i),
+                    open=10.0, high=10.5, low=9.5, close=10.0, vol=100, amount=1000).model_dump_json()
+            for i in range(8)
+        ]
+        redis_manager = FakeRedisManager(
+            {"bar_data_1min": payloads[:5], "bar_data_5min": payloads[5:]},
+            # 上次中断遗留的在途批次，以及暂停中的实时消费池仍在写入的批次
+            {"bar_data_1min:inflight:nightly_loader:old": ("bar_data_1min", [payloads[0]]),
+             "bar_data_1min:inflight:mac_consumer:live": ("bar_data_1min", [payloads[1]])}
+        )
+        clickhouse_manager = FakeClickHouseManager()
+        loader = NightlyBarLoader(redis_manager, clickhouse_manager, [1, 5])
+        loader.config = {**loader.config, 'min_batch_size': 2, 'max_batch_size': 2, 'report_interval': 60}
+        loader._batch_sizes = {1: 2, 5: 2}
+        result = loader.run()
+
+        # 1分钟线6条（含放回的1条）分3批写入并确认；5分钟线写入失败，数据全部放回队列；
+        # 只剩实时消费池的在途批次（不属于夜间加载，不放回）
+        if (clickhouse_manager.inserted == {1: 6, 5: 0} and redis_manager.confirmed == 3
+                and not redis_manager.queues["bar_data_1min"]
+                and sorted(redis_manager.queues["bar_data_5min"]) == sorted(payloads[5:])
+                and list(redis_manager.inflight) == ["bar_data_1min:inflight:mac_consumer:live"]
+                and result['failed_periods'] == [5]):
+            print("✓ 夜间加载批次确认测试成功")
+            return True
+        else:
+            print(f"✗ 夜间加载批次确认测试失败: {result}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 夜间加载批次确认测试失败: {e}")
+        return False
+
+
+def test_insert_bar_columns():
+    """测试夜间加载列式插入：整批一次INSERT，去重令牌与数据到达顺序无关"""
+    print("测试列式插入...")
+    try:
+        import numpy as np
+        import database
+
+        class FakeClient:
+            def __init__(self):
+                self.inserts = []
+
+            def insert(self, table, data, column_names=None, column_oriented=False, settings=None):
+                self.inserts.append((data, settings['insert_deduplication_token']))
+
+        bars = [
+            BarData(symbol=symbol, frame=datetime(2024, 1, day, 9, 31), open=10.0, high=10.5,
+                    low=9.5, close=10.0 + day, vol=100, amount=1000)
+            for day in (3, 2) for symbol in ("TEST002", "TEST001")
+        ]
+        manager = ClickHouseManager.__new__(ClickHouseManager)
+        manager.client = FakeClient()
+        manager.logger = database.logging.getLogger(__name__)
+        manager._final_cache = {}
+        manager._final_cache_lock = database.threading.Lock()
+
+        schema_version = database.CLICKHOUSE_SCHEMA_VERSION
+        database.CLICKHOUSE_SCHEMA_VERSION = 'v2'
+        try:
+            manager.insert_bar_columns(bars_to_columns(bars), 1)
+            manager.insert_bar_columns(bars_to_columns(bars[::-1]), 1)
+        finally:
+            database.CLICKHOUSE_SCHEMA_VERSION = schema_version
+
+        (first, first_token), (_, second_token) = manager.client.inserts
+        if (len(manager.client.inserts) == 2 and first_token == second_token
+                and list(first[0]) == ["TEST001", "TEST001", "TEST002", "TEST002"]
+                and np.all(np.diff(first[1][:2]) > np.timedelta64(0, 's'))):
+            print("✓ 列式插入测试成功")
+            return True
+        else:
+            print(f"✗ 列式插入测试失败: {manager.client.inserts}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 列式插入测试失败: {e}")
+        return False
+
+
+def test_query_cache():
+    """测试历史数据查询缓存"""
+    print("测试历史数据查询缓存...")
+    try:
+        day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        bars = [
+            BarData(
+                symbol="TEST001",
+                frame=day + timedelta(days=d, hours=9, minutes=30 + m),
+                open=10.0, high=10.1, low=9.9, close=10.0 + d,
+                vol=100, amount=1000
+            )
+            for d in (0, 1, 3) for m in range(3)
+        ]
+        queries = []
+
+        def fetch(symbol, start_time, end_time, period, settings=None):
+            queries.append((start_time, end_time, settings))
+            return bars_to_columns([bar for bar in bars if start_time <= bar.frame <= end_time])
+
+        cache = BarQueryCache(fetch, max_blocks=10, redis_enabled=False)
+        start_time = day
+        end_time = day + timedelta(days=1, hours=9, minutes=31)
+
+        first = cache.get_columns("TEST001", start_time, end_time, 1)
+        # 第二次查询（范围在已缓存日期内）不再访问ClickHouse
+        second = cache.get_columns("TEST001", day + timedelta(hours=9, minutes=31), end_time, 1)
+
+        # 包含今天的相同查询重复3次：历史日期和今天各查询一次
+        live_cache = BarQueryCache(fetch, max_blocks=10, redis_enabled=False, epoch_check_interval=60)
+        live_end = day + timedelta(days=3, hours=9, minutes=35)
+        live_queries = len(queries)
+        live = [live_cache.get_columns("TEST001", start_time, live_end, 1) for _ in range(3)]
+        live_queries = len(queries) - live_queries
+
+        # 查询到今天零点（开盘前）：只查询缺失的历史日期并带上查询设置，不查询今天的部分
+        settings = {'max_threads': 2}
+        midnight_cache = BarQueryCache(fetch, max_blocks=10, redis_enabled=False)
+        midnight = midnight_cache.get_columns("TEST001", start_time, day + timedelta(days=3), 1, settings=settings)
+        midnight_queries = queries[3:]
+
+        if (len(queries) == 4 and len(first['frame']) == 5 and len(second['frame']) == 4
+                and second['symbol'][0] == "TEST001" and live_queries == 2
+                and all(len(columns['frame']) == 9 for columns in live)
+                and len(midnight['frame']) == 6
+                and [query[2] for query in midnight_queries] == [settings]
+                and midnight_queries[0][1] < day + timedelta(days=3)):
+            print(f"✓ 查询缓存测试成功，缓存统计: {cache.get_stats()}")
+            return True
+        else:
+            print(f"✗ 查询缓存测试失败，查询次数: {len(queries)}，结果条数: {len(first['frame'])}/{len(second['frame'])}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 查询缓存测试失败: {e}")
+        return False
+
+
+def test_resample():
+    """测试任意周期重采样（当日数据的向量化路径）"""
+    print("测试任意周期重采样...")
+    try:
+        day = datetime(2024, 1, 2)
+        # 上午09:30-11:30、下午13:00-15:00的1分钟线，收盘价为序号
+        frames = (
+            [day.replace(hour=9, minute=30) + timedelta(minutes=m) for m in range(121)]
+            + [day.replace(hour=13) + timedelta(minutes=m) for m in range(121)]
+        )
+        bars = [
+            BarData(
+                symbol="TEST001", frame=frame,
+                open=float(i), high=float(i) + 0.5, low=float(i) - 0.5, close=float(i),
+                vol=1, amount=10
+            )
+            for i, frame in enumerate(frames)
+        ]
+        resampled = resample_bar_columns(bars_to_columns(bars), 60)
+
+        # 每个时段两根60分钟K线，11:30/15:00并入时段最后一根
+        expected_frames = ['2024-01-02T09:30:00', '2024-01-02T10:30:00',
+                           '2024-01-02T13:00:00', '2024-01-02T14:00:00']
+        if (resampled['frame'].astype(str).tolist() == expected_frames
+                and resampled['vol'].tolist() == [60, 61, 60, 61]
+                and resampled['open'][1] == 60 and resampled['close'][1] == 120):
+            print("✓ 任意周期重采样测试成功")
+            return True
+        else:
+            print(f"✗ 任意周期重采样测试失败: {resampled['frame'].astype(str).tolist()} {resampled['vol'].tolist()}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 任意周期重采样测试失败: {e}")
+        return False
+
+
+def test_downsample():
+    """测试图表K线合并"""
+    print("测试图表K线合并...")
+    try:
+        base_time = datetime(2024, 1, 2, 9, 30)
+        bars = [
+            BarData(
+                symbol="TEST001", frame=base_time + timedelta(minutes=i),
+                open=10.0 + i, high=10.5 + i, low=9.5 + i, close=10.2 + i,
+                vol=100, amount=1000
+            )
+            for i in range(10)
+        ]
+        columns = downsample_bar_columns(bars_to_columns(bars), 3)
+
+        # 10根K线合并为3根，每根保留区间的开高低收
+        if (len(columns['frame']) == 3 and columns['open'].tolist() == [10.0, 13.0, 16.0]
+                and columns['high'].tolist() == [12.5, 15.5, 19.5] and columns['close'][-1] == 19.2
+                and columns['vol'].sum() == 1000):
+            print("✓ 图表K线合并测试成功")
+            return True
+        else:
+            print(f"✗ 图表K线合并测试失败: {columns['open'].tolist()} {columns['high'].tolist()}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 图表K线合并测试失败: {e}")
+        return False
+
+
+def test_adjust():
+    """测试分钟线复权（日线复权因子按日期对应到分钟线）"""
+    print("测试分钟线复权...")
+    try:
+        import numpy as np
+
+        bars = [
+            BarData(symbol=symbol, frame=datetime(2024, 1, day, 10, 0),
+                    open=10.0, high=10.0, low=10.0, close=10.0, vol=100, amount=1000)
+            for symbol in ("TEST001", "TEST002") for day in (2, 3, 4)
+        ]
+        # TEST001 在1月3日除权（因子1.0 -> 2.0），1月4日因子尚未入库；TEST002没有因子
+        factors = {
+            'symbol': np.array(["TEST001", "TEST001"], dtype=object),
+            'frame': np.array(['2024-01-02', '2024-01-03'], dtype='datetime64[D]'),
+            'adjust': np.array([1.0, 2.0])
+        }
+        columns = bars_to_columns(bars)
+        hfq = adjust_bar_columns(columns, factors, 'hfq')
+        qfq = adjust_bar_columns(columns, factors, 'qfq')
+
+        if (hfq['close'].tolist() == [10.0, 20.0, 20.0, 10.0, 10.0, 10.0]
+                and qfq['close'].tolist() == [5.0, 10.0, 10.0, 10.0, 10.0, 10.0]):
+            print("✓ 分钟线复权测试成功")
+            return True
+        else:
+            print(f"✗ 分钟线复权测试失败: hfq={hfq['close'].tolist()} qfq={qfq['close'].tolist()}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 分钟线复权测试失败: {e}")
+        return False
+
+
+def test_final_check_cache():
+    """测试FINAL检查按 (表, 月分区) 缓存：有效期内不重复查询system.parts，本进程写入后失效"""
+    print("测试FINAL检查缓存...")
+    try:
+        import database
+
+        class FakeResult:
+            def __init__(self, rows):
+                self.result_rows = rows
+
+        class FakeClient:
+            def __init__(self):
+                self.part_queries = []
+                self.parts = {202401: 1, 202402: 3}
+
+            def query(self, sql, parameters=None):
+                self.part_queries.append((parameters['start_month'], parameters['end_month']))
+                return FakeResult([(month, count) for month, count in self.parts.items()
+                                   if parameters['start_month'] <= month <= parameters['end_month']])
+
+            def insert(self, *args, **kwargs):
+                pass
+
+        manager = ClickHouseManager.__new__(ClickHouseManager)
+        manager.client = FakeClient()
+        manager.logger = database.logging.getLogger(__name__)
+        manager._final_cache = {}
+        manager._final_cache_lock = database.threading.Lock()
+        table_name = database.CLICKHOUSE_TABLES['data_bar_for_1min']
+        january = (datetime(2024, 1, 2, 9, 31), datetime(2024, 1, 2, 15, 0))
+
+        schema_version = database.CLICKHOUSE_SCHEMA_VERSION
+        database.CLICKHOUSE_SCHEMA_VERSION = 'v2'
+        try:
+            # 1月只有一个part无需FINAL，有效期内重复查询不再访问system.parts
+            first = manager._needs_final(table_name, *january)
+            second = manager._needs_final(table_name, *january)
+            cached_queries = len(manager.client.part_queries)
+
+            # 跨年查询只检查未缓存的月份，2023年12月无数据、2024年2月有多个part
+            spanning = manager._needs_final(table_name, datetime(2023, 12, 29), datetime(2024, 2, 5))
+            spanning_query = manager.client.part_queries[-1]
+
+            # 本进程写入1月数据后缓存失效，重新检查
+            manager.client.parts[202401] = 2
+            manager.insert_bar_columns(bars_to_columns([
+                BarData(symbol="TEST001", frame=january[0], open=10.0, high=10.5, low=9.5,
+                        close=10.0, vol=100, amount=1000)
+            ]), 1)
+            after_insert = manager._needs_final(table_name, *january)
+        finally:
+            database.CLICKHOUSE_SCHEMA_VERSION = schema_version
+
+        if (not first and not second and cached_queries == 1 and spanning
+                and spanning_query == (202312, 202402) and after_insert
+                and len(manager.client.part_queries) == 3):
+            print("✓ FINAL检查缓存测试成功")
+            return True
+        else:
+            print(f"✗ FINAL检查缓存测试失败: 查询记录={manager.client.part_queries}")
+            return False
+
+    except Exception as e:
+        print(f"✗ FINAL检查缓存测试失败: {e}")
+        return False
+
+
+def test_query_bar_frames_split():
+    """测试多股票查询结果按symbol切分（与不切分的查询结果逐行一致）"""
+    print("测试多股票结果切分...")
+    try:
+        import numpy as np
+
+        base_time = datetime(2024, 1, 2, 9, 31)
+        bars = [
+            BarData(symbol=symbol, frame=base_time + timedelta(minutes=i),
+                    open=10.0, high=10.5, low=9.5, close=10.0 + i, vol=100 * (i + 1), amount=1000)
+            for symbol, count in (("TEST001", 3), ("TEST002", 2)) for i in range(count)
+        ]
+        unsplit = bars_to_columns(bars)
+
+        # 不连接ClickHouse，多股票查询直接返回按 (symbol, frame) 排序的列式数据
+        manager = ClickHouseManager.__new__(ClickHouseManager)
+        manager.query_bar_frame = lambda *args, **kwargs: unsplit
+        frames = manager.query_bar_frames(["TEST001", "TEST002"], base_time, base_time + timedelta(hours=1), 1)
+
+        first, second = frames["TEST001"], frames["TEST002"]
+        rejoined = {name: np.concatenate([first[name], second[name]]) for name in unsplit}
+        # 分界两侧的K线：TEST001的最后一根和TEST002的第一根
+        boundary_ok = (first['frame'][-1] == unsplit['frame'][2] and first['vol'][-1] == 300
+                       and second['frame'][0] == unsplit['frame'][3] and second['vol'][0] == 100)
+
+        if (list(frames) == ["TEST001", "TEST002"] and len(first['frame']) == 3 and len(second['frame']) == 2
+                and set(first['symbol']) == {"TEST001"} and set(second['symbol']) == {"TEST002"}
+                and all(np.array_equal(rejoined[name], unsplit[name]) for name in unsplit)
+                and boundary_ok):
+            print("✓ 多股票结果切分测试成功")
+            return True
+        else:
+            print(f"✗ 多股票结果切分测试失败: { {symbol: len(columns['frame']) for symbol, columns in frames.items()} }")
+            return False
+
+    except Exception as e:
+        print(f"✗ 多股票结果切分测试失败: {e}")
+        return False
+
+
+def test_export_normalize():
+    """测试ClickHouse返回的Arrow表（uint32时间列、dictionary代码列）转换为导出结构"""
+    print("测试导出数据转换...")
+    try:
+        import pyarrow as pa
+
+        frames = [int(datetime(2024, 1, 2, 9, 31 + i).timestamp()) for i in range(3)]
+        table = pa.table({
+            'symbol': pa.array(["TEST001"] * 3).dictionary_encode(),
+            'frame': pa.array(frames, type=pa.uint32()),
+            'open': [10.0, 10.1, 10.2], 'high': [10.5] * 3, 'low': [9.5] * 3,
+            'close': [10.0, 11.0, 12.0], 'vol': [100.0] * 3, 'amount': [1000.0] * 3,
+            'version': pa.array([1, 1, 1], type=pa.uint64())
+        })
+        normalized = normalize_table(table)
+        exported = pa.ipc.open_stream(b''.join(iter_export_bytes([normalized], 'arrow'))).read_all()
+
+        if (normalized.column('frame').cast(pa.int64()).to_pylist() == frames
+                and normalized.column('symbol').to_pylist() == ["TEST001"] * 3
+                and normalized.column_names == exported.column_names and exported.num_rows == 3):
+            print("✓ 导出数据转换测试成功")
+            return True
+        else:
+            print(f"✗ 导出数据转换测试失败: {normalized.schema}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 导出数据转换测试失败: {e}")
+        return False
+
+
+def test_live_broadcast():
+    """测试实时推送按订阅转发分钟线，发送队列满时先丢弃分钟线、状态改为完整重发"""
+    print("测试实时推送...")
+    try:
+        broadcaster = LiveBroadcaster()
+        subscribed, status_only = LiveClient(queue_size=2), LiveClient(queue_size=2)
+        subscribed.subscribe(["TEST001"], [1])
+        broadcaster._clients = {1: subscribed, 2: status_only}
+
+        for i in range(3):
+            broadcaster._broadcast_bar(f'bar{i}', "TEST001", 1)
+        broadcaster._broadcast_bar('other', "TEST002", 1)
+        broadcaster._broadcast_bar('other_period', "TEST001", 5)
+        # 队列中已有2根分钟线（已满），状态增量到达时清空队列并改为发送完整状态
+        broadcaster._broadcast_status('delta')
+
+        subscribed_messages = [subscribed.queue.get_nowait() for _ in range(subscribed.queue.qsize())]
+        status_messages = [status_only.queue.get_nowait() for _ in range(status_only.queue.qsize())]
+
+        if (subscribed.dropped_bars == 1 and subscribed.resyncs == 1
+                and subscribed_messages == [LiveClient.RESYNC] and status_messages == ['delta']):
+            print("✓ 实时推送测试成功")
+            return True
+        else:
+            print(f"✗ 实时推送测试失败: {subscribed_messages} {status_messages}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 实时推送测试失败: {e}")
+        return False
+
+
+def test_payload_columns():
+    """测试夜间加载的JSON批量解码（含无法解析的数据）"""
+    print("测试JSON批量解码...")
+    try:
+        base_time = datetime(2024, 1, 2, 9, 31)
+        payloads = [
+            BarData(
+                symbol="TEST001", frame=base_time + timedelta(minutes=i),
+                open=10.0, high=10.5, low=9.5, close=10.0 + i,
+                vol=100, amount=1000
+            ).model_dump_json()
+            for i in range(3)
+        ]
+        columns = payloads_to_columns(payloads)
+        broken = payloads_to_columns(payloads[:2] + ['{broken'])
+        # 缺少字段、字段值无法转换的数据只跳过该条
+        invalid = payloads_to_columns(payloads[:2] + ['{"symbol": "TEST001"}', payloads[2].replace('"open":10.0', '"open":"x"')])
+
+        if (columns['close'].tolist() == [10.0, 11.0, 12.0] and columns['frame'][0] == base_time
+                and len(broken['frame']) == 2 and invalid['close'].tolist() == [10.0, 11.0]):
+            print("✓ JSON批量解码测试成功")
+            return True
+        else:
+            print(f"✗ JSON批量解码测试失败: {columns['close'].tolist()} {len(broken['frame'])}")
+            return False
+
+    except Exception as e:
+        print(f"✗ JSON批量解码测试失败: {e}")
+        return False
+
+
+def test_current_bar_columns():
+    """测试当日数据列式读取：原始JSON批量解析，按股票和时间范围过滤并按 (symbol, frame) 排序"""
+    print("测试当日数据列式读取...")
+    try:
+        import database
+
+        base_time = datetime(2024, 1, 2, 9, 31)
+        payloads = [
+            BarData(symbol=symbol, frame=base_time + timedelta(minutes=i), open=10.0, high=10.5,
+                    low=9.5, close=10.0 + i, vol=100, amount=1000).model_dump_json()
+            for i in (2, 0, 1) for symbol in ("TEST002", "TEST001", "TEST003")
+        ] + ['{broken']
+
+        class FakeClient:
+            def lrange(self, key, start, end):
+                return payloads if key == "current_bar_data_1min" else []
+
+        manager = RedisManager.__new__(RedisManager)
+        manager.client = FakeClient()
+        manager.logger = database.logging.getLogger(__name__)
+
+        columns = manager.get_current_bar_columns(
+            1, ["TEST001", "TEST002"], base_time + timedelta(minutes=1), base_time + timedelta(minutes=2)
+        )
+        all_columns = manager.get_current_bar_columns(1)
+        empty = manager.get_current_bar_columns(5)
+
+        if (columns['symbol'].tolist() == ["TEST001", "TEST001", "TEST002", "TEST002"]
+                and columns['close'].tolist() == [11.0, 12.0, 11.0, 12.0]
+                and len(all_columns['frame']) == 9 and all_columns['symbol'][-1] == "TEST003"
+                and len(empty['frame']) == 0):
+            print("✓ 当日数据列式读取测试成功")
+            return True
+        else:
+            print(f"✗ 当日数据列式读取测试失败: {columns['symbol'].tolist()} {columns['close'].tolist()}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 当日数据列式读取测试失败: {e}")
+        return False
+
+
+def _chdb_session():
+    """嵌入式ClickHouse会话（不需要ClickHouse服务，用于验证建表和查询语句）"""
+    from chdb import session
+
+    chdb_session = session.Session()
+    chdb_session.query("CREATE DATABASE IF NOT EXISTS test_system")
+    chdb_session.query("USE test_system")
+    return chdb_session
+
+
+def test_rollup_reinsert():
+    """测试高周期聚合表在重复写入、修正数据时与源表去重结果一致"""
+    print("测试高周期聚合重复写入...")
+    try:
+        import database
+
+        chdb_session = _chdb_session()
+        query = lambda sql: [line.split(',') for line in str(chdb_session.query(sql, 'CSV')).splitlines()]
+        for table in ("rollup_test_5min_agg_mv", "rollup_test_5min_agg", "rollup_test_1min"):
+            chdb_session.query(f"DROP TABLE IF EXISTS {table}")
+        chdb_session.query(database.BAR_TABLE_DDL['v2'].format(table_name="rollup_test_1min"))
+        chdb_session.query(database.ROLLUP_TABLE_DDL.format(table_name="rollup_test_5min_agg"))
+
+        schema_version = database.CLICKHOUSE_SCHEMA_VERSION
+        database.CLICKHOUSE_SCHEMA_VERSION = 'v2'
+        try:
+            chdb_session.query("CREATE MATERIALIZED VIEW rollup_test_5min_agg_mv TO rollup_test_5min_agg AS "
+                               + database.rollup_select_sql(5, "rollup_test_1min"))
+        finally:
+            database.CLICKHOUSE_SCHEMA_VERSION = schema_version
+
+        def insert(version, rows):
+            chdb_session.query("INSERT INTO rollup_test_1min VALUES " + ",".join(
+                f"('TEST001', '2024-01-02 09:{minute}:00', {close}, {close}, {close}, {close}, {vol}, {vol * 10}, {version})"
+                for minute, close, vol in rows
+            ))
+
+        bars = [(30 + i, 10.0 + i, 100 + i) for i in range(10)]
+        # 同一批数据以不同去重令牌（不同version）写入两次，再修正09:31这一分钟
+        insert(1, bars)
+        insert(2, bars)
+        insert(3, [(31, 20.0, 500)])
+
+        rollup = query(database.ROLLUP_QUERY_SQL.format(
+            table="rollup_test_5min_agg", symbol_condition="symbol = 'TEST001'", order_by="frame"
+        ).replace("%(start_time)s", "'2024-01-02 00:00:00'").replace("%(end_time)s", "'2024-01-03 00:00:00'"))
+        expected = query(
+            "SELECT toStartOfFiveMinutes(frame) AS bucket, sum(vol) FROM rollup_test_1min FINAL "
+            "GROUP BY bucket ORDER BY bucket"
+        )
+
+        # 09:30周期：5根K线各计一次，09:31为修正后的成交量
+        if ([float(row[6]) for row in rollup] == [float(row[1]) for row in expected]
+                and float(rollup[0][6]) == 100 + 500 + 102 + 103 + 104 and float(rollup[0][3]) == 20.0):
+            print("✓ 高周期聚合重复写入测试成功")
+            return True
+        else:
+            print(f"✗ 高周期聚合重复写入测试失败: 聚合表 {rollup}，源表 {expected}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 高周期聚合重复写入测试失败: {e}")
+        return False
+
+
+def test_rollup_publish():
+    """测试开启服务端聚合时历史补数只发布1分钟线队列"""
+    print("测试服务端聚合发布队列...")
+    try:
+        import database
+
+        class FakePipeline:
+            def __init__(self, commands):
+                self.commands = commands
+
+            def __getattr__(self, name):
+                return lambda *args: self.commands.append((name, args[0] if args else None))
+
+        class FakeClient:
+            def __init__(self):
+                self.commands = []
+
+            def pipeline(self, transaction=True):
+                return FakePipeline(self.commands)
+
+        redis_manager = RedisManager()
+        redis_manager.client = FakeClient()
+        rollup_enabled = database.BAR_ROLLUP_ENABLED
+        database.BAR_ROLLUP_ENABLED = True
+        try:
+            for period in (1, 5, 30):
+                bar = BarData(symbol="TEST001", frame=datetime(2024, 1, 2, 10, 0),
+                              open=10.0, high=10.2, low=9.8, close=10.1, vol=1000, amount=10100)
+                redis_manager.publish_bar_data(bar, period, is_historical=True)
+        finally:
+            database.BAR_ROLLUP_ENABLED = rollup_enabled
+
+        pushed = [key for command, key in redis_manager.client.commands if command == 'lpush']
+        if pushed == ['bar_data_1min']:
+            print("✓ 服务端聚合发布队列测试成功")
+            return True
+        else:
+            print(f"✗ 服务端聚合发布队列测试失败: {pushed}")
+            return False
+
+    except Exception as e:
+        print(f"✗ 服务端聚合发布队列测试失败: {e}")
+        return False
+
+
 def test_historical_data_fetcher():
     """测试历史数据获取功能"""
     print("测试历史数据获取功能...")
@@ -376,6 +1201,23 @@ def run_all_tests():
         ("Redis操作", test_redis_operations),
         ("ClickHouse操作", test_clickhouse_operations),
         ("数据合并", test_data_merger),
+        ("列式数据合并", test_columnar_merger),
+        ("写缓冲", test_insert_buffer),
+        ("查询缓存", test_query_cache),
+        ("任意周期重采样", test_resample),
+        ("图表K线合并", test_downsample),
+        ("分钟线复权", test_adjust),
+        ("消费池写入确认", test_consumer_pool_ack),
+        ("夜间加载批次确认", test_nightly_claim_confirm_release),
+        ("列式插入", test_insert_bar_columns),
+        ("FINAL检查缓存", test_final_check_cache),
+        ("多股票结果切分", test_query_bar_frames_split),
+        ("导出数据转换", test_export_normalize),
+        ("实时推送", test_live_broadcast),
+        ("JSON批量解码", test_payload_columns),
+        ("当日数据列式读取", test_current_bar_columns),
+        ("高周期聚合重复写入", test_rollup_reinsert),
+        ("服务端聚合发布队列", test_rollup_publish),
         ("历史数据获取", test_historical_data_fetcher),
         ("交易时间验证", test_trading_time_validator),
         ("数据存储分离", test_data_storage_separation),
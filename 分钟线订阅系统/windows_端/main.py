@@ -15,7 +15,7 @@ import asyncio
 import threading
 import time
 from datetime import datetime, time as dt_time
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, WebSocket
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
@@ -27,6 +27,7 @@ from data_processor import BarDataSynthesizer
 from models import TickData, SystemStatus, HistoricalDataRequest, HistoricalDataResponse
 from qmt_historical_fetcher import QMTHistoricalFetcher
 from trading_time_validator import TradingTimeValidator
+from live_push import LiveBroadcaster
 
 
 class WindowsDataService:
@@ -202,15 +203,19 @@ class WindowsDataService:
 # 创建FastAPI应用
 app = FastAPI(title="Windows端数据生产服务")
 service = WindowsDataService()
+# 仪表板WebSocket推送：状态每隔一段时间计算一次，推送给所有连接
+live_broadcaster = LiveBroadcaster(status_func=service.get_system_info)
 
 @app.on_event("startup")
 async def startup_event():
     """启动事件"""
     service.start_service()
+    await live_broadcaster.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭事件"""
+    await live_broadcaster.stop()
     service.stop_service()
 
 @app.get("/", response_class=HTMLResponse)
@@ -595,27 +600,70 @@ async def get_dashboard():
             function updateStatus() {
                 fetch('/api/status')
                     .then(response => response.json())
-                    .then(data => {
-                        const status = data.service_status;
-
-                        // 更新概览卡片
-                        updateOverviewCards(status, data);
-
-                        // 更新详细服务状态
-                        updateServiceStatus(status);
-
-                        // 更新Redis状态
-                        updateRedisStatus(data.redis_info);
-
-                        // 更新缓存状态
-                        updateCacheStatus(data.cache_info);
-                    })
+                    .then(data => renderStatus(data))
                     .catch(error => {
                         console.error('Error:', error);
                         showErrorState();
                     });
             }
 
+            function renderStatus(data) {
+                const status = data.service_status;
+
+                // 更新概览卡片
+                updateOverviewCards(status, data);
+
+                // 更新详细服务状态
+                updateServiceStatus(status);
+
+                // 更新Redis状态
+                updateRedisStatus(data.redis_info);
+
+                // 更新缓存状态
+                updateCacheStatus(data.cache_info);
+            }
+
+            // 合并服务端推送的状态差异（值为null的字段表示已删除）
+            function mergeDelta(target, delta) {
+                for (const [key, value] of Object.entries(delta)) {
+                    if (value === null) {
+                        delete target[key];
+                    } else if (typeof value === 'object' && !Array.isArray(value)
+                               && typeof target[key] === 'object' && target[key] !== null) {
+                        mergeDelta(target[key], value);
+                    } else {
+                        target[key] = value;
+                    }
+                }
+                return target;
+            }
+
+            // WebSocket实时推送，连接断开时退回定时轮询并稍后重连
+            let liveStatus = {};
+            let pollTimer = null;
+            function connectLive() {
+                const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws/live`);
+                ws.onopen = () => {
+                    if (pollTimer) {
+                        clearInterval(pollTimer);
+                        pollTimer = null;
+                    }
+                };
+                ws.onmessage = event => {
+                    const message = JSON.parse(event.data);
+                    if (message.type === 'status') {
+                        liveStatus = message.full ? message.data : mergeDelta(liveStatus, message.data);
+                        renderStatus(liveStatus);
+                    }
+                };
+                ws.onclose = () => {
+                    if (!pollTimer) {
+                        pollTimer = setInterval(updateStatus, 5000);
+                    }
+                    setTimeout(connectLive, 5000);
+                };
+            }
+
             function updateOverviewCards(status, data) {
                 // 服务状态徽章
                 const statusBadge = document.getElementById('service-status-badge');
@@ -1101,8 +1149,8 @@ async def get_dashboard():
                 updateStatus();
                 updateTasks();
 
-                // 定时更新
-                setInterval(updateStatus, 5000);
+                // 服务状态由WebSocket推送，任务列表定时更新
+                connectLive();
                 setInterval(updateTasks, 3000);
             });
         </script>
@@ -1113,6 +1161,11 @@ async def get_dashboard():
     </html>
     """
 
+@app.websocket("/ws/live")
+async def live_updates(websocket: WebSocket):
+    """仪表板实时推送（首次发送完整状态，之后只发送变化的部分）"""
+    await live_broadcaster.handle(websocket)
+
 @app.get("/api/status")
 async def get_status():
     """获取系统状态API"""
@@ -7,8 +7,10 @@ ClickHouse处理模块
 """
 
 import datetime
+import hashlib
+import time
 import pandas as pd
-from typing import Dict, List, Any, Union
+from typing import Callable, Dict, List, Any, Tuple, Union
 from clickhouse_driver import Client
 
 from config_loader import CLICKHOUSE_CONFIG
@@ -17,6 +19,78 @@ from exceptions import ClickHouseConnectionError, ClickHouseOperationError
 from utils import retry
 
 
+# 日线表结构定义（按版本）
+DAY_BAR_TABLE_DDL = {
+    # v1: 原始表结构
+    'v1': """
+        CREATE TABLE IF NOT EXISTS {database}.{table} (
+            symbol String,
+            frame Date,
+            open Float64,
+            high Float64,
+            low Float64,
+            close Float64,
+            vol Float64,
+            amount Float64,
+            adjust Float64,
+            is_st UInt8,
+            limit_up Float64,
+            limit_down Float64
+        ) ENGINE = MergeTree()
+        ORDER BY (symbol, frame)
+    """,
+    # v2: 低基数symbol + 列压缩编码 + 按月分区
+    # ReplacingMergeTree按version保留最新一行，history --force 重复写入在后台合并时去重
+    'v2': """
+        CREATE TABLE IF NOT EXISTS {database}.{table} (
+            symbol LowCardinality(String),
+            frame Date CODEC(Delta, ZSTD(1)),
+            open Float64 CODEC(Gorilla, ZSTD(1)),
+            high Float64 CODEC(Gorilla, ZSTD(1)),
+            low Float64 CODEC(Gorilla, ZSTD(1)),
+            close Float64 CODEC(Gorilla, ZSTD(1)),
+            vol Float64 CODEC(ZSTD(1)),
+            amount Float64 CODEC(ZSTD(1)),
+            adjust Float64 CODEC(Gorilla, ZSTD(1)),
+            is_st UInt8 CODEC(ZSTD(1)),
+            limit_up Float64 CODEC(Gorilla, ZSTD(1)),
+            limit_down Float64 CODEC(Gorilla, ZSTD(1)),
+            version UInt64 DEFAULT toUnixTimestamp64Milli(now64()) CODEC(Delta, ZSTD(1))
+        ) ENGINE = ReplacingMergeTree(version)
+        PARTITION BY toYYYYMM(frame)
+        ORDER BY (symbol, frame)
+        SETTINGS non_replicated_deduplication_window = 10000
+    """
+}
+
+DAY_BAR_COLUMNS = ['symbol', 'frame', 'open', 'high', 'low', 'close', 'vol', 'amount',
+                   'adjust', 'is_st', 'limit_up', 'limit_down']
+
+# 复权方式：qfq 前复权（以最新复权因子为基准），hfq 后复权（价格乘以复权因子）
+ADJUST_TYPES = ('qfq', 'hfq')
+
+# 股票数量达到预期数量的该比例即认为当日数据完整
+COMPLETENESS_THRESHOLD = 0.95
+
+# 日线查询（价格列按复权系数f调整，成交量和成交额不调整）
+DAY_BAR_QUERY_SQL = """
+SELECT symbol, frame, o * f AS open, h * f AS high, l * f AS low, c * f AS close,
+       vol, amount, adj AS adjust, is_st, lu * f AS limit_up, ld * f AS limit_down
+FROM (
+    SELECT symbol, frame, open AS o, high AS h, low AS l, close AS c, vol, amount,
+           adjust AS adj, is_st, limit_up AS lu, limit_down AS ld, {factor} AS f
+    FROM {table} {final} {join}
+    WHERE {conditions}
+)
+ORDER BY symbol, frame
+"""
+
+
+def is_date_complete(current_count: int, expected_count: int) -> bool:
+    """股票数量是否达到预期数量的完整度阈值（预期数量为0时认为完整）"""
+    return not expected_count or current_count / expected_count >= COMPLETENESS_THRESHOLD
+
+
 class ClickHouseHandler:
     """ClickHouse处理类，提供ClickHouse连接和操作功能"""
 
@@ -31,6 +105,9 @@ class ClickHouseHandler:
         self.client = None
         self.database = self.config.database
         self.table = self.config.table
+        self.schema_version = getattr(self.config, 'schema_version', None) or 'v1'
+        # 是否维护按 (frame, symbol) 排序的截面副本表
+        self.cross_section = bool(getattr(self.config, 'cross_section', False))
         self.connect()
 
     @retry(exceptions=(Exception,))
@@ -95,28 +172,311 @@ class ClickHouseHandler:
         """
         try:
             # 创建表
-            self.client.execute(f"""
-                CREATE TABLE IF NOT EXISTS {self.database}.{self.table} (
-                    symbol String,
-                    frame Date,
-                    open Float64,
-                    high Float64,
-                    low Float64,
-                    close Float64,
-                    vol Float64,
-                    amount Float64,
-                    adjust Float64,
-                    is_st UInt8,
-                    limit_up Float64,
-                    limit_down Float64
-                ) ENGINE = MergeTree()
-                ORDER BY (symbol, frame)
-            """)
+            self.client.execute(self._build_create_sql(self.table, self.schema_version))
             logger.info(f"已确保表 {self.database}.{self.table} 存在")
+
+            if self.cross_section:
+                self._ensure_cross_section_table_exists()
         except Exception as e:
             logger.error(f"确保表存在失败: {e}")
             raise ClickHouseOperationError(f"确保表存在失败: {e}")
 
+    def _ensure_cross_section_table_exists(self) -> None:
+        """
+        创建按 (frame, symbol) 排序的截面副本表，以及从日线表同步写入的物化视图
+        """
+        frame_table = f"{self.table}_by_frame"
+        create_sql = self._build_create_sql(frame_table, self.schema_version)
+        self.client.execute(create_sql.replace('ORDER BY (symbol, frame)', 'ORDER BY (frame, symbol)'))
+        self.client.execute(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {self.database}.{frame_table}_mv "
+            f"TO {self.database}.{frame_table} AS SELECT * FROM {self.database}.{self.table}"
+        )
+        logger.info(f"已确保截面副本表 {self.database}.{frame_table} 存在")
+
+    def _frame_table(self) -> str:
+        """
+        截面查询（按交易日期查询全部股票）使用的表
+
+        Returns:
+            str: 开启截面副本表时返回副本表，否则返回日线表
+        """
+        if self.cross_section:
+            return f"{self.database}.{self.table}_by_frame"
+        return f"{self.database}.{self.table}"
+
+    def build_cross_section_table(self) -> Dict[str, Any]:
+        """
+        由日线表按月重建截面副本表
+
+        每个月先清空副本表对应分区再复制，可重复执行（v1表不分区，整表清空后复制）。
+
+        Returns:
+            Dict[str, Any]: 回填结果，包含months、rows
+        """
+        self._ensure_cross_section_table_exists()
+
+        source = f"{self.database}.{self.table}"
+        target = f"{self.database}.{self.table}_by_frame"
+        months = [row[0] for row in self.client.execute(
+            f"SELECT DISTINCT toYYYYMM(frame) AS month FROM {source} ORDER BY month"
+        )]
+
+        if self.schema_version == 'v1':
+            self.client.execute(f"TRUNCATE TABLE {target}")
+
+        for month in months:
+            if self.schema_version != 'v1':
+                self.client.execute(f"ALTER TABLE {target} DROP PARTITION {month}")
+            self.client.execute(f"INSERT INTO {target} SELECT * FROM {source} WHERE toYYYYMM(frame) = {month}")
+            logger.info(f"截面副本表分区 {month} 回填完成")
+
+        rows = self.client.execute(f"SELECT count() FROM {target}")[0][0]
+        return {'months': len(months), 'rows': rows}
+
+    def get_cross_section(self, trade_date: str) -> pd.DataFrame:
+        """
+        获取指定交易日期全部股票的日线数据
+
+        Args:
+            trade_date (str): 交易日期，格式为'YYYYMMDD'
+
+        Returns:
+            pd.DataFrame: 日线数据，按symbol排序
+        """
+        if not self.check_connection():
+            self.connect()
+
+        date_obj = datetime.datetime.strptime(trade_date, '%Y%m%d').date()
+        final_clause = 'FINAL' if self.schema_version == 'v2' else ''
+        query = (f"SELECT {', '.join(DAY_BAR_COLUMNS)} FROM {self._frame_table()} {final_clause} "
+                 f"WHERE frame = %(date)s ORDER BY symbol")
+
+        result = self.client.execute(
+            query, {'date': date_obj},
+            settings={'do_not_merge_across_partitions_select_final': 1} if final_clause else None
+        )
+        return pd.DataFrame(result, columns=DAY_BAR_COLUMNS)
+
+    def get_bars(self, start_date: str, end_date: str, symbols: List[str] = None,
+                 adjust: str = None) -> pd.DataFrame:
+        """
+        查询日线数据，可选复权
+
+        复权在ClickHouse中完成：后复权价格 = 价格 × 复权因子；
+        前复权价格 = 价格 × 复权因子 / 该股票最新的复权因子（一次按股票分组的JOIN，与查询的结束日期无关）。
+
+        Args:
+            start_date (str): 开始日期，格式为'YYYYMMDD'
+            end_date (str): 结束日期，格式为'YYYYMMDD'
+            symbols (List[str], optional): 股票代码列表. 默认为None，表示全部股票.
+            adjust (str, optional): 复权方式，'qfq'或'hfq'. 默认为None，表示不复权.
+
+        Returns:
+            pd.DataFrame: 日线数据，按 (symbol, frame) 排序
+        """
+        if adjust is not None and adjust not in ADJUST_TYPES:
+            raise ValueError(f"不支持的复权方式: {adjust}")
+
+        if not self.check_connection():
+            self.connect()
+
+        table = f"{self.database}.{self.table}"
+        final_clause = 'FINAL' if self.schema_version == 'v2' else ''
+        conditions = 'frame >= %(start_date)s AND frame <= %(end_date)s'
+        if symbols:
+            conditions += ' AND symbol IN %(symbols)s'
+
+        join_clause = ''
+        factor = '1'
+        if adjust == 'hfq':
+            factor = 'adjust'
+        elif adjust == 'qfq':
+            factor = 'adjust / latest_adjust'
+            latest_conditions = 'WHERE symbol IN %(symbols)s' if symbols else ''
+            join_clause = (f"INNER JOIN (SELECT symbol, argMax(adjust, frame) AS latest_adjust FROM {table} {final_clause} "
+                           f"{latest_conditions} GROUP BY symbol) AS latest USING (symbol)")
+
+        query = DAY_BAR_QUERY_SQL.format(
+            factor=factor, table=table, final=final_clause, join=join_clause, conditions=conditions
+        )
+        params = {
+            'start_date': datetime.datetime.strptime(start_date, '%Y%m%d').date(),
+            'end_date': datetime.datetime.strptime(end_date, '%Y%m%d').date(),
+            'symbols': tuple(symbols or ())
+        }
+
+        result = self.client.execute(
+            query, params,
+            settings={'do_not_merge_across_partitions_select_final': 1} if final_clause else None
+        )
+        return pd.DataFrame(result, columns=DAY_BAR_COLUMNS)
+
+    def _build_create_sql(self, table: str, version: str) -> str:
+        """
+        生成指定版本的日线建表语句
+
+        Args:
+            table (str): 表名
+            version (str): 表结构版本，'v1'或'v2'
+
+        Returns:
+            str: 建表语句
+        """
+        if version not in DAY_BAR_TABLE_DDL:
+            raise ClickHouseOperationError(f"不支持的表结构版本: {version}")
+        return DAY_BAR_TABLE_DDL[version].format(database=self.database, table=table)
+
+    def get_schema_version(self, table: str = None) -> str:
+        """
+        根据symbol列类型判断表结构版本
+
+        Args:
+            table (str, optional): 表名. 默认为None，表示配置中的日线表.
+
+        Returns:
+            str: 'v1'或'v2'，表不存在时返回空字符串
+        """
+        result = self.client.execute(
+            "SELECT type FROM system.columns WHERE database = %(database)s AND table = %(table)s AND name = 'symbol'",
+            {'database': self.database, 'table': table or self.table}
+        )
+        if not result:
+            return ''
+        return 'v2' if result[0][0].startswith('LowCardinality') else 'v1'
+
+    def migrate_to_v2(self, drop_old: bool = False) -> Dict[str, Any]:
+        """
+        将v1日线表按月分区逐个复制到v2表结构
+
+        每个月的数据先清空目标分区再复制，中断后重新执行即可续跑；
+        全部月份行数校验通过后，替换前再比对一次各分区的源表行数，复制后有新写入的分区重新复制并校验，
+        然后原表重命名为 {table}_v1_backup，新表替换原表名。
+        追赶之后到替换之间写入的数据仍会丢失，迁移期间需停止日线定时任务。
+
+        Args:
+            drop_old (bool, optional): 迁移完成后是否删除v1备份表. 默认为False.
+
+        Returns:
+            Dict[str, Any]: 迁移结果
+
+        Raises:
+            ClickHouseOperationError: 迁移失败时抛出
+        """
+        try:
+            if not self.check_connection():
+                self.connect()
+
+            if self.get_schema_version() != 'v1':
+                logger.info(f"表 {self.database}.{self.table} 不存在或已是v2结构，无需迁移")
+                return {'status': 'skipped', 'months': 0, 'rows': 0, 'backup_table': None}
+
+            source = f"{self.database}.{self.table}"
+            new_table = f"{self.table}_v2"
+            target = f"{self.database}.{new_table}"
+            self.client.execute(self._build_create_sql(new_table, 'v2'))
+
+            months = [row[0] for row in self.client.execute(
+                f"SELECT DISTINCT toYYYYMM(frame) AS month FROM {source} ORDER BY month"
+            )]
+
+            # 分区 -> (复制前的源表行数, 复制后的唯一行数)
+            copied = {month: self._copy_partition_v2(source, target, month) for month in months}
+
+            # 追赶：复制之后有新写入（行数变化）或新出现的分区，在替换前重新复制并校验
+            for month, source_rows in self.client.execute(
+                f"SELECT toYYYYMM(frame) AS month, count() FROM {source} GROUP BY month ORDER BY month"
+            ):
+                if month not in copied or copied[month][0] != source_rows:
+                    logger.warning(f"分区 {month} 复制后有新数据写入，替换前重新复制")
+                    copied[month] = self._copy_partition_v2(source, target, month)
+
+            copied_rows = sum(target_count for _, target_count in copied.values())
+            backup_table = f"{self.table}_v1_backup"
+            self.client.execute(
+                f"RENAME TABLE {source} TO {self.database}.{backup_table}, {target} TO {source}"
+            )
+            if drop_old:
+                self.client.execute(f"DROP TABLE IF EXISTS {self.database}.{backup_table}")
+
+            self.schema_version = 'v2'
+            logger.info(f"表 {source} 已迁移到v2结构，共 {len(copied)} 个月分区，{copied_rows} 条数据")
+            return {
+                'status': 'migrated',
+                'months': len(copied),
+                'rows': copied_rows,
+                'backup_table': None if drop_old else backup_table
+            }
+
+        except ClickHouseOperationError:
+            raise
+        except Exception as e:
+            logger.error(f"迁移表结构失败: {e}")
+            raise ClickHouseOperationError(f"迁移表结构失败: {e}")
+
+    def _copy_partition_v2(self, source: str, target: str, month: int) -> Tuple[int, int]:
+        """
+        清空目标表的一个月分区后从源表重新复制，并按唯一键校验行数
+
+        Args:
+            source (str): 源表（含数据库名）
+            target (str): 目标表（含数据库名）
+            month (int): 分区，格式为YYYYMM
+
+        Returns:
+            Tuple[int, int]: (复制前源表的行数, 复制后目标表的唯一行数)
+
+        Raises:
+            ClickHouseOperationError: 行数校验失败时抛出
+        """
+        columns = ', '.join(DAY_BAR_COLUMNS)
+        source_rows = self.client.execute(
+            f"SELECT count() FROM {source} WHERE toYYYYMM(frame) = {month}"
+        )[0][0]
+        self.client.execute(f"ALTER TABLE {target} DROP PARTITION {month}")
+        self.client.execute(
+            f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {source} WHERE toYYYYMM(frame) = {month}"
+        )
+
+        # v2为ReplacingMergeTree，源表中的重复行迁移后会被合并，按唯一键校验
+        source_count = self.client.execute(
+            f"SELECT uniqExact(symbol, frame) FROM {source} WHERE toYYYYMM(frame) = {month}"
+        )[0][0]
+        target_count = self.client.execute(
+            f"SELECT count() FROM {target} FINAL WHERE toYYYYMM(frame) = {month}"
+        )[0][0]
+        if source_count != target_count:
+            raise ClickHouseOperationError(
+                f"分区 {month} 行数校验失败: 源表 {source_count} 条，目标表 {target_count} 条"
+            )
+
+        logger.info(f"分区 {month} 迁移完成，共 {target_count} 条数据")
+        return source_rows, target_count
+
+    def get_storage_info(self) -> Dict[str, Any]:
+        """
+        获取日线表的磁盘占用信息
+
+        Returns:
+            Dict[str, Any]: 行数、磁盘占用、未压缩大小、part数量和压缩比
+        """
+        result = self.client.execute(
+            """
+            SELECT sum(rows), sum(bytes_on_disk), sum(data_uncompressed_bytes), count()
+            FROM system.parts
+            WHERE database = %(database)s AND table = %(table)s AND active
+            """,
+            {'database': self.database, 'table': self.table}
+        )
+        rows, bytes_on_disk, uncompressed_bytes, parts = result[0]
+        return {
+            'rows': rows,
+            'bytes_on_disk': bytes_on_disk,
+            'uncompressed_bytes': uncompressed_bytes,
+            'parts': parts,
+            'compression_ratio': uncompressed_bytes / bytes_on_disk if bytes_on_disk else 0
+        }
+
     def check_connection(self) -> bool:
         """
         检查ClickHouse连接状态
@@ -162,16 +522,47 @@ class ClickHouseHandler:
             records = df.to_dict('records')
 
             # 插入数据
-            self.client.execute(
-                f"INSERT INTO {self.database}.{self.table} VALUES",
-                records
-            )
+            if self.schema_version == 'v1':
+                self.client.execute(
+                    f"INSERT INTO {self.database}.{self.table} VALUES",
+                    records
+                )
+            else:
+                self._insert_with_dedup_token(records)
 
             logger.info(f"已插入 {len(records)} 条数据到ClickHouse表 {self.database}.{self.table}")
         except Exception as e:
             logger.error(f"插入数据到ClickHouse表失败: {e}")
             raise ClickHouseOperationError(f"插入数据到ClickHouse表失败: {e}")
 
+    def _insert_with_dedup_token(self, records: List[Dict]) -> None:
+        """
+        按交易日分组插入v2表，每组携带去重令牌和统一的version
+
+        令牌包含该批次行内容的摘要：完全相同的重试批次会被ClickHouse丢弃，
+        内容有修正的批次则正常写入，由ReplacingMergeTree按version替换旧行。
+
+        Args:
+            records (List[Dict]): 待插入的数据记录
+        """
+        version = time.time_ns() // 1_000_000
+        groups = {}
+        for record in records:
+            record['version'] = version
+            groups.setdefault(str(record.get('frame'))[:10], []).append(record)
+
+        for trade_date, group in sorted(groups.items()):
+            rows = sorted(
+                tuple(record.get(column) for column in DAY_BAR_COLUMNS)
+                for record in group
+            )
+            digest = hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+            self.client.execute(
+                f"INSERT INTO {self.database}.{self.table} VALUES",
+                group,
+                settings={'insert_deduplication_token': f"{self.table}:{trade_date}:{digest}"}
+            )
+
     def get_latest_trade_date(self, symbol: str = None) -> str:
         """
         获取ClickHouse中最新的交易日期
@@ -272,7 +663,7 @@ class ClickHouseHandler:
             date_obj = datetime.datetime.strptime(trade_date, '%Y%m%d').date()
 
             # 构建查询SQL
-            query = f"SELECT DISTINCT symbol FROM {self.database}.{self.table} WHERE frame = %(date)s"
+            query = f"SELECT DISTINCT symbol FROM {self._frame_table()} WHERE frame = %(date)s"
 
             # 执行查询
             result = self.client.execute(query, {'date': date_obj})
@@ -305,7 +696,7 @@ class ClickHouseHandler:
             date_obj = datetime.datetime.strptime(trade_date, '%Y%m%d').date()
 
             # 构建查询SQL
-            query = f"SELECT COUNT(DISTINCT symbol) FROM {self.database}.{self.table} WHERE frame = %(date)s"
+            query = f"SELECT COUNT(DISTINCT symbol) FROM {self._frame_table()} WHERE frame = %(date)s"
 
             # 执行查询
             result = self.client.execute(query, {'date': date_obj})
@@ -356,8 +747,8 @@ class ClickHouseHandler:
             # 计算完整度
             completeness = current_count / expected_count
 
-            # 如果完整度大于等于0.95，则认为数据完整
-            is_complete = completeness >= 0.95
+            # 如果完整度大于等于阈值，则认为数据完整
+            is_complete = completeness >= COMPLETENESS_THRESHOLD
 
             logger.info(f"日期 {trade_date} 数据完整度: {completeness:.2%} ({current_count}/{expected_count}), 是否完整: {is_complete}")
             return is_complete
@@ -366,52 +757,115 @@ class ClickHouseHandler:
             logger.error(f"检查数据完整性失败: {e}")
             return False
 
-    def get_incomplete_dates(self, start_date: str = None, end_date: str = None, expected_count: int = None) -> List[str]:
+    def get_symbol_counts(self, start_date: str = None, end_date: str = None) -> Dict[str, int]:
         """
-        获取指定日期范围内不完整的日期列表
+        一次分组查询获取日期范围内每个交易日的股票数量
+
+        Args:
+            start_date (str, optional): 开始日期，格式为'YYYYMMDD'. 默认为None，表示最早日期.
+            end_date (str, optional): 结束日期，格式为'YYYYMMDD'. 默认为None，表示最新日期.
+
+        Returns:
+            Dict[str, int]: {交易日期'YYYYMMDD': 股票数量}，按日期排序
+        """
+        if not self.check_connection():
+            self.connect()
+
+        conditions = []
+        params = {}
+        if start_date:
+            conditions.append('frame >= %(start_date)s')
+            params['start_date'] = datetime.datetime.strptime(start_date, '%Y%m%d').date()
+        if end_date:
+            conditions.append('frame <= %(end_date)s')
+            params['end_date'] = datetime.datetime.strptime(end_date, '%Y%m%d').date()
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        query = f"SELECT frame, uniqExact(symbol) FROM {self._frame_table()} {where} GROUP BY frame ORDER BY frame"
+        result = self.client.execute(query, params)
+        return {row[0].strftime('%Y%m%d'): row[1] for row in result}
+
+    def get_max_symbol_count(self) -> int:
+        """
+        获取全表中单日最大的股票数量
+
+        Returns:
+            int: 单日最大股票数量，没有数据时返回0
+        """
+        if not self.check_connection():
+            self.connect()
+
+        query = f"SELECT max(c) FROM (SELECT uniqExact(symbol) AS c FROM {self._frame_table()} GROUP BY frame)"
+        result = self.client.execute(query)
+        return result[0][0] if result and result[0][0] else 0
+
+    def get_date_completeness(self, start_date: str = None, end_date: str = None, expected_count: int = None,
+                              expected_count_func: Callable[[List[str]], Dict[str, int]] = None
+                              ) -> Dict[str, Tuple[int, int]]:
+        """
+        获取日期范围内每个交易日的股票数量和预期数量
+
+        日期范围在查询条件中过滤；未指定预期数量、且预期数量函数未给出某日的预期数量时，
+        使用全表中单日最大的股票数量（未指定日期范围时直接取分组结果的最大值，不再查询全表）。
 
         Args:
             start_date (str, optional): 开始日期，格式为'YYYYMMDD'. 默认为None，表示最早日期.
             end_date (str, optional): 结束日期，格式为'YYYYMMDD'. 默认为None，表示最新日期.
             expected_count (int, optional): 预期的股票数量. 默认为None，表示使用系统中最大的股票数量.
+            expected_count_func (Callable, optional): 按日期计算预期数量的函数（如按上市日期统计的股票数量），
+                参数为日期列表，返回{日期: 预期数量}；指定后优先于expected_count.
 
         Returns:
-            List[str]: 不完整的日期列表，格式为['YYYYMMDD', 'YYYYMMDD', ...]
+            Dict[str, Tuple[int, int]]: {交易日期: (股票数量, 预期数量)}
         """
-        try:
-            if not self.check_connection():
-                self.connect()
+        symbol_counts = self.get_symbol_counts(start_date, end_date)
+        if not symbol_counts:
+            return {}
 
-            # 如果没有指定日期范围，则使用系统中的最早和最新日期
-            if start_date is None or end_date is None:
-                earliest_date, latest_date = self.get_date_range()
-                start_date = start_date or earliest_date
-                end_date = end_date or latest_date
+        dates = list(symbol_counts)
+        expected_counts = expected_count_func(dates) if expected_count_func else {}
 
-            if not start_date or not end_date:
-                logger.warning("没有指定日期范围，且系统中没有数据")
-                return []
+        # 预期数量函数未覆盖全部日期（如股票列表为空）时同样回退到单日最大股票数量
+        if expected_count is None and any(date not in expected_counts for date in dates):
+            if start_date is None and end_date is None:
+                expected_count = max(symbol_counts.values())
+            else:
+                expected_count = self.get_max_symbol_count()
 
-            # 获取日期范围内的所有日期
-            start_date_obj = datetime.datetime.strptime(start_date, '%Y%m%d').date()
-            end_date_obj = datetime.datetime.strptime(end_date, '%Y%m%d').date()
+        return {
+            date: (symbol_counts[date], expected_counts.get(date, expected_count))
+            for date in dates
+        }
 
-            # 构建查询SQL，获取日期范围内的所有日期
-            query = f"SELECT DISTINCT frame FROM {self.database}.{self.table} WHERE frame BETWEEN %(start_date)s AND %(end_date)s ORDER BY frame"
+    def get_incomplete_dates(self, start_date: str = None, end_date: str = None, expected_count: int = None,
+                             expected_count_func: Callable[[List[str]], Dict[str, int]] = None) -> List[str]:
+        """
+        获取指定日期范围内不完整的日期列表
 
-            # 执行查询
-            result = self.client.execute(query, {'start_date': start_date_obj, 'end_date': end_date_obj})
+        Args:
+            start_date (str, optional): 开始日期，格式为'YYYYMMDD'. 默认为None，表示最早日期.
+            end_date (str, optional): 结束日期，格式为'YYYYMMDD'. 默认为None，表示最新日期.
+            expected_count (int, optional): 预期的股票数量. 默认为None，表示使用系统中最大的股票数量.
+            expected_count_func (Callable, optional): 按日期计算预期数量的函数，见get_date_completeness.
 
-            # 解析结果
-            dates = [row[0].strftime('%Y%m%d') for row in result]
+        Returns:
+            List[str]: 不完整的日期列表，格式为['YYYYMMDD', 'YYYYMMDD', ...]
+        """
+        try:
+            completeness = self.get_date_completeness(start_date, end_date, expected_count, expected_count_func)
+
+            if not completeness:
+                logger.warning("没有指定日期范围，且系统中没有数据")
+                return []
 
-            # 检查每个日期的数据是否完整
             incomplete_dates = []
-            for date in dates:
-                if not self.check_date_data_completeness(date, expected_count):
+            for date, (current_count, expected) in completeness.items():
+                if not is_date_complete(current_count, expected):
+                    logger.debug(f"日期 {date} 数据不完整: {current_count}/{expected}")
                     incomplete_dates.append(date)
 
-            logger.info(f"日期范围 {start_date} - {end_date} 内共有 {len(incomplete_dates)} 个不完整的日期")
+            logger.info(f"日期范围 {start_date or '最早'} - {end_date or '最新'} 内共检查 {len(completeness)} 个日期，"
+                        f"其中 {len(incomplete_dates)} 个不完整")
             return incomplete_dates
 
         except Exception as e:
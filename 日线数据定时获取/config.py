@@ -4,7 +4,7 @@
 
 from __future__ import annotations
 
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -25,6 +25,8 @@ class Clickhouse(BaseModel):
     table: str
     user: str
     password: str
+    schema_version: Optional[str] = 'v1'
+    cross_section: Optional[bool] = False
 
 
 class Tushare(BaseModel):
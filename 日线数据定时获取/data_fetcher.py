@@ -7,6 +7,7 @@
 """
 
 import datetime
+import numpy as np
 import pandas as pd
 import requests
 import tushare as ts
@@ -40,6 +41,10 @@ class DataFetcher:
         self.stock_list_cache = None
         self.stock_list_cache_date = None
 
+        # 上市股票全集缓存（含退市、暂停上市股票的上市/退市日期）
+        self.listed_universe_cache = None
+        self.listed_universe_cache_date = None
+
     @retry(exceptions=(Exception, TushareAPIError))
     def _call_tushare_api(self, api_name: str, params: Dict = None, fields: str = None) -> pd.DataFrame:
         """
@@ -129,6 +134,69 @@ class DataFetcher:
 
         return df
 
+    def get_listed_universe(self, force_update: bool = False) -> pd.DataFrame:
+        """
+        获取全部股票（上市、退市、暂停上市）的上市日期和退市日期
+
+        Args:
+            force_update (bool, optional): 是否强制更新缓存. 默认为False.
+
+        Returns:
+            pd.DataFrame: 包含ts_code、list_date、delist_date列的数据
+        """
+        today = datetime.date.today()
+
+        if (self.listed_universe_cache is None or
+            self.listed_universe_cache_date != today or
+            force_update):
+
+            logger.info("获取上市股票全集...")
+            frames = []
+            for list_status in ['L', 'D', 'P']:
+                df = self._call_tushare_api(
+                    api_name='stock_basic',
+                    params={
+                        'exchange': '',
+                        'list_status': list_status,
+                        'fields': 'ts_code,list_date,delist_date'
+                    }
+                )
+                if not df.empty:
+                    frames.append(df)
+
+            if not frames:
+                logger.warning("获取上市股票全集为空")
+                return pd.DataFrame(columns=['ts_code', 'list_date', 'delist_date'])
+
+            self.listed_universe_cache = pd.concat(frames, ignore_index=True)
+            self.listed_universe_cache_date = today
+            logger.info(f"获取上市股票全集成功，共 {len(self.listed_universe_cache)} 条记录")
+
+        return self.listed_universe_cache
+
+    def get_listed_counts(self, dates: List[str]) -> Dict[str, int]:
+        """
+        按上市日期和退市日期计算每个交易日处于上市状态的股票数量
+
+        Args:
+            dates (List[str]): 交易日期列表，格式为'YYYYMMDD'
+
+        Returns:
+            Dict[str, int]: {交易日期: 上市股票数量}
+        """
+        universe = self.get_listed_universe()
+        if universe.empty or not dates:
+            return {}
+
+        # 'YYYYMMDD'字符串按字典序即按日期排序，排序后用二分查找统计每个日期之前上市/退市的数量
+        list_dates = np.sort(universe['list_date'].dropna().astype(str).values)
+        delist_dates = np.sort(universe['delist_date'].dropna().astype(str).values) if 'delist_date' in universe else np.array([], dtype=str)
+        query_dates = np.asarray(dates, dtype=str)
+
+        listed = np.searchsorted(list_dates, query_dates, side='right')
+        delisted = np.searchsorted(delist_dates, query_dates, side='right')
+        return dict(zip(dates, (listed - delisted).tolist()))
+
     def get_trade_calendar(self, start_date: str = None, end_date: str = None) -> pd.DataFrame:
         """
         获取交易日历
@@ -216,7 +284,9 @@ class DataFetcher:
             logger.warning("获取股票列表为空，无法获取日线数据")
             return pd.DataFrame()
 
-        # 获取所有股票代码
+        # 获取所有股票代码（只保留该日期已上市的股票）
+        if 'list_date' in stock_list.columns:
+            stock_list = stock_list[stock_list['list_date'].astype(str) <= trade_date]
         all_ts_codes = stock_list['ts_code'].tolist()
 
         # 检查是否需要跳过已存在的股票
@@ -712,11 +782,14 @@ class DataFetcher:
             logger.warning("获取股票列表为空，无法补充数据")
             return False
 
-        # 获取所有股票代码
+        # 获取所有股票代码（只保留该日期已上市的股票）
+        if 'list_date' in stock_list.columns:
+            stock_list = stock_list[stock_list['list_date'].astype(str) <= trade_date]
         all_ts_codes = stock_list['ts_code'].tolist()
 
         # 过滤出需要获取的股票代码
-        ts_codes_to_fetch = [code for code in all_ts_codes if code not in existing_symbols]
+        existing_symbol_set = set(existing_symbols)
+        ts_codes_to_fetch = [code for code in all_ts_codes if code not in existing_symbol_set]
 
         if not ts_codes_to_fetch:
             logger.warning(f"日期 {trade_date} 已有所有股票的数据，但数据不完整，可能是由于股票数量变化")
@@ -760,7 +833,8 @@ class DataFetcher:
 
         return success
 
-    def check_and_complete_date_range(self, start_date: str = None, end_date: str = None, expected_count: int = None, batch_size: int = 100) -> bool:
+    def check_and_complete_date_range(self, start_date: str = None, end_date: str = None, expected_count: int = None,
+                                      batch_size: int = 100, use_listed_universe: bool = False) -> bool:
         """
         检查并补充指定日期范围内的不完整数据
 
@@ -769,15 +843,20 @@ class DataFetcher:
             end_date (str, optional): 结束日期，格式为'YYYYMMDD'. 默认为None，表示最新日期.
             expected_count (int, optional): 预期的股票数量. 默认为None，表示使用系统中最大的股票数量.
             batch_size (int, optional): 批量获取的股票数量. 默认为100.
+            use_listed_universe (bool, optional): 是否以当日处于上市状态的股票数量作为预期数量. 默认为False.
 
         Returns:
             bool: 是否成功补充数据
         """
         logger.info(f"检查并补充日期范围 {start_date or '最早'} - {end_date or '最新'} 的数据")
 
-        # 获取不完整的日期列表
-        from clickhouse_handler import clickhouse_handler
-        incomplete_dates = clickhouse_handler.get_incomplete_dates(start_date, end_date, expected_count)
+        # 获取不完整的日期列表（一次分组查询）
+        from clickhouse_handler import clickhouse_handler, is_date_complete
+        completeness = clickhouse_handler.get_date_completeness(
+            start_date, end_date, expected_count,
+            expected_count_func=self.get_listed_counts if use_listed_universe else None
+        )
+        incomplete_dates = [date for date, counts in completeness.items() if not is_date_complete(*counts)]
 
         if not incomplete_dates:
             logger.info("所有日期的数据都已完整，无需补充")
@@ -785,10 +864,10 @@ class DataFetcher:
 
         logger.info(f"共有 {len(incomplete_dates)} 个日期的数据不完整: {incomplete_dates}")
 
-        # 补充每个不完整日期的数据
+        # 补充每个不完整日期的数据（传入该日期的预期数量，避免重复统计全表）
         success = True
         for date in incomplete_dates:
-            if not self.check_and_complete_date_data(date, expected_count, batch_size):
+            if not self.check_and_complete_date_data(date, completeness[date][1], batch_size):
                 success = False
 
         return success
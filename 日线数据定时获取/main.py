@@ -94,6 +94,14 @@ def parse_args():
     complete_parser.add_argument('--start', type=str, help='开始日期，格式为YYYYMMDD')
     complete_parser.add_argument('--end', type=str, help='结束日期，格式为YYYYMMDD')
     complete_parser.add_argument('--batch-size', type=int, default=100, help='批量获取的股票数量，默认为100')
+    complete_parser.add_argument('--universe', action='store_true',
+                                 help='以每日处于上市状态的股票数量（stock_basic上市/退市日期）作为预期数量')
+
+    # 迁移表结构命令
+    migrate_parser = subparsers.add_parser('migrate', help='将日线表迁移到v2表结构（压缩编码+按月分区）')
+    migrate_parser.add_argument('--drop-old', action='store_true', help='迁移完成后删除v1备份表')
+    migrate_parser.add_argument('--cross-section', action='store_true',
+                                help='只回填按 (frame, symbol) 排序的截面副本表，不迁移表结构')
 
     return parser.parse_args()
 
@@ -335,6 +343,51 @@ def show_clickhouse_data_range():
         logger.error(f"显示ClickHouse数据范围失败: {e}")
 
 
+def migrate_schema(drop_old=False):
+    """
+    迁移日线表结构到v2
+
+    Args:
+        drop_old (bool, optional): 迁移完成后是否删除v1备份表. 默认为False.
+    """
+    logger.info("开始迁移日线表结构到v2")
+
+    try:
+        before = clickhouse_handler.get_storage_info()
+        result = clickhouse_handler.migrate_to_v2(drop_old=drop_old)
+
+        if result['status'] != 'migrated':
+            logger.info("日线表无需迁移")
+            return
+
+        after = clickhouse_handler.get_storage_info()
+        logger.info("=" * 50)
+        logger.info(f"迁移完成: {result['months']} 个月分区，共 {result['rows']} 条数据")
+        logger.info(f"磁盘占用: {before['bytes_on_disk'] / 1024 / 1024:.2f}MB -> {after['bytes_on_disk'] / 1024 / 1024:.2f}MB")
+        if result['backup_table']:
+            logger.info(f"原表已保留为 {result['backup_table']}")
+        logger.info("请将 config.yaml 中 clickhouse.schema_version 修改为 v2")
+        logger.info("=" * 50)
+
+    except Exception as e:
+        logger.error(f"迁移日线表结构失败: {e}")
+
+
+def build_cross_section():
+    """
+    回填截面副本表
+    """
+    logger.info("开始回填截面副本表")
+
+    try:
+        result = clickhouse_handler.build_cross_section_table()
+        logger.info(f"截面副本表回填完成: {result['months']} 个月分区，共 {result['rows']} 条数据")
+        logger.info("请将 config.yaml 中 clickhouse.cross_section 设置为 true")
+
+    except Exception as e:
+        logger.error(f"回填截面副本表失败: {e}")
+
+
 def main():
     """主函数"""
     args = parse_args()
@@ -400,17 +453,25 @@ def main():
             data_fetcher.check_and_complete_date_range(
                 start_date=args.start,
                 end_date=args.end,
-                batch_size=args.batch_size
+                batch_size=args.batch_size,
+                use_listed_universe=args.universe
             )
         else:
             # 补充所有不完整的数据
             data_fetcher.check_and_complete_date_range(
-                batch_size=args.batch_size
+                batch_size=args.batch_size,
+                use_listed_universe=args.universe
             )
 
         # 显示ClickHouse中的数据信息
         show_clickhouse_data_range()
 
+    elif args.command == 'migrate':
+        if args.cross_section:
+            build_cross_section()
+        else:
+            migrate_schema(drop_old=args.drop_old)
+
     else:
         logger.info("请指定命令，使用 -h 查看帮助")
 
@@ -4,6 +4,7 @@
 ClickHouse处理模块单元测试
 """
 
+import datetime
 import unittest
 import pandas as pd
 from unittest.mock import patch, MagicMock
@@ -13,6 +14,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from clickhouse_handler import ClickHouseHandler
+from config import Clickhouse
 from exceptions import ClickHouseConnectionError, ClickHouseOperationError
 
 
@@ -21,15 +23,15 @@ class TestClickHouseHandler(unittest.TestCase):
     
     def setUp(self):
         """测试前的准备工作"""
-        # 使用测试配置
-        self.test_config = {
-            'host': 'localhost',
-            'port': 9000,
-            'user': 'default',
-            'password': '',
-            'database': 'test_db',
-            'table': 'test_table'
-        }
+        # 使用测试配置（与配置文件解析结果相同的模型对象）
+        self.test_config = Clickhouse(
+            host='localhost',
+            port=9000,
+            user='default',
+            password='',
+            database='test_db',
+            table='test_table'
+        )
         
         # 创建ClickHouse处理器实例
         with patch('clickhouse_handler.Client') as mock_client_class:
@@ -49,11 +51,11 @@ class TestClickHouseHandler(unittest.TestCase):
             
             # 验证Client被正确创建
             mock_client_class.assert_called_once_with(
-                host=self.test_config['host'],
-                port=self.test_config['port'],
-                user=self.test_config['user'],
-                password=self.test_config['password'],
-                database=self.test_config['database']
+                host=self.test_config.host,
+                port=self.test_config.port,
+                user=self.test_config.user,
+                password=self.test_config.password,
+                database=self.test_config.database
             )
             
             # 验证execute方法被调用
@@ -84,7 +86,8 @@ class TestClickHouseHandler(unittest.TestCase):
     
     def test_ensure_database_exists_create_new(self):
         """测试确保数据库存在（需要创建）"""
-        # 模拟数据库不存在
+        # 模拟数据库不存在（只统计本次调用，不含初始化时的查询）
+        self.mock_client.execute.reset_mock()
         self.mock_client.execute.side_effect = [[], None]
         
         # 调用方法
@@ -150,6 +153,229 @@ class TestClickHouseHandler(unittest.TestCase):
         # 验证execute方法被调用
         self.mock_client.execute.assert_called()
     
+    def test_migrate_to_v2_skip_when_already_v2(self):
+        """测试迁移表结构（已是v2结构）"""
+        # 模拟symbol列已是LowCardinality类型
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = lambda sql, *args: (
+            [('LowCardinality(String)',)] if 'system.columns' in sql else [[1]]
+        )
+
+        result = self.clickhouse_handler.migrate_to_v2()
+
+        # 验证没有执行复制和重命名
+        self.assertEqual(result['status'], 'skipped')
+        executed = [call[0][0] for call in self.mock_client.execute.call_args_list]
+        self.assertFalse(any(sql.startswith('RENAME TABLE') for sql in executed))
+
+    def test_migrate_to_v2_by_partition(self):
+        """测试按月分区迁移表结构"""
+        def execute(sql, *args):
+            if 'system.columns' in sql:
+                return [('String',)]
+            if 'DISTINCT toYYYYMM' in sql:
+                return [(202401,), (202402,)]
+            if 'GROUP BY month' in sql:
+                return [(202401, 100), (202402, 100)]
+            if sql.startswith('SELECT uniqExact') or sql.startswith('SELECT count()'):
+                return [(100,)]
+            return [[1]]
+
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = execute
+
+        result = self.clickhouse_handler.migrate_to_v2()
+
+        # 验证每个月分区各复制一次，复制后没有新数据，不需要追赶，最后替换原表
+        self.assertEqual(result['status'], 'migrated')
+        self.assertEqual(result['months'], 2)
+        self.assertEqual(result['rows'], 200)
+        executed = [call[0][0] for call in self.mock_client.execute.call_args_list]
+        self.assertEqual(len([sql for sql in executed if sql.startswith('INSERT INTO')]), 2)
+        self.assertTrue(executed[-1].startswith('RENAME TABLE'))
+
+    def test_migrate_to_v2_catch_up(self):
+        """测试迁移替换前重新复制复制后有新写入的分区"""
+        def execute(sql, *args):
+            if 'system.columns' in sql:
+                return [('String',)]
+            if 'DISTINCT toYYYYMM' in sql:
+                return [(202401,), (202402,)]
+            if 'GROUP BY month' in sql:
+                # 复制期间202402写入了新数据，并出现了新的分区202403
+                return [(202401, 100), (202402, 110), (202403, 10)]
+            if sql.startswith('SELECT uniqExact') or sql.startswith('SELECT count()'):
+                return [(100,)]
+            return [[1]]
+
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = execute
+
+        result = self.clickhouse_handler.migrate_to_v2()
+
+        executed = [call[0][0] for call in self.mock_client.execute.call_args_list]
+        inserts = [sql for sql in executed if sql.startswith('INSERT INTO')]
+        rename_index = next(i for i, sql in enumerate(executed) if sql.startswith('RENAME TABLE'))
+        last_insert_index = max(i for i, sql in enumerate(executed) if sql.startswith('INSERT INTO'))
+
+        # 两个分区首次复制，追赶时202402重新复制、202403首次复制，都在替换之前
+        self.assertEqual(len(inserts), 4)
+        self.assertIn('= 202402', inserts[2])
+        self.assertIn('= 202403', inserts[3])
+        self.assertLess(last_insert_index, rename_index)
+        self.assertEqual(result['months'], 3)
+        self.assertEqual(result['rows'], 300)
+
+    def test_migrate_to_v2_count_mismatch(self):
+        """测试迁移表结构（行数校验失败）"""
+        counts = iter([(100,), (99,)])
+
+        def execute(sql, *args):
+            if 'system.columns' in sql:
+                return [('String',)]
+            if 'DISTINCT toYYYYMM' in sql:
+                return [(202401,)]
+            if sql.startswith('SELECT uniqExact') or 'FINAL' in sql:
+                return [next(counts)]
+            if sql.startswith('SELECT count()'):
+                return [(100,)]
+            return [[1]]
+
+        self.mock_client.execute.side_effect = execute
+
+        # 行数不一致时应该抛出异常，且不替换原表
+        with self.assertRaises(ClickHouseOperationError):
+            self.clickhouse_handler.migrate_to_v2()
+        executed = [call[0][0] for call in self.mock_client.execute.call_args_list]
+        self.assertFalse(any(sql.startswith('RENAME TABLE') for sql in executed))
+
+    def test_insert_data_v2_dedup_token(self):
+        """测试v2表按交易日分组插入并携带去重令牌"""
+        self.clickhouse_handler.schema_version = 'v2'
+        self.mock_client.execute.reset_mock()
+
+        test_df = pd.DataFrame({
+            'symbol': ['000001.SZ', '000002.SZ', '000001.SZ'],
+            'frame': ['2023-01-03', '2023-01-03', '2023-01-04'],
+            'close': [10.5, 20.5, 10.6]
+        })
+
+        # 同一批数据插入两次，再插入一次价格有修正的数据
+        self.clickhouse_handler.insert_data(test_df.copy())
+        self.clickhouse_handler.insert_data(test_df.copy())
+        corrected_df = test_df.copy()
+        corrected_df.loc[0, 'close'] = 10.55
+        self.clickhouse_handler.insert_data(corrected_df)
+
+        insert_calls = [call for call in self.mock_client.execute.call_args_list
+                        if call[0][0].startswith('INSERT INTO')]
+        tokens = [call[1]['settings']['insert_deduplication_token'] for call in insert_calls]
+
+        # 每次插入按两个交易日分成两组，令牌包含表名和交易日，重复插入的令牌相同
+        self.assertEqual(len(insert_calls), 6)
+        self.assertTrue(tokens[0].startswith('test_table:2023-01-03:'))
+        self.assertTrue(tokens[1].startswith('test_table:2023-01-04:'))
+        self.assertEqual(tokens[:2], tokens[2:4])
+        self.assertNotEqual(tokens[0], tokens[1])
+
+        # 修正过的交易日令牌变化，未修正的交易日令牌不变
+        self.assertNotEqual(tokens[4], tokens[0])
+        self.assertEqual(tokens[5], tokens[1])
+
+        # 同一次插入的所有行使用同一个version，后一次插入的version不小于前一次
+        versions = [{record['version'] for record in call[0][1]} for call in insert_calls]
+        self.assertEqual(versions[0], versions[1])
+        self.assertEqual(len(versions[0]), 1)
+        self.assertIsInstance(next(iter(versions[0])), int)
+        self.assertGreaterEqual(min(versions[4]), max(versions[0]))
+
+    def test_get_incomplete_dates_single_query(self):
+        """测试按日期范围分组查询获取不完整日期"""
+        def execute(sql, *args):
+            if 'max(c)' in sql:
+                return [(5000,)]
+            if 'GROUP BY frame' in sql:
+                return [
+                    (datetime.date(2024, 1, 2), 4995),
+                    (datetime.date(2024, 1, 3), 4000),
+                    (datetime.date(2024, 1, 4), 4990)
+                ]
+            return [[1]]
+
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = execute
+
+        result = self.clickhouse_handler.get_incomplete_dates('20240102', '20240104')
+
+        # 预期数量为全表单日最大股票数量5000，20240103完整度80%
+        self.assertEqual(result, ['20240103'])
+        calls = [call[0] for call in self.mock_client.execute.call_args_list]
+        range_calls = [call for call in calls if 'GROUP BY frame' in call[0] and 'max(c)' not in call[0]]
+        self.assertEqual(len(range_calls), 1)
+
+        # 日期范围在查询条件中过滤
+        sql, params = range_calls[0]
+        self.assertIn('frame >= %(start_date)s AND frame <= %(end_date)s', sql)
+        self.assertEqual(params, {'start_date': datetime.date(2024, 1, 2), 'end_date': datetime.date(2024, 1, 4)})
+
+    def test_get_date_completeness_expected_count_func(self):
+        """测试按日期计算预期数量"""
+        def execute(sql, *args):
+            if 'GROUP BY frame' in sql:
+                rows = [(datetime.date(2024, 1, 2), 5000), (datetime.date(2024, 1, 3), 4000)]
+                return [row for row in rows if row[0] >= args[0]['start_date']]
+            return [[1]]
+
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = execute
+
+        result = self.clickhouse_handler.get_date_completeness(
+            '20240103', None,
+            expected_count_func=lambda dates: {date: 4100 for date in dates}
+        )
+
+        # 只返回范围内的日期，预期数量使用函数结果，不再查询全表最大股票数量
+        self.assertEqual(result, {'20240103': (4000, 4100)})
+        executed = [call[0][0] for call in self.mock_client.execute.call_args_list]
+        self.assertFalse(any('max(c)' in sql for sql in executed))
+
+    def test_cross_section_uses_frame_table(self):
+        """测试开启截面副本表后按日期查询读取副本表"""
+        self.clickhouse_handler.cross_section = True
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = lambda sql, *args, **kwargs: (
+            [('000001.SZ',), ('000002.SZ',)] if 'DISTINCT symbol' in sql else [[1]]
+        )
+
+        symbols = self.clickhouse_handler.get_existing_symbols_for_date('20240102')
+
+        self.assertEqual(symbols, ['000001.SZ', '000002.SZ'])
+        executed = [call[0][0] for call in self.mock_client.execute.call_args_list]
+        self.assertTrue(any('test_table_by_frame' in sql for sql in executed if 'DISTINCT symbol' in sql))
+
+    def test_get_bars_adjust(self):
+        """测试复权查询在ClickHouse中计算复权价格"""
+        self.mock_client.execute.reset_mock()
+        self.mock_client.execute.side_effect = lambda sql, *args, **kwargs: [] if 'o * f' in sql else [[1]]
+
+        self.clickhouse_handler.get_bars('20240102', '20240131', ['000001.SZ'], adjust='qfq')
+        self.clickhouse_handler.get_bars('20240102', '20240131', adjust='hfq')
+
+        queries = [call for call in self.mock_client.execute.call_args_list if 'o * f' in call[0][0]]
+        qfq_sql, qfq_params = queries[0][0][0], queries[0][0][1]
+        hfq_sql = queries[1][0][0]
+
+        # 前复权按股票最新复权因子JOIN，后复权直接乘以复权因子
+        self.assertIn('adjust / latest_adjust AS f', qfq_sql)
+        self.assertIn('argMax(adjust, frame)', qfq_sql)
+        self.assertEqual(qfq_params['symbols'], ('000001.SZ',))
+        self.assertIn('adjust AS f', hfq_sql)
+        self.assertNotIn('JOIN', hfq_sql)
+        self.assertNotIn('symbol IN', hfq_sql)
+
+        with self.assertRaises(ValueError):
+            self.clickhouse_handler.get_bars('20240102', '20240131', adjust='xfq')
+
     def test_close(self):
         """测试关闭ClickHouse连接"""
         # 关闭连接
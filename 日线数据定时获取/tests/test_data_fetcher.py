@@ -84,6 +84,29 @@ class TestDataFetcher(unittest.TestCase):
         self.assertEqual(len(result), 2)
         self.assertEqual(result.iloc[0]['name'], '平安银行')
     
+    @patch('data_fetcher.DataFetcher._call_tushare_api')
+    def test_get_listed_counts(self, mock_call_api):
+        """测试按上市/退市日期统计每日上市股票数量"""
+        # 模拟上市、退市、暂停上市三次API返回结果
+        mock_call_api.side_effect = [
+            pd.DataFrame({
+                'ts_code': ['000001.SZ', '000002.SZ', '688001.SH'],
+                'list_date': ['19910403', '19910129', '20190722'],
+                'delist_date': [None, None, None]
+            }),
+            pd.DataFrame({
+                'ts_code': ['000003.SZ'],
+                'list_date': ['19910114'],
+                'delist_date': ['20020614']
+            }),
+            pd.DataFrame()
+        ]
+
+        result = self.data_fetcher.get_listed_counts(['20000104', '20100104', '20200102'])
+
+        # 验证结果
+        self.assertEqual(result, {'20000104': 3, '20100104': 2, '20200102': 3})
+
     @patch('data_fetcher.DataFetcher._call_tushare_api')
     def test_get_daily_data(self, mock_call_api):
         """测试获取日线数据"""